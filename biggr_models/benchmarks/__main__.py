@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark the query functions on synthetic databases of several sizes.
+
+``python -m biggr_models.benchmarks --scales 0.5 1 4 --output before.json``
+generates a dataset for every scale factor (in a temporary SQLite database,
+or at ``--database``, which must not hold real data unless
+``--drop-existing`` is given), and writes the timings as JSON. The base
+size is picked with ``--profile`` and adjusted with ``--models`` and
+``--annotations``. ``python -m biggr_models.benchmarks --compare before.json
+after.json`` lists the benchmarks that became slower or faster, it exits with
+status 1 if any became slower.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional
+
+# Ratio of the cold medians above which a benchmark counts as slower
+REGRESSION_THRESHOLD = 1.25
+# Benchmarks faster than this are dominated by noise and not compared
+MIN_COMPARED_MS = 1.0
+
+
+def run_all(
+    scales: List[float],
+    size: Any = None,
+    database: Optional[str] = None,
+    repeat: int = 5,
+    only: List[str] = (),
+    seed: int = 0,
+    drop_existing: bool = False,
+) -> Dict[str, Any]:
+    # imported here, so --compare also works without cobradb installed, size
+    # is a DatasetSize (the default profile if None)
+    from biggr_models.benchmarks import suite
+    from biggr_models.benchmarks.dataset import DatasetSize
+
+    result = {
+        "commit": suite.git_commit(),
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "database": "postgresql" if database else "sqlite",
+        "repeat": repeat,
+        "scales": {},
+        "skipped": suite.skipped_functions(),
+    }
+    with tempfile.TemporaryDirectory(prefix="biggr_benchmark_db_") as directory:
+        for scale in scales:
+            url = database or "sqlite:///" + os.path.join(directory, f"{scale}.db")
+            result["scales"][str(scale)] = suite.run_scale(
+                url,
+                scale,
+                size or DatasetSize(),
+                repeat=repeat,
+                only=only,
+                seed=seed,
+                drop_existing=drop_existing,
+            )
+    if result["skipped"]:
+        print("Query functions without benchmark: " + ", ".join(result["skipped"]))
+    return result
+
+
+def compare(
+    old: Dict[str, Any], new: Dict[str, Any], threshold: float = REGRESSION_THRESHOLD
+) -> List[str]:
+    """Print the differences of the cold medians, return the slower benchmarks."""
+    print(f"Comparing {old.get('commit')} to {new.get('commit')}")
+    slower = []
+    for scale, new_scale in new["scales"].items():
+        old_scale = old["scales"].get(scale)
+        if old_scale is None:
+            continue
+        for name, new_result in sorted(new_scale["results"].items()):
+            old_result = old_scale["results"].get(name)
+            if old_result is None:
+                continue
+            if "error" in new_result or "error" in old_result:
+                if "error" in new_result and "error" not in old_result:
+                    print(f"scale {scale} {name}: fails now, {new_result['error']}")
+                    slower.append(f"{scale}:{name}")
+                continue
+            old_ms = old_result["cold"]["median_ms"]
+            new_ms = new_result["cold"]["median_ms"]
+            if max(old_ms, new_ms) < MIN_COMPARED_MS:
+                continue
+            ratio = new_ms / old_ms if old_ms else float("inf")
+            if ratio > threshold:
+                label = "slower"
+                slower.append(f"{scale}:{name}")
+            elif ratio < 1 / threshold:
+                label = "faster"
+            else:
+                continue
+            print(
+                f"scale {scale} {name}: {label}, "
+                f"{old_ms:.1f} ms -> {new_ms:.1f} ms ({ratio:.2f}x)"
+            )
+    if not slower:
+        print("No benchmark became slower")
+    return slower
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scales",
+        type=float,
+        nargs="+",
+        default=[0.5, 1.0, 4.0],
+        help="Dataset scale factors, 1 is the size of --profile.",
+    )
+    parser.add_argument(
+        "--profile",
+        default="default",
+        help="Base dataset size that is scaled, see dataset.PROFILES.",
+    )
+    parser.add_argument(
+        "--models",
+        type=int,
+        help="Number of models at scale 1, overrides the profile.",
+    )
+    parser.add_argument(
+        "--annotations",
+        type=int,
+        help="Annotations of each metabolite and reaction, overrides the profile.",
+    )
+    parser.add_argument(
+        "--database",
+        help="SQLAlchemy URL of a PostgreSQL database, its cobradb tables are "
+        "dropped if they only hold generated models. A temporary SQLite database "
+        "is used by default.",
+    )
+    parser.add_argument(
+        "--drop-existing",
+        action="store_true",
+        help="Drop the cobradb tables of --database even if they hold real data.",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Timed calls per benchmark."
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        default=[],
+        help="Only run benchmarks whose name contains one of these strings.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        help="Compare two result files instead of running the benchmarks.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="Slowdown ratio reported as regression by --compare.",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        sys.exit(1 if compare(old, new, threshold=args.threshold) else 0)
+
+    from biggr_models.benchmarks.dataset import dataset_size
+
+    try:
+        size = dataset_size(args.profile, args.models, args.annotations)
+    except ValueError as e:
+        parser.error(str(e))
+    result = run_all(
+        args.scales,
+        size=size,
+        database=args.database,
+        repeat=args.repeat,
+        only=args.only,
+        seed=args.seed,
+        drop_existing=args.drop_existing,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,741 @@
+"""Synthetic databases in the cobradb schema for the query benchmarks.
+
+``create_database`` fills a database (SQLite or PostgreSQL) with a generated
+dataset of configurable size. Only the columns read by ``biggr_models.queries``
+get meaningful values. Other required columns are filled with placeholders, and
+attributes missing from the installed cobradb version are skipped, so the
+generator keeps working when the schema gains columns.
+"""
+
+from dataclasses import dataclass, field, replace
+import datetime
+from itertools import cycle
+import os
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+from cobradb import models as db
+from cobradb.api.escher import ESCHER_MODULE_DEFINITIONS
+from sqlalchemy import (
+    Boolean,
+    Date,
+    DateTime,
+    Enum,
+    Float,
+    Integer,
+    Numeric,
+    String,
+    Text,
+    create_engine,
+    inspect,
+)
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from biggr_models.queries.memote_queries import METABOLITE_TESTS, REACTION_TESTS
+from biggr_models.queries.model_file_queries import MODEL_FILE_EXTENSIONS
+
+# bigg_id prefix of the generated models, see create_database
+SYNTHETIC_MODEL_PREFIX = "iSYN"
+COMPARTMENTS = (("c", "cytosol"), ("e", "extracellular space"), ("p", "periplasm"))
+TAXONOMIC_RANKS = (
+    "superkingdom",
+    "phylum",
+    "class",
+    "order",
+    "family",
+    "genus",
+    "species",
+)
+GENERAL_MEMOTE_TESTS = (
+    "test_stoichiometric_consistency",
+    "test_gene_protein_reaction_rule_presence",
+    "test_metabolite_annotation_presence",
+)
+ANNOTATION_SOURCES = (
+    ("chebi", "CHEBI", "https://identifiers.org/CHEBI:"),
+    ("seed", "SEED", "https://identifiers.org/seed.compound:"),
+    ("rhea", "RHEA", "https://identifiers.org/rhea:"),
+)
+SUBSYSTEMS = (
+    "Glycolysis/Gluconeogenesis",
+    "Citric Acid Cycle",
+    "Pentose Phosphate Pathway",
+    "Transport, Outer Membrane",
+    "Amino Acid Metabolism",
+)
+
+
+@dataclass
+class DatasetSize:
+    """Number of generated objects, see ``scaled`` for the scale factors."""
+
+    models: int = 4
+    # universal metabolites, each in two or three compartments
+    metabolites: int = 200
+    # universal reactions
+    reactions: int = 300
+    # genes of each genome, every model has its own genome
+    genes: int = 150
+    # fraction of the universal reactions that are part of each model
+    model_reaction_fraction: float = 0.6
+    # annotations of each metabolite and reaction
+    annotations: int = 2
+    # fraction of the model's reactions and metabolites flagged by a MEMOTE test
+    memote_flagged_fraction: float = 0.05
+    escher_modules: int = 5
+    # model reactions of each model on each Escher map
+    map_reactions: int = 20
+
+    def scaled(self, factor: float) -> "DatasetSize":
+        """Return the size with the entity counts multiplied by factor.
+
+        The per-entity counts (annotations and map reactions) are kept, they
+        are set by the profile or overridden on the command line.
+        """
+        return replace(
+            self,
+            models=max(1, round(self.models * factor)),
+            metabolites=max(4, round(self.metabolites * factor)),
+            reactions=max(2, round(self.reactions * factor)),
+            genes=max(1, round(self.genes * factor)),
+        )
+
+
+# Named base sizes of the benchmark CLIs, each is multiplied by the scale factors
+PROFILES: Dict[str, DatasetSize] = {
+    "default": DatasetSize(),
+    # hundreds of annotations per metabolite and reaction, as merged by the
+    # AnnotationAggregator of the detail pages
+    "annotations": DatasetSize(metabolites=50, reactions=80, annotations=300),
+    # one genome-scale model the size of iML1515 (about 2700 reactions and 1900
+    # metabolites) with all of its reactions on every Escher map
+    "large_map": DatasetSize(
+        models=1,
+        metabolites=850,
+        reactions=2700,
+        genes=1500,
+        model_reaction_fraction=1.0,
+        map_reactions=2700,
+    ),
+    # thousands of small models, for the model, collection and taxonomy lists
+    "many_models": DatasetSize(
+        models=2000,
+        metabolites=20,
+        reactions=30,
+        genes=10,
+        escher_modules=1,
+        map_reactions=5,
+    ),
+}
+
+
+def dataset_size(
+    profile: str = "default",
+    models: Optional[int] = None,
+    annotations: Optional[int] = None,
+) -> DatasetSize:
+    """Return the size of a profile with the given counts overridden.
+
+    Raises
+    ------
+    ValueError
+        If there is no profile of that name.
+    """
+    if profile not in PROFILES:
+        raise ValueError(
+            f"Unknown profile {profile!r}, choose one of {', '.join(PROFILES)}"
+        )
+    overrides = {"models": models, "annotations": annotations}
+    return replace(
+        PROFILES[profile], **{k: v for k, v in overrides.items() if v is not None}
+    )
+
+
+@dataclass
+class Dataset:
+    """Identifiers of the generated objects, used as arguments of the queries."""
+
+    size: DatasetSize
+    model_bigg_ids: List[str] = field(default_factory=list)
+    model_ids: List[int] = field(default_factory=list)
+    genome_ids: List[int] = field(default_factory=list)
+    genome_ref_strings: List[str] = field(default_factory=list)
+    # (accession_type, accession_value, gene bigg_id)
+    genes: List[Tuple[str, str, str]] = field(default_factory=list)
+    gene_ids: List[int] = field(default_factory=list)
+    taxon_ids: List[int] = field(default_factory=list)
+    taxon_names: List[str] = field(default_factory=list)
+    compartment_bigg_ids: List[str] = field(default_factory=list)
+    universal_metabolite_bigg_ids: List[str] = field(default_factory=list)
+    component_ids: List[int] = field(default_factory=list)
+    compartmentalized_component_bigg_ids: List[str] = field(default_factory=list)
+    universal_reaction_bigg_ids: List[str] = field(default_factory=list)
+    universal_reaction_ids: List[int] = field(default_factory=list)
+    reaction_ids: List[int] = field(default_factory=list)
+    # (model bigg_id, reaction bigg_id, model reaction id)
+    model_reactions: List[Tuple[str, str, int]] = field(default_factory=list)
+    # (model bigg_id, compartmentalized component bigg_id, id)
+    model_metabolites: List[Tuple[str, str, int]] = field(default_factory=list)
+    # (model bigg_id, gene bigg_id, model gene id)
+    model_genes: List[Tuple[str, str, int]] = field(default_factory=list)
+    # (model bigg_id, escher module bigg_id)
+    escher_maps: List[Tuple[str, str]] = field(default_factory=list)
+
+
+def _placeholder(column, index: int) -> Any:
+    column_type = column.type
+    if isinstance(column_type, Enum) and column_type.enums:
+        return column_type.enums[0]
+    if isinstance(column_type, Boolean):
+        return False
+    if isinstance(column_type, Integer):
+        return 0
+    if isinstance(column_type, (Float, Numeric)):
+        return 0.0
+    if isinstance(column_type, DateTime):
+        return datetime.datetime(2000, 1, 1)
+    if isinstance(column_type, Date):
+        return datetime.date(2000, 1, 1)
+    if isinstance(column_type, (String, Text)):
+        return f"{column.name}_{index}"
+    return None
+
+
+def _coerce(column, value: Any) -> Any:
+    """Convert a generated value to the type of column, e.g. a MEMOTE result."""
+    column_type = column.type
+    if value is None or isinstance(column_type, Enum):
+        return value
+    if isinstance(column_type, Boolean):
+        return bool(value)
+    if isinstance(column_type, (Float, Numeric)) and isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(column_type, (String, Text)) and not isinstance(value, str):
+        return str(value)
+    return value
+
+
+def _related_class(cls, relationship: str):
+    return inspect(cls).relationships[relationship].mapper.class_
+
+
+class _Builder:
+    def __init__(self, session: Session):
+        self.session = session
+        self.count = 0
+
+    def make(self, cls, **attrs):
+        """Add a new cls object with attrs, required columns get placeholders."""
+        mapper = inspect(cls)
+        obj = cls()
+        self.count += 1
+        for key, value in attrs.items():
+            if key not in mapper.attrs:
+                continue
+            prop = mapper.attrs[key]
+            if hasattr(prop, "columns"):
+                value = _coerce(prop.columns[0], value)
+            setattr(obj, key, value)
+        for column in mapper.columns:
+            if (
+                column.primary_key
+                or column.nullable
+                or column.foreign_keys
+                or column.default is not None
+                or column.server_default is not None
+            ):
+                continue
+            key = mapper.get_property_by_column(column).key
+            if key in attrs:
+                continue
+            value = _placeholder(column, self.count)
+            if value is not None:
+                setattr(obj, key, value)
+        self.session.add(obj)
+        return obj
+
+
+def _add_taxonomy(b: _Builder, size: DatasetSize, dataset: Dataset) -> List[Any]:
+    """Add a binary taxonomy tree, return the species taxon of each model."""
+    depth = len(TAXONOMIC_RANKS)
+    taxa: Dict[Tuple[int, int], Any] = {}
+    for level, rank_name in enumerate(TAXONOMIC_RANKS):
+        rank = b.make(db.TaxonomicRank, name=rank_name)
+        # models i and j share the taxon of this level if i and j only differ
+        # in the lowest depth - 1 - level bits
+        for index in sorted({i >> (depth - 1 - level) for i in range(size.models)}):
+            parent = taxa.get((level - 1, index >> 1))
+            taxa[level, index] = b.make(
+                db.Taxon,
+                name=f"{rank_name.capitalize()} {index}",
+                rank=rank,
+                parent_id=parent.id if parent is not None else None,
+            )
+        b.session.flush()
+        for index in sorted(k for l, k in taxa if l == level):
+            dataset.taxon_ids.append(taxa[level, index].id)
+            dataset.taxon_names.append(taxa[level, index].name)
+    return [taxa[depth - 1, i] for i in range(size.models)]
+
+
+def _add_genome(b: _Builder, rng: random.Random, i: int, taxon, size: DatasetSize):
+    genome = b.make(
+        db.Genome,
+        accession_type="ncbi_assembly",
+        accession_value=f"GCF_{i:09d}.1",
+        organism=f"Synthetica organismus {i}",
+        strain=f"strain {i}",
+        taxon_id=taxon.id,
+    )
+    chromosome = b.make(db.Chromosome, genome=genome, ncbi_accession=f"NC_{i:06d}.1")
+    genes = []
+    position = 1
+    for j in range(size.genes):
+        length = rng.randrange(300, 3000, 3)
+        genes.append(
+            b.make(
+                db.Gene,
+                chromosome=chromosome,
+                bigg_id=f"b{j:04d}",
+                name=f"gen{j}",
+                locus_tag=f"SYN{i}_{j:05d}",
+                leftpos=position,
+                rightpos=position + length - 1,
+                strand=rng.choice("+-"),
+                mapped_to_genbank=True,
+                dna_sequence="".join(rng.choice("ACGT") for _ in range(length)),
+                protein_sequence="M"
+                + "".join(
+                    rng.choice("ACDEFGHIKLMNPQRSTVWY") for _ in range(length // 3 - 1)
+                ),
+            )
+        )
+        position += length + rng.randrange(50, 500)
+    return genome, genes
+
+
+def _add_annotations(b: _Builder, rng: random.Random, size: DatasetSize):
+    """Return a function that adds annotations to a component or reaction."""
+    data_source_cls = _related_class(db.AnnotationLink, "data_source")
+    property_cls = _related_class(db.Annotation, "properties")
+    data_sources = [
+        (prefix, b.make(data_source_cls, bigg_id=name, name=name, url_prefix=url))
+        for name, prefix, url in ANNOTATION_SOURCES
+    ]
+    b.session.flush()
+
+    def annotate(mapping_cls, target_key: str, target_id: int, name: str):
+        for _ in range(size.annotations):
+            prefix, data_source = rng.choice(data_sources)
+            identifier = str(rng.randrange(10000, 99999))
+            annotation = b.make(
+                db.Annotation,
+                bigg_id=f"{prefix}:{identifier}",
+                type=prefix.lower(),
+                default_data_source_id=data_source.id,
+                is_obsolete=rng.random() < 0.1,
+            )
+            annotation.links.append(
+                b.make(
+                    db.AnnotationLink, data_source=data_source, identifier=identifier
+                )
+            )
+            annotation.properties.append(b.make(property_cls, key="name", value=name))
+            annotation.properties.append(
+                b.make(property_cls, key="mass", value=f"{rng.uniform(10, 900):.3f}")
+            )
+            b.make(mapping_cls, annotation=annotation, **{target_key: target_id})
+
+    return annotate
+
+
+def populate(session: Session, size: DatasetSize, seed: int = 0) -> Dataset:
+    """Add a synthetic dataset of the given size to an empty database."""
+    rng = random.Random(seed)
+    b = _Builder(session)
+    dataset = Dataset(size=size)
+    b.make(db.DatabaseVersion, date_time=datetime.datetime.now())
+    annotate = _add_annotations(b, rng, size)
+
+    compartments = [
+        b.make(db.Compartment, bigg_id=bigg_id, name=name)
+        for bigg_id, name in COMPARTMENTS
+    ]
+    dataset.compartment_bigg_ids = [bigg_id for bigg_id, _ in COMPARTMENTS]
+
+    # metabolites, each in the cytosol and extracellular space, some also in
+    # the periplasm
+    comp_comps = []
+    universal_comp_comps = []
+    for k in range(size.metabolites):
+        bigg_id = f"met{k}"
+        universal = b.make(
+            db.UniversalComponent, bigg_id=bigg_id, name=f"Metabolite {k}"
+        )
+        component = b.make(
+            db.Component,
+            bigg_id=bigg_id,
+            name=f"Metabolite {k}",
+            universal_component=universal,
+            formula=f"C{rng.randint(1, 30)}H{rng.randint(1, 60)}O{rng.randint(0, 20)}",
+            charge=rng.randint(-3, 1),
+        )
+        in_compartments = compartments if k % 4 == 0 else compartments[:2]
+        for compartment in in_compartments:
+            universal_comp_comp = b.make(
+                db.UniversalCompartmentalizedComponent,
+                bigg_id=f"{bigg_id}_{compartment.bigg_id}",
+                universal_component=universal,
+                compartment=compartment,
+            )
+            comp_comps.append(
+                b.make(
+                    db.CompartmentalizedComponent,
+                    bigg_id=f"{bigg_id}_{compartment.bigg_id}",
+                    component=component,
+                    compartment=compartment,
+                    universal_compartmentalized_component=universal_comp_comp,
+                )
+            )
+            universal_comp_comps.append(universal_comp_comp)
+        dataset.universal_metabolite_bigg_ids.append(bigg_id)
+    session.flush()
+    for comp_comp in comp_comps:
+        if comp_comp.compartment_id == compartments[0].id:
+            annotate(
+                db.ComponentAnnotationMapping,
+                "component_id",
+                comp_comp.component_id,
+                comp_comp.component.name,
+            )
+    dataset.component_ids = sorted({c.component_id for c in comp_comps})
+    dataset.compartmentalized_component_bigg_ids = [c.bigg_id for c in comp_comps]
+
+    # reactions with two to five participants
+    reactions = []
+    for k in range(size.reactions):
+        bigg_id = f"RXN{k}"
+        participants = rng.sample(range(len(comp_comps)), rng.randint(2, 5))
+        compartment_ids = {comp_comps[p].compartment_id for p in participants}
+        universal = b.make(
+            db.UniversalReaction,
+            bigg_id=bigg_id,
+            name=f"Reaction {k}",
+            is_transport=len(compartment_ids) > 1,
+            is_exchange=False,
+            is_pseudo=False,
+        )
+        reaction = b.make(
+            db.Reaction,
+            bigg_id=bigg_id,
+            name=f"Reaction {k}",
+            universal_reaction=universal,
+        )
+        for n, p in enumerate(participants):
+            coefficient = -rng.randint(1, 2) if n < len(participants) // 2 else 1
+            universal_matrix = b.make(
+                db.UniversalReactionMatrix,
+                universal_compartmentalized_component=universal_comp_comps[p],
+                coefficient=coefficient,
+            )
+            universal.matrix.append(universal_matrix)
+            reaction.matrix.append(
+                b.make(
+                    db.ReactionMatrix,
+                    compartmentalized_component=comp_comps[p],
+                    universal_reaction_matrix=universal_matrix,
+                    coefficient=coefficient,
+                )
+            )
+        reactions.append(reaction)
+        dataset.universal_reaction_bigg_ids.append(bigg_id)
+    session.flush()
+    for reaction in reactions:
+        annotate(
+            db.ReactionAnnotationMapping, "reaction_id", reaction.id, reaction.name
+        )
+    dataset.universal_reaction_ids = [r.universal_reaction_id for r in reactions]
+    dataset.reaction_ids = [r.id for r in reactions]
+
+    escher_modules = [
+        b.make(
+            db.EscherModule,
+            bigg_id=bigg_id,
+            name=bigg_id.replace("_", " "),
+            description=f"Synthetic {bigg_id} module",
+        )
+        for bigg_id in list(ESCHER_MODULE_DEFINITIONS)[: size.escher_modules]
+    ]
+    memote_tests = {
+        bigg_id: b.make(db.MemoteTest, bigg_id=bigg_id, name=bigg_id)
+        for bigg_id in (*GENERAL_MEMOTE_TESTS, *REACTION_TESTS, *METABOLITE_TESTS)
+    }
+
+    species = _add_taxonomy(b, size, dataset)
+    collections = {}
+    for i in range(size.models):
+        # two models per collection, in the taxon of their genus
+        genus = session.get(db.Taxon, species[i].parent_id)
+        collection = collections.get(i // 2)
+        if collection is None:
+            collection = collections[i // 2] = b.make(
+                db.ModelCollection,
+                bigg_id=f"collection{i // 2}",
+                description=f"Synthetic models of {genus.name}",
+                oneliner=f"Models of {genus.name}",
+                taxon_id=genus.id,
+            )
+        genome, genes = _add_genome(b, rng, i, species[i], size)
+        model = b.make(
+            db.Model,
+            bigg_id=f"{SYNTHETIC_MODEL_PREFIX}{i}",
+            organism=genome.organism,
+            collection=collection,
+            genome=genome,
+            taxon_id=species[i].id,
+            date_modified=datetime.datetime.now(),
+        )
+        _add_model_content(
+            b, rng, size, dataset, model, genes, reactions, escher_modules, memote_tests
+        )
+        dataset.model_bigg_ids.append(model.bigg_id)
+        dataset.model_ids.append(model.id)
+        dataset.genome_ids.append(genome.id)
+        dataset.genome_ref_strings.append(
+            f"{genome.accession_type}:{genome.accession_value}"
+        )
+        dataset.genes.extend(
+            (genome.accession_type, genome.accession_value, gene.bigg_id)
+            for gene in genes
+        )
+        dataset.gene_ids.extend(gene.id for gene in genes)
+    session.flush()
+    return dataset
+
+
+def _add_model_content(
+    b: _Builder,
+    rng: random.Random,
+    size: DatasetSize,
+    dataset: Dataset,
+    model,
+    genes: List[Any],
+    reactions: List[Any],
+    escher_modules: List[Any],
+    memote_tests: Dict[str, Any],
+):
+    session = b.session
+    count = max(1, round(len(reactions) * size.model_reaction_fraction))
+    model_reactions = []
+    comp_comps = {}
+    for reaction in sorted(rng.sample(reactions, count), key=lambda r: r.id):
+        reaction_genes = rng.sample(genes, min(len(genes), rng.randint(0, 3)))
+        model_reaction = b.make(
+            db.ModelReaction,
+            model=model,
+            reaction=reaction,
+            bigg_id=reaction.bigg_id,
+            copy_number=1,
+            lower_bound=rng.choice((-1000.0, 0.0)),
+            upper_bound=1000.0,
+            subsystem=rng.choice(SUBSYSTEMS),
+            gene_reaction_rule=" or ".join(g.bigg_id for g in reaction_genes),
+        )
+        model_reactions.append((model_reaction, reaction_genes))
+        for matrix in reaction.matrix:
+            comp_comps[matrix.compartmentalized_component.id] = (
+                matrix.compartmentalized_component
+            )
+    model_metabolites = [
+        b.make(
+            db.ModelCompartmentalizedComponent,
+            model=model,
+            compartmentalized_component=comp_comp,
+            bigg_id=comp_comp.bigg_id,
+        )
+        for _, comp_comp in sorted(comp_comps.items())
+    ]
+    model_genes = {
+        gene.id: b.make(db.ModelGene, model=model, gene=gene) for gene in genes
+    }
+    session.flush()
+
+    for model_reaction, reaction_genes in model_reactions:
+        for gene in reaction_genes:
+            b.make(
+                db.GeneReactionMatrix,
+                model_gene_id=model_genes[gene.id].id,
+                model_reaction_id=model_reaction.id,
+            )
+    model.model_count = b.make(
+        db.ModelCount,
+        reaction_count=len(model_reactions),
+        metabolite_count=len(model_metabolites),
+        gene_count=len(model_genes),
+    )
+
+    for module in escher_modules:
+        for model_reaction, _ in rng.sample(
+            model_reactions, min(len(model_reactions), size.map_reactions)
+        ):
+            b.make(
+                db.ModelReactionEscherMapping,
+                escher_module=module,
+                model_reaction=model_reaction,
+            )
+        dataset.escher_maps.append((model.bigg_id, module.bigg_id))
+
+    for bigg_id, test in memote_tests.items():
+        b.make(db.MemoteResult, model=model, test=test, result=rng.random())
+        if bigg_id in REACTION_TESTS:
+            entities = [("model_reaction", mr) for mr, _ in model_reactions]
+        elif bigg_id in METABOLITE_TESTS:
+            entities = [
+                ("model_compartmentalized_component", m) for m in model_metabolites
+            ]
+        else:
+            continue
+        flagged = round(len(entities) * size.memote_flagged_fraction)
+        for key, entity in rng.sample(entities, flagged):
+            b.make(db.MemoteResult, model=model, test=test, result=1, **{key: entity})
+
+    dataset.model_reactions.extend(
+        (model.bigg_id, mr.bigg_id, mr.id) for mr, _ in model_reactions
+    )
+    dataset.model_metabolites.extend(
+        (model.bigg_id, m.bigg_id, m.id) for m in model_metabolites
+    )
+    dataset.model_genes.extend(
+        (model.bigg_id, model_gene.gene.bigg_id, model_gene.id)
+        for model_gene in model_genes.values()
+    )
+
+
+def add_metabolite(
+    session: Session, model_id: int, bigg_id: str, components: int, references: int
+):
+    """Add a universal metabolite to a model of a generated dataset.
+
+    The metabolite gets the given number of components, in the cytosol of the
+    model, and every component the given number of reference compounds. The
+    components and references are annotated with existing annotations.
+    """
+    b = _Builder(session)
+    annotations = cycle(session.query(db.Annotation).order_by(db.Annotation.id).all())
+    compartment = session.query(db.Compartment).filter_by(bigg_id="c").one()
+    universal = b.make(db.UniversalComponent, bigg_id=bigg_id, name=bigg_id)
+    for k in range(components):
+        component = b.make(
+            db.Component,
+            bigg_id=f"{bigg_id}_{k}",
+            name=f"{bigg_id} {k}",
+            universal_component=universal,
+            formula="C6H12O6",
+            charge=-k,
+        )
+        universal_comp_comp = b.make(
+            db.UniversalCompartmentalizedComponent,
+            bigg_id=f"{bigg_id}_{k}_{compartment.bigg_id}",
+            universal_component=universal,
+            compartment=compartment,
+        )
+        comp_comp = b.make(
+            db.CompartmentalizedComponent,
+            bigg_id=f"{bigg_id}_{k}_{compartment.bigg_id}",
+            component=component,
+            compartment=compartment,
+            universal_compartmentalized_component=universal_comp_comp,
+        )
+        b.make(
+            db.ModelCompartmentalizedComponent,
+            model_id=model_id,
+            compartmentalized_component=comp_comp,
+            bigg_id=comp_comp.bigg_id,
+        )
+        session.flush()
+        b.make(
+            db.ComponentAnnotationMapping,
+            annotation_id=next(annotations).id,
+            component_id=component.id,
+        )
+        for n in range(references):
+            reference = b.make(
+                db.ReferenceCompound,
+                bigg_id=f"{bigg_id}_{k}_ref{n}",
+                name=f"Reference {n} of {bigg_id}",
+                compound_type="small_molecule",
+                formula="C6H12O6",
+                charge=0,
+            )
+            mapping = b.make(
+                db.ComponentReferenceMapping,
+                reference_compound=reference,
+                reference_n=1,
+            )
+            component.reference_mappings.append(mapping)
+            session.flush()
+            b.make(
+                db.UniversalComponentReferenceMapping,
+                mapping_id=mapping.id,
+                universal_component=universal,
+            )
+            b.make(
+                db.ReferenceCompoundAnnotationMapping,
+                annotation_id=next(annotations).id,
+                reference_compound_id=reference.id,
+            )
+
+
+def write_model_files(directory: str, dataset: Dataset, byte_size: int = 4096):
+    """Write placeholder download files of all models for the model file queries."""
+    os.makedirs(directory, exist_ok=True)
+    for model_bigg_id in dataset.model_bigg_ids:
+        for extension in MODEL_FILE_EXTENSIONS:
+            with open(
+                os.path.join(directory, f"{model_bigg_id}.{extension}"), "wb"
+            ) as f:
+                f.write(b"\0" * byte_size)
+
+
+def _is_synthetic(engine) -> bool:
+    """Whether the database has no cobradb tables or only generated models."""
+    if not set(inspect(engine).get_table_names()) & set(db.Base.metadata.tables):
+        return True
+    try:
+        with Session(engine) as session:
+            bigg_ids = [bigg_id for (bigg_id,) in session.query(db.Model.bigg_id)]
+    except SQLAlchemyError:
+        # a partial or foreign schema, treat it as real data
+        return False
+    return all(bigg_id.startswith(SYNTHETIC_MODEL_PREFIX) for bigg_id in bigg_ids)
+
+
+def create_database(
+    url: str, size: DatasetSize, seed: int = 0, drop_existing: bool = False
+):
+    """Create the cobradb schema at url and fill it with a synthetic dataset.
+
+    The cobradb tables of an existing database at url are only dropped if they
+    hold a previously generated dataset or if drop_existing is set, otherwise a
+    RuntimeError is raised.
+
+    Returns
+    -------
+    engine: sqlalchemy.engine.Engine
+    dataset: Dataset
+    """
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    engine = create_engine(url, connect_args=connect_args)
+    if not drop_existing and not _is_synthetic(engine):
+        engine.dispose()
+        raise RuntimeError(
+            f"{engine.url!r} already has cobradb tables that were not generated "
+            "by the benchmarks, pass --drop-existing to drop them."
+        )
+    db.Base.metadata.drop_all(engine)
+    db.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        dataset = populate(session, size, seed=seed)
+        session.commit()
+    return engine, dataset
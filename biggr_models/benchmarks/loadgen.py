@@ -0,0 +1,602 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Load test the web server with a weighted mix of realistic requests.
+
+The application of ``server.get_application`` is started in this process on a
+synthetic dataset (see ``dataset``), and ``--concurrency`` clients send
+requests drawn from ``TRAFFIC_MIX`` for ``--duration`` seconds, e.g.
+``python -m biggr_models.benchmarks.loadgen --scale 2 --duration 60``. The
+latency percentiles and throughput of every route are printed and can be
+written as JSON. With ``--baseline`` the p95 latencies are compared to a
+previous run, and the exit status is 1 if a route became slower.
+
+Client and server share one event loop, like the server shares it between its
+concurrent requests, so the numbers are those of a single server process.
+"""
+
+import argparse
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass
+import datetime
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+from urllib.parse import quote, urlencode
+
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+from biggr_models import __api_version__ as api_v, server
+from biggr_models.benchmarks import suite
+from biggr_models.benchmarks.dataset import Dataset, dataset_size
+from biggr_models.handlers import (
+    advanced_search_handlers,
+    gene_handlers,
+    metabolite_handlers,
+    model_handlers,
+    reaction_handlers,
+    utils as handler_utils,
+)
+
+# Ratio of the p95 latencies above which a route counts as slower
+P95_REGRESSION_THRESHOLD = 1.25
+# Routes faster than this are dominated by noise and not compared
+MIN_COMPARED_MS = 5.0
+# Rows per page of the data tables, as in the browser
+PAGE_LENGTH = 25
+REQUEST_TIMEOUT = 60.0
+
+# (path, JSON body of a POST request or None)
+Request = Tuple[str, Optional[Dict[str, Any]]]
+
+
+@dataclass
+class TrafficRoute:
+    name: str
+    weight: float
+    request: Callable[[Dataset, random.Random], Request]
+
+
+TRAFFIC_MIX: List[TrafficRoute] = []
+
+
+def traffic_route(name: str, weight: float):
+    """Add a route to the traffic mix, weight is its relative request rate.
+
+    The decorated function returns the request for the dataset, using the
+    random generator to pick the identifiers.
+    """
+
+    def decorator(func: Callable[[Dataset, random.Random], Request]):
+        TRAFFIC_MIX.append(TrafficRoute(name, weight, func))
+        return func
+
+    return decorator
+
+
+def datatables_query(
+    handler: Type[handler_utils.DataHandler],
+    rng: random.Random,
+    total: int,
+) -> str:
+    """Return the query string of a data tables page request of handler."""
+    column_specs = handler.column_specs
+    order_column = rng.choice(column_specs)
+    args = {
+        "draw": 1,
+        # most users stay on the first pages
+        "start": min(int(rng.expovariate(1 / 2)), max(total // PAGE_LENGTH, 0))
+        * PAGE_LENGTH,
+        "length": PAGE_LENGTH,
+        "search[value]": "",
+        "search[regex]": "false",
+        "order[0][name]": order_column.identifier,
+        "order[0][dir]": rng.choice(("asc", "desc")),
+    }
+    for i, column_spec in enumerate(column_specs):
+        args[f"columns[{i}][data]"] = column_spec.identifier
+    return urlencode(args)
+
+
+def _search_term(d: Dataset, rng: random.Random) -> str:
+    values = rng.choice(
+        (
+            d.universal_reaction_bigg_ids,
+            d.universal_metabolite_bigg_ids,
+            d.model_bigg_ids,
+        )
+    )
+    value = rng.choice(values)
+    return value[: rng.randint(2, len(value))]
+
+
+# data tables
+
+
+@traffic_route("model reactions table", 12)
+def _(d, rng):
+    model = rng.choice(d.model_bigg_ids)
+    query = datatables_query(
+        reaction_handlers.ReactionListViewHandler,
+        rng,
+        len(d.model_reactions) // len(d.model_bigg_ids),
+    )
+    return f"/api/{api_v}/models/{model}/reactions?{query}", None
+
+
+@traffic_route("model metabolites table", 8)
+def _(d, rng):
+    model = rng.choice(d.model_bigg_ids)
+    query = datatables_query(
+        metabolite_handlers.MetaboliteListViewHandler,
+        rng,
+        len(d.model_metabolites) // len(d.model_bigg_ids),
+    )
+    return f"/api/{api_v}/models/{model}/metabolites?{query}", None
+
+
+@traffic_route("model genes table", 5)
+def _(d, rng):
+    model = rng.choice(d.model_bigg_ids)
+    query = datatables_query(
+        gene_handlers.GeneListViewHandler,
+        rng,
+        len(d.model_genes) // len(d.model_bigg_ids),
+    )
+    return f"/api/{api_v}/models/{model}/genes?{query}", None
+
+
+@traffic_route("universal reactions table", 6)
+def _(d, rng):
+    query = datatables_query(
+        reaction_handlers.UniversalReactionListViewHandler,
+        rng,
+        len(d.universal_reaction_bigg_ids),
+    )
+    return f"/api/{api_v}/universal/reactions?{query}", None
+
+
+@traffic_route("universal metabolites table", 5)
+def _(d, rng):
+    query = datatables_query(
+        metabolite_handlers.UniversalMetaboliteListViewHandler,
+        rng,
+        len(d.universal_metabolite_bigg_ids),
+    )
+    return f"/api/{api_v}/universal/metabolites?{query}", None
+
+
+@traffic_route("models table", 3)
+def _(d, rng):
+    query = datatables_query(
+        model_handlers.ModelsListViewHandler, rng, len(d.model_bigg_ids)
+    )
+    return f"/api/{api_v}/models?{query}", None
+
+
+# detail pages
+
+
+@traffic_route("model page", 6)
+def _(d, rng):
+    return f"/models/{rng.choice(d.model_bigg_ids)}", None
+
+
+@traffic_route("model reaction page", 10)
+def _(d, rng):
+    model, reaction, _ = rng.choice(d.model_reactions)
+    return f"/models/{model}/reactions/{reaction}", None
+
+
+@traffic_route("model metabolite page", 8)
+def _(d, rng):
+    model, metabolite, _ = rng.choice(d.model_metabolites)
+    return f"/models/{model}/metabolites/{metabolite}", None
+
+
+@traffic_route("model gene page", 4)
+def _(d, rng):
+    model, gene, _ = rng.choice(d.model_genes)
+    return f"/models/{model}/genes/{gene}", None
+
+
+@traffic_route("universal reaction page", 6)
+def _(d, rng):
+    return f"/universal/reactions/{rng.choice(d.universal_reaction_bigg_ids)}", None
+
+
+@traffic_route("universal metabolite page", 6)
+def _(d, rng):
+    return f"/universal/metabolites/{rng.choice(d.universal_metabolite_bigg_ids)}", None
+
+
+@traffic_route("genome page", 2)
+def _(d, rng):
+    return f"/genomes/{rng.choice(d.genome_ref_strings)}", None
+
+
+@traffic_route("collections page", 2)
+def _(d, rng):
+    return "/collections", None
+
+
+# search
+
+
+@traffic_route("search page", 3)
+def _(d, rng):
+    return f"/search/{quote(_search_term(d, rng))}", None
+
+
+@traffic_route("reaction search tab", 3)
+def _(d, rng):
+    term = quote(_search_term(d, rng))
+    query = datatables_query(
+        advanced_search_handlers.UniversalReactionSearchHandler,
+        rng,
+        len(d.universal_reaction_bigg_ids),
+    )
+    return f"/api/{api_v}/search/reactions/{term}?{query}", None
+
+
+@traffic_route("metabolite search tab", 3)
+def _(d, rng):
+    term = quote(_search_term(d, rng))
+    query = datatables_query(
+        advanced_search_handlers.UniversalMetaboliteSearchHandler,
+        rng,
+        len(d.universal_metabolite_bigg_ids),
+    )
+    return f"/api/{api_v}/search/metabolites/{term}?{query}", None
+
+
+@traffic_route("model search tab", 1)
+def _(d, rng):
+    term = quote(_search_term(d, rng))
+    query = datatables_query(
+        advanced_search_handlers.ModelSearchHandler, rng, len(d.model_bigg_ids)
+    )
+    return f"/api/{api_v}/search/models/{term}?{query}", None
+
+
+@traffic_route("gene search tab", 1)
+def _(d, rng):
+    term = quote(rng.choice(d.genes)[2][:3])
+    query = datatables_query(
+        advanced_search_handlers.GeneSearchHandler, rng, len(d.genes)
+    )
+    return f"/api/{api_v}/search/genes/{term}?{query}", None
+
+
+# object API
+
+
+@traffic_route("object API", 4)
+def _(d, rng):
+    body = rng.choice(
+        (
+            {"type": "model", "id": rng.choice(d.model_bigg_ids)},
+            {"type": "reaction", "id": rng.choice(d.reaction_ids)},
+            {"type": "component", "id": rng.choice(d.component_ids)},
+            {
+                "type": "universal_component",
+                "id": rng.choice(d.universal_metabolite_bigg_ids),
+            },
+        )
+    )
+    return f"/api/{api_v}/objects", body
+
+
+# downloads
+
+
+@traffic_route("reactions download", 0.5)
+def _(d, rng):
+    return f"/api/{api_v}/download/reactions", None
+
+
+@traffic_route("metabolites download", 0.5)
+def _(d, rng):
+    return f"/api/{api_v}/download/metabolites", None
+
+
+@traffic_route("model files", 1)
+def _(d, rng):
+    return f"/api/{api_v}/models/{rng.choice(d.model_bigg_ids)}/files", None
+
+
+# Escher
+
+
+@traffic_route("Escher map", 3)
+def _(d, rng):
+    model, escher_map = rng.choice(d.escher_maps)
+    return f"/api/{api_v}/models/{model}/escher/{escher_map}", None
+
+
+@traffic_route("Escher modules of model", 1)
+def _(d, rng):
+    return f"/api/{api_v}/models/{rng.choice(d.model_bigg_ids)}/escher_modules", None
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Return the q-th percentile (0-100) of sorted values, by nearest rank."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _route_summary(durations: List[float], errors: int, seconds: float) -> dict:
+    durations = sorted(durations)
+    return {
+        "requests": len(durations),
+        "errors": errors,
+        "throughput_rps": round(len(durations) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(percentile(durations, 50) * 1000, 1),
+        "p95_ms": round(percentile(durations, 95) * 1000, 1),
+        "p99_ms": round(percentile(durations, 99) * 1000, 1),
+        "max_ms": round(durations[-1] * 1000, 1) if durations else 0.0,
+    }
+
+
+async def generate_load(
+    base_url: str,
+    dataset: Dataset,
+    duration: float,
+    concurrency: int,
+    warmup: float = 5.0,
+    seed: int = 0,
+    mix: List[TrafficRoute] = TRAFFIC_MIX,
+) -> Dict[str, Any]:
+    """Send requests of the mix from concurrency clients, return the summaries.
+
+    Requests that start during the first warmup seconds are not counted.
+    """
+    client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+    weights = [route.weight for route in mix]
+    durations: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    error_examples: Dict[str, str] = {}
+    start = time.monotonic()
+    measure_from = start + warmup
+    end = measure_from + duration
+
+    async def worker(n: int):
+        rng = random.Random(seed * 1000 + n)
+        while time.monotonic() < end:
+            route = rng.choices(mix, weights)[0]
+            path, body = route.request(dataset, rng)
+            request_start = time.monotonic()
+            try:
+                response = await client.fetch(
+                    base_url + path,
+                    method="GET" if body is None else "POST",
+                    body=None if body is None else json.dumps(body),
+                    raise_error=False,
+                    request_timeout=REQUEST_TIMEOUT,
+                )
+                failed = response.code >= 400
+                reason = f"{response.code} {response.reason} for {path}"
+            except Exception as e:
+                failed = True
+                reason = f"{e!r} for {path}"
+            if request_start < measure_from:
+                continue
+            durations[route.name].append(time.monotonic() - request_start)
+            if failed:
+                errors[route.name] += 1
+                error_examples.setdefault(route.name, reason)
+
+    try:
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    finally:
+        client.close()
+    seconds = time.monotonic() - measure_from
+
+    routes = {
+        route.name: _route_summary(durations[route.name], errors[route.name], seconds)
+        for route in mix
+        if durations[route.name]
+    }
+    for name, example in error_examples.items():
+        routes[name]["error_example"] = example
+    return {
+        "routes": routes,
+        "total": _route_summary(
+            [x for values in durations.values() for x in values],
+            sum(errors.values()),
+            seconds,
+        ),
+    }
+
+
+def print_report(result: Dict[str, Any]):
+    print(
+        f"{'route':<30} {'requests':>8} {'errors':>6} {'req/s':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    rows = sorted(result["routes"].items(), key=lambda x: -x[1]["p95_ms"])
+    for name, s in rows + [("total", result["total"])]:
+        print(
+            f"{name:<30} {s['requests']:>8} {s['errors']:>6} "
+            f"{s['throughput_rps']:>8.1f} {s['p50_ms']:>8.1f} "
+            f"{s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f}"
+        )
+    for name, s in rows:
+        if "error_example" in s:
+            print(f"{name}: {s['error_example']}")
+
+
+def compare(
+    baseline: Dict[str, Any],
+    result: Dict[str, Any],
+    threshold: float = P95_REGRESSION_THRESHOLD,
+) -> List[str]:
+    """Print the routes whose p95 latency changed, return the slower ones."""
+    print(f"Comparing to {baseline.get('commit')}")
+    slower = []
+    for name, new in sorted(result["routes"].items()):
+        old = baseline["routes"].get(name)
+        if old is None:
+            continue
+        if max(old["p95_ms"], new["p95_ms"]) < MIN_COMPARED_MS:
+            continue
+        ratio = new["p95_ms"] / old["p95_ms"] if old["p95_ms"] else float("inf")
+        if ratio > threshold:
+            label = "slower"
+            slower.append(name)
+        elif ratio < 1 / threshold:
+            label = "faster"
+        else:
+            continue
+        print(
+            f"{name}: {label}, p95 {old['p95_ms']:.1f} ms -> {new['p95_ms']:.1f} ms "
+            f"({ratio:.2f}x)"
+        )
+    if not slower:
+        print("No route became slower")
+    return slower
+
+
+async def run_load_test(
+    dataset: Dataset,
+    duration: float,
+    concurrency: int,
+    warmup: float = 5.0,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """Serve the application on a free local port and load test it."""
+    sockets = bind_sockets(0, "127.0.0.1")
+    http_server = HTTPServer(server.get_application())
+    http_server.add_sockets(sockets)
+    port = sockets[0].getsockname()[1]
+    print(
+        f"Sending requests from {concurrency} clients for {warmup:.0f}s warmup and "
+        f"{duration:.0f}s measurement"
+    )
+    try:
+        return await generate_load(
+            f"http://127.0.0.1:{port}",
+            dataset,
+            duration,
+            concurrency,
+            warmup=warmup,
+            seed=seed,
+        )
+    finally:
+        http_server.stop()
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Dataset scale factor, 1 is the size of --profile.",
+    )
+    parser.add_argument(
+        "--profile",
+        default="default",
+        help="Base dataset size that is scaled, see dataset.PROFILES.",
+    )
+    parser.add_argument(
+        "--models",
+        type=int,
+        help="Number of models at scale 1, overrides the profile.",
+    )
+    parser.add_argument(
+        "--annotations",
+        type=int,
+        help="Annotations of each metabolite and reaction, overrides the profile.",
+    )
+    parser.add_argument(
+        "--database",
+        help="SQLAlchemy URL of a PostgreSQL database, its cobradb tables are "
+        "dropped if they only hold generated models. A temporary SQLite database "
+        "is used by default.",
+    )
+    parser.add_argument(
+        "--drop-existing",
+        action="store_true",
+        help="Drop the cobradb tables of --database even if they hold real data.",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=30.0, help="Measured seconds."
+    )
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=5.0,
+        help="Seconds of requests before the measurement, they are not counted.",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Number of concurrent clients."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument(
+        "--baseline",
+        help="Results of a previous run, exit with status 1 if a route's p95 "
+        "latency is higher by more than --threshold.",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=P95_REGRESSION_THRESHOLD,
+        help="Slowdown ratio of the p95 latency reported as regression.",
+    )
+    args = parser.parse_args()
+    try:
+        size = dataset_size(args.profile, args.models, args.annotations)
+    except ValueError as e:
+        parser.error(str(e))
+    # failed requests are counted per route, only log server errors
+    logging.getLogger("tornado.access").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory(prefix="biggr_load_test_db_") as directory:
+        url = args.database or f"sqlite:///{directory}/load_test.db"
+        print(f"Generating dataset at scale {args.scale}")
+        size = size.scaled(args.scale)
+        with suite.synthetic_environment(
+            url, size, seed=args.seed, drop_existing=args.drop_existing
+        ) as (dataset, _):
+            handler_utils.static_model_dir = suite.model_dir
+            result = asyncio.run(
+                run_load_test(
+                    dataset,
+                    args.duration,
+                    args.concurrency,
+                    warmup=args.warmup,
+                    seed=args.seed,
+                )
+            )
+    result = {
+        "commit": suite.git_commit(),
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "database": "postgresql" if args.database else "sqlite",
+        "scale": args.scale,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        **result,
+    }
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Wrote {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(baseline, result, threshold=args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,863 @@
+"""Benchmarks of the functions in ``biggr_models.queries``.
+
+Every benchmark calls one query function with identifiers of a synthetic
+dataset (see ``dataset``). Each call gets a new session, and is timed twice:
+cold, after clearing the per-version query caches, and warm. Functions of the
+query modules without a benchmark are reported as skipped, so new queries show
+up in the results until a benchmark is added for them.
+"""
+
+from contextlib import contextmanager
+from dataclasses import asdict
+import importlib
+import inspect
+import os
+import pkgutil
+import statistics
+import subprocess
+import tempfile
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+from cobradb import models as db
+from cobradb.models import Session
+
+from biggr_models import warm_escher_cache
+import biggr_models.queries
+from biggr_models.benchmarks.dataset import (
+    Dataset,
+    DatasetSize,
+    create_database,
+    write_model_files,
+)
+from biggr_models.queries import (
+    compartment_queries,
+    download_queries,
+    escher_map_queries,
+    escher_queries,
+    gene_queries,
+    genome_queries,
+    listing_queries,
+    memote_queries,
+    metabolite_queries,
+    model_file_queries,
+    model_queries,
+    object_queries,
+    reaction_queries,
+    taxonomy_queries,
+    utils as query_utils,
+)
+
+Benchmark = Callable[[Any, Dataset, int], Any]
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+# Helpers without database access or whose time is part of other benchmarks
+NOT_BENCHMARKED = {
+    "download_queries.extract_reaction_participants",
+    "download_queries.extract_universal_reaction_participants",
+    "escher_queries.assemble_projections",
+    "escher_queries.escher_map_data_from_json",
+    "escher_queries.get_escher_map_cache_path",
+    "escher_queries.get_escher_map_cache_version_dir",
+    "gene_queries.get_genome_region_columns",
+    "listing_queries.register_listing",
+    "memote_queries.get_memote_summary_cache_path",
+    "model_file_queries.format_byte_size",
+    "model_file_queries.get_model_file_index",
+    "utils.build_reaction_string",
+    "utils.cache_per_database_version",
+    "utils.convert_id_to_query_filter",
+    "utils.get_cache_stats",
+    "utils.get_database_version_key",
+    "utils.get_list_base_query",
+    "utils.run_concurrently",
+    "utils.safe_path_component",
+    "utils.write_file_atomic",
+}
+
+# Directory of the placeholder model files of the current dataset
+model_dir = ""
+
+
+def benchmark(name: str):
+    """Register a benchmark of the query function ``<module>.<function>``.
+
+    The benchmark is called with a session, the dataset and the repetition
+    number, which selects the identifiers passed to the query.
+    """
+
+    def decorator(func: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = func
+        return func
+
+    return decorator
+
+
+def _pick(values: List[Any], i: int) -> Any:
+    # spread the repetitions over the whole list
+    return values[(i * 7919) % len(values)]
+
+
+def _handler_column_specs(module: str, handler: str):
+    # the handlers are only imported for the list benchmarks
+    handlers = importlib.import_module(f"biggr_models.handlers.{module}")
+    return getattr(handlers, handler).column_specs
+
+
+# compartments
+
+
+@benchmark("compartment_queries.get_compartment")
+def _(session, d, i):
+    return compartment_queries.get_compartment(
+        session, _pick(d.compartment_bigg_ids, i)
+    )
+
+
+# downloads
+
+
+@benchmark("download_queries.get_reactions")
+def _(session, d, i):
+    return download_queries.get_reactions(session)
+
+
+@benchmark("download_queries.get_metabolites")
+def _(session, d, i):
+    return download_queries.get_metabolites(session)
+
+
+# legacy Escher maps
+
+
+@benchmark("escher_map_queries.get_escher_maps_for_model")
+def _(session, d, i):
+    return escher_map_queries.get_escher_maps_for_model(_pick(d.model_ids, i), session)
+
+
+@benchmark("escher_map_queries.get_escher_maps_for_reaction")
+def _(session, d, i):
+    model_bigg_id, reaction_bigg_id, _ = _pick(d.model_reactions, i)
+    return escher_map_queries.get_escher_maps_for_reaction(
+        reaction_bigg_id, model_bigg_id, session
+    )
+
+
+@benchmark("escher_map_queries.get_escher_maps_for_metabolite")
+def _(session, d, i):
+    model_bigg_id, comp_comp_bigg_id, _ = _pick(d.model_metabolites, i)
+    metabolite_bigg_id, compartment_bigg_id = comp_comp_bigg_id.rsplit("_", 1)
+    return escher_map_queries.get_escher_maps_for_metabolite(
+        metabolite_bigg_id, compartment_bigg_id, model_bigg_id, session
+    )
+
+
+@benchmark("escher_map_queries.json_for_map")
+def _(session, d, i):
+    return escher_map_queries.json_for_map(_pick(d.escher_maps, i)[1], session)
+
+
+# Escher modules
+
+
+@benchmark("escher_queries.get_model_reactions_for_escher_map")
+def _(session, d, i):
+    return escher_queries.get_model_reactions_for_escher_map(
+        session, *_pick(d.escher_maps, i)
+    )
+
+
+@benchmark("escher_queries.load_or_build_escher_map")
+def _(session, d, i):
+    model_bigg_id, map_bigg_id = _pick(d.escher_maps, i)
+    # remove the prebuilt map, so the layout is part of the timing
+    cache_path = escher_queries.get_escher_map_cache_path(
+        query_utils.get_database_version_key(session), model_bigg_id, map_bigg_id
+    )
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    return escher_queries.load_or_build_escher_map(session, model_bigg_id, map_bigg_id)
+
+
+@benchmark("escher_queries.get_escher_map")
+def _(session, d, i):
+    return escher_queries.get_escher_map(session, *_pick(d.escher_maps, i))
+
+
+@benchmark("escher_queries.get_all_escher_map_ids")
+def _(session, d, i):
+    return escher_queries.get_all_escher_map_ids(session)
+
+
+# genes
+
+
+@benchmark("gene_queries.get_gene_ids_for_gene_name")
+def _(session, d, i):
+    return gene_queries.get_gene_ids_for_gene_name(_pick(d.genes, i)[2], session)
+
+
+@benchmark("gene_queries.get_gene_ids_for_gene_names")
+def _(session, d, i):
+    names = [gene[2] for gene in d.genes[i::7][:100]]
+    return gene_queries.get_gene_ids_for_gene_names(session, names)
+
+
+@benchmark("gene_queries.get_genes_and_regions_for_gene_names")
+def _(session, d, i):
+    names = [gene[2] for gene in d.genes[i::7][:100]]
+    return gene_queries.get_genes_and_regions_for_gene_names(session, names)
+
+
+@benchmark("gene_queries.get_genes")
+def _(session, d, i):
+    return gene_queries.get_genes(d.gene_ids[i::7][:100], session)
+
+
+@benchmark("gene_queries.get_all_genes")
+def _(session, d, i):
+    return gene_queries.get_all_genes(session)
+
+
+@benchmark("gene_queries.get_gene_name_catalog")
+def _(session, d, i):
+    return gene_queries.get_gene_name_catalog(session)
+
+
+@benchmark("gene_queries.get_genome_region_for_gene_id")
+def _(session, d, i):
+    return gene_queries.get_genome_region_for_gene_id(d.gene_ids[i::7][:100], session)
+
+
+@benchmark("gene_queries.get_genome_region_sequences")
+def _(session, d, i):
+    return gene_queries.get_genome_region_sequences(session, d.gene_ids[i::7][:100])
+
+
+@benchmark("gene_queries.get_model_genes_count")
+def _(session, d, i):
+    return gene_queries.get_model_genes_count(_pick(d.model_bigg_ids, i), session)
+
+
+@benchmark("gene_queries.get_model_genes")
+def _(session, d, i):
+    return gene_queries.get_model_genes(_pick(d.model_bigg_ids, i), session, 0, 100)
+
+
+@benchmark("gene_queries.get_model_gene")
+def _(session, d, i):
+    model_bigg_id, gene_bigg_id, _ = _pick(d.model_genes, i)
+    return gene_queries.get_model_gene(gene_bigg_id, model_bigg_id, session)
+
+
+@benchmark("gene_queries.get_gene")
+def _(session, d, i):
+    return gene_queries.get_gene(session, *_pick(d.genes, i))
+
+
+# genomes
+
+
+@benchmark("genome_queries.get_genomes_count")
+def _(session, d, i):
+    return genome_queries.get_genomes_count(session)
+
+
+@benchmark("genome_queries.get_all_genomes")
+def _(session, d, i):
+    return genome_queries.get_all_genomes(session)
+
+
+@benchmark("genome_queries.get_strain_catalog")
+def _(session, d, i):
+    return genome_queries.get_strain_catalog(session)
+
+
+@benchmark("genome_queries.get_genomes")
+def _(session, d, i):
+    return genome_queries.get_genomes(session, 0, 100)
+
+
+@benchmark("genome_queries.get_genome_and_models")
+def _(session, d, i):
+    return genome_queries.get_genome_and_models(_pick(d.genome_ref_strings, i), session)
+
+
+@benchmark("genome_queries.get_reactions_for_genomes")
+def _(session, d, i):
+    return genome_queries.get_reactions_for_genomes(session, d.genome_ids[:10])
+
+
+@benchmark("genome_queries.get_reactions_for_genome")
+def _(session, d, i):
+    return genome_queries.get_reactions_for_genome(_pick(d.genome_ids, i), session)
+
+
+@benchmark("genome_queries.get_metabolites_for_genomes")
+def _(session, d, i):
+    return genome_queries.get_metabolites_for_genomes(session, d.genome_ids[:10])
+
+
+@benchmark("genome_queries.get_metabolites_for_genome")
+def _(session, d, i):
+    return genome_queries.get_metabolites_for_genome(_pick(d.genome_ids, i), session)
+
+
+@benchmark("genome_queries.get_genomes_with_chromosomes_for_accessions")
+def _(session, d, i):
+    return genome_queries.get_genomes_with_chromosomes_for_accessions(
+        session, d.genome_ref_strings[:10]
+    )
+
+
+@benchmark("genome_queries.get_genomes_with_chromosomes")
+def _(session, d, i):
+    return genome_queries.get_genomes_with_chromosomes(
+        _pick(d.genome_ref_strings, i), session
+    )
+
+
+@benchmark("genome_queries.get_genomes_for_gene_strain_pairs")
+def _(session, d, i):
+    pairs = [(gene, accession) for _, accession, gene in d.genes[i::7][:100]]
+    return genome_queries.get_genomes_for_gene_strain_pairs(session, pairs)
+
+
+# listings
+
+
+@benchmark("listing_queries.refresh_listings")
+def _(session, d, i):
+    for module in ("gene_handlers", "metabolite_handlers", "reaction_handlers"):
+        # the handlers register their listings on import
+        importlib.import_module(f"biggr_models.handlers.{module}")
+    rebuilt = listing_queries.refresh_listings(session, force=True)
+    session.commit()
+    return rebuilt
+
+
+# MEMOTE
+
+
+@benchmark("memote_queries.build_memote_summaries")
+def _(session, d, i):
+    return memote_queries.build_memote_summaries(session, force=True)
+
+
+@benchmark("memote_queries.get_memote_summary")
+def _(session, d, i):
+    # read from the disk cache, filled by the build_memote_summaries benchmark
+    return memote_queries.get_memote_summary(session, _pick(d.model_ids, i))
+
+
+@benchmark("memote_queries.get_general_results_for_model")
+def _(session, d, i):
+    return memote_queries.get_general_results_for_model(session, _pick(d.model_ids, i))
+
+
+@benchmark("memote_queries.get_memote_results_for_reaction")
+def _(session, d, i):
+    model_bigg_id, _, model_reaction_id = _pick(d.model_reactions, i)
+    model_id = d.model_ids[d.model_bigg_ids.index(model_bigg_id)]
+    return memote_queries.get_memote_results_for_reaction(
+        session, model_id, model_reaction_id
+    )
+
+
+@benchmark("memote_queries.get_memote_results_for_metabolite")
+def _(session, d, i):
+    model_bigg_id, _, model_comp_comp_id = _pick(d.model_metabolites, i)
+    model_id = d.model_ids[d.model_bigg_ids.index(model_bigg_id)]
+    return memote_queries.get_memote_results_for_metabolite(
+        session, model_id, model_comp_comp_id
+    )
+
+
+@benchmark("memote_queries.get_memote_results_for_gene")
+def _(session, d, i):
+    model_bigg_id, _, model_gene_id = _pick(d.model_genes, i)
+    model_id = d.model_ids[d.model_bigg_ids.index(model_bigg_id)]
+    return memote_queries.get_memote_results_for_gene(session, model_id, model_gene_id)
+
+
+@benchmark("memote_queries.get_memote_flags_for_model")
+def _(session, d, i):
+    return memote_queries.get_memote_flags_for_model(
+        session, _pick(d.model_bigg_ids, i)
+    )
+
+
+# metabolites
+
+
+@benchmark("metabolite_queries.get_universal_metabolites_count")
+def _(session, d, i):
+    return metabolite_queries.get_universal_metabolites_count(session)
+
+
+@benchmark("metabolite_queries.get_universal_metabolites")
+def _(session, d, i):
+    return metabolite_queries.get_universal_metabolites(session, 0, 100)
+
+
+@benchmark("metabolite_queries.get_model_metabolites_count")
+def _(session, d, i):
+    return metabolite_queries.get_model_metabolites_count(
+        _pick(d.model_bigg_ids, i), session
+    )
+
+
+@benchmark("metabolite_queries.get_model_metabolites")
+def _(session, d, i):
+    return metabolite_queries.get_model_metabolites(
+        _pick(d.model_bigg_ids, i), session, 0, 100
+    )
+
+
+@benchmark("metabolite_queries.process_annotation_for_template")
+def _(session, d, i):
+    annotations = session.query(db.Annotation).limit(100).all()
+    return [metabolite_queries.process_annotation_for_template(a) for a in annotations]
+
+
+@benchmark("metabolite_queries.get_annotations_for_metabolites")
+def _(session, d, i):
+    return metabolite_queries.get_annotations_for_metabolites(
+        session, component_ids=d.component_ids[i::7][:100]
+    )
+
+
+@benchmark("metabolite_queries.AnnotationAggregator")
+def _(session, d, i):
+    # the annotations of one component, as merged on its detail page, see the
+    # annotations profile for hundreds of annotations per component
+    component_id = _pick(d.component_ids, i)
+    _, comp_annotations = metabolite_queries.get_annotations_for_metabolites(
+        session, component_ids=[component_id]
+    )
+    return metabolite_queries.AnnotationAggregator.from_annotations(
+        comp_annotations.get(component_id, [])
+    ).as_template_dict()
+
+
+@benchmark("metabolite_queries.get_metabolite")
+def _(session, d, i):
+    return metabolite_queries.get_metabolite(
+        _pick(d.universal_metabolite_bigg_ids, i), session
+    )
+
+
+@benchmark("metabolite_queries.get_model_list_for_metabolite")
+def _(session, d, i):
+    return metabolite_queries.get_model_list_for_metabolite(
+        _pick(d.universal_metabolite_bigg_ids, i), session
+    )
+
+
+@benchmark("metabolite_queries.get_model_comp_metabolite")
+def _(session, d, i):
+    model_bigg_id, comp_comp_bigg_id, _ = _pick(d.model_metabolites, i)
+    return metabolite_queries.get_model_comp_metabolite(
+        comp_comp_bigg_id, model_bigg_id, session
+    )
+
+
+@benchmark("metabolite_queries.get_component_object")
+def _(session, d, i):
+    return metabolite_queries.get_component_object(session, _pick(d.component_ids, i))
+
+
+@benchmark("metabolite_queries.get_universal_component_object")
+def _(session, d, i):
+    return metabolite_queries.get_universal_component_object(
+        session, _pick(d.universal_metabolite_bigg_ids, i)
+    )
+
+
+@benchmark("metabolite_queries.get_compartmentalized_component_object")
+def _(session, d, i):
+    return metabolite_queries.get_compartmentalized_component_object(
+        session, _pick(d.compartmentalized_component_bigg_ids, i)
+    )
+
+
+@benchmark("metabolite_queries.get_model_compartmentalized_component_object")
+def _(session, d, i):
+    model_bigg_id, comp_comp_bigg_id, _ = _pick(d.model_metabolites, i)
+    return metabolite_queries.get_model_compartmentalized_component_object(
+        session, comp_comp_bigg_id, model_bigg_id
+    )
+
+
+@benchmark("metabolite_queries.get_any_components_by_identifiers")
+def _(session, d, i):
+    return metabolite_queries.get_any_components_by_identifiers(
+        session, d.compartmentalized_component_bigg_ids[i::7][:50]
+    )
+
+
+# model files
+
+
+@benchmark("model_file_queries.get_model_file_sizes")
+def _(session, d, i):
+    return model_file_queries.get_model_file_sizes(
+        _pick(d.model_bigg_ids, i), model_dir
+    )
+
+
+@benchmark("model_file_queries.get_model_files")
+def _(session, d, i):
+    return model_file_queries.get_model_files(_pick(d.model_bigg_ids, i), model_dir)
+
+
+@benchmark("model_file_queries.get_model_file_listing")
+def _(session, d, i):
+    return model_file_queries.get_model_file_listing(model_dir)
+
+
+# models
+
+
+@benchmark("model_queries.get_models_count")
+def _(session, d, i):
+    return model_queries.get_models_count(session)
+
+
+@benchmark("model_queries.get_models")
+def _(session, d, i):
+    return model_queries.get_models(session, 0, 100)
+
+
+@benchmark("model_queries.get_escher_module_availability")
+def _(session, d, i):
+    return model_queries.get_escher_module_availability(session)
+
+
+@benchmark("model_queries.get_escher_modules_for_model")
+def _(session, d, i):
+    return model_queries.get_escher_modules_for_model(
+        session, _pick(d.model_bigg_ids, i)
+    )
+
+
+@benchmark("model_queries.get_model_and_counts")
+def _(session, d, i):
+    return model_queries.get_model_and_counts(
+        _pick(d.model_bigg_ids, i), session, static_model_dir=model_dir
+    )
+
+
+@benchmark("model_queries.get_model_list")
+def _(session, d, i):
+    return model_queries.get_model_list(session)
+
+
+@benchmark("model_queries.get_model_object")
+def _(session, d, i):
+    return model_queries.get_model_object(session, _pick(d.model_bigg_ids, i))
+
+
+@benchmark("model_queries.get_taxons_recursively")
+def _(session, d, i):
+    return model_queries.get_taxons_recursively(session, _pick(d.taxon_ids, i))
+
+
+@benchmark("model_queries.get_model_collections_and_taxons")
+def _(session, d, i):
+    return model_queries.get_model_collections_and_taxons(session)
+
+
+# objects
+
+
+@benchmark("object_queries.get_object")
+def _(session, d, i):
+    return object_queries.get_object(db.Model, session, _pick(d.model_bigg_ids, i))
+
+
+@benchmark("object_queries.get_object_property")
+def _(session, d, i):
+    return object_queries.get_object_property(
+        db.Model,
+        db.ModelCompartmentalizedComponent,
+        db.Model.model_compartmentalized_components,
+        session,
+        _pick(d.model_ids, i),
+    )
+
+
+# reactions
+
+
+@benchmark("reaction_queries.get_universal_reactions_count")
+def _(session, d, i):
+    return reaction_queries.get_universal_reactions_count(session)
+
+
+@benchmark("reaction_queries.get_universal_reactions")
+def _(session, d, i):
+    return reaction_queries.get_universal_reactions(session, 0, 100)
+
+
+@benchmark("reaction_queries.get_model_reactions_count")
+def _(session, d, i):
+    return reaction_queries.get_model_reactions_count(
+        _pick(d.model_bigg_ids, i), session
+    )
+
+
+@benchmark("reaction_queries.get_model_reactions")
+def _(session, d, i):
+    return reaction_queries.get_model_reactions(
+        _pick(d.model_bigg_ids, i), session, 0, 100
+    )
+
+
+@benchmark("reaction_queries.get_aligned_reaction_strings")
+def _(session, d, i):
+    return reaction_queries.get_aligned_reaction_strings(
+        session, _pick(d.universal_reaction_ids, i)
+    )
+
+
+@benchmark("reaction_queries.get_universal_reaction_and_models")
+def _(session, d, i):
+    return reaction_queries.get_universal_reaction_and_models(
+        session, _pick(d.universal_reaction_bigg_ids, i)
+    )
+
+
+@benchmark("reaction_queries.get_reactions_for_model")
+def _(session, d, i):
+    return reaction_queries.get_reactions_for_model(_pick(d.model_bigg_ids, i), session)
+
+
+@benchmark("reaction_queries.get_model_list_for_reaction")
+def _(session, d, i):
+    return reaction_queries.get_model_list_for_reaction(
+        _pick(d.universal_reaction_bigg_ids, i), session
+    )
+
+
+@benchmark("reaction_queries.get_reference_for_reaction")
+def _(session, d, i):
+    return reaction_queries.get_reference_for_reaction(
+        _pick(d.universal_reaction_bigg_ids, i), session
+    )
+
+
+@benchmark("reaction_queries.get_model_reaction")
+def _(session, d, i):
+    model_bigg_id, reaction_bigg_id, _ = _pick(d.model_reactions, i)
+    return reaction_queries.get_model_reaction(model_bigg_id, reaction_bigg_id, session)
+
+
+@benchmark("reaction_queries.get_reaction")
+def _(session, d, i):
+    return reaction_queries.get_reaction(
+        _pick(d.universal_reaction_bigg_ids, i), session
+    )
+
+
+@benchmark("reaction_queries.get_reaction_object")
+def _(session, d, i):
+    return reaction_queries.get_reaction_object(session, _pick(d.reaction_ids, i))
+
+
+# taxonomy
+
+
+@benchmark("taxonomy_queries.get_taxonomy_index")
+def _(session, d, i):
+    return taxonomy_queries.get_taxonomy_index(session)
+
+
+@benchmark("taxonomy_queries.get_models_under_taxon")
+def _(session, d, i):
+    return taxonomy_queries.get_models_under_taxon(session, _pick(d.taxon_names, i))
+
+
+@benchmark("taxonomy_queries.get_collections_under_taxon")
+def _(session, d, i):
+    return taxonomy_queries.get_collections_under_taxon(
+        session, _pick(d.taxon_names, i)
+    )
+
+
+# utils
+
+
+@benchmark("utils.get_list")
+def _(session, d, i):
+    column_specs = _handler_column_specs(
+        "reaction_handlers", "UniversalReactionListViewHandler"
+    )
+    return query_utils.get_list(session, column_specs, length=100)
+
+
+@benchmark("utils.get_search_list")
+def _(session, d, i):
+    column_specs = _handler_column_specs(
+        "reaction_handlers", "UniversalReactionListViewHandler"
+    )
+    return query_utils.get_search_list(session, "RXN1", column_specs, length=100)
+
+
+@benchmark("utils.get_gene_list_for_model")
+def _(session, d, i):
+    return query_utils.get_gene_list_for_model(_pick(d.model_bigg_ids, i), session)
+
+
+@benchmark("utils.database_version")
+def _(session, d, i):
+    return query_utils.database_version(session)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def query_functions() -> Dict[str, Callable]:
+    """Return all public functions of the query modules, by ``<module>.<name>``."""
+    functions = {}
+    for module_info in pkgutil.iter_modules(biggr_models.queries.__path__):
+        module = importlib.import_module(f"biggr_models.queries.{module_info.name}")
+        for name, func in inspect.getmembers(module, inspect.isfunction):
+            if func.__module__ == module.__name__ and not name.startswith("_"):
+                functions[f"{module_info.name}.{name}"] = func
+    return functions
+
+
+def clear_caches(functions: Dict[str, Callable]):
+    """Drop all cached query results, as after loading a new database version."""
+    for func in functions.values():
+        if hasattr(func, "cache_clear"):
+            func.cache_clear()
+    query_utils._database_version_key = None
+
+
+def _time_call(benchmark_func: Benchmark, dataset: Dataset, i: int) -> float:
+    session = Session()
+    try:
+        start = time.perf_counter()
+        benchmark_func(session, dataset, i)
+        return time.perf_counter() - start
+    finally:
+        session.rollback()
+        session.close()
+
+
+def _summary(durations: List[float]) -> Dict[str, float]:
+    return {
+        "median_ms": round(statistics.median(durations) * 1000, 3),
+        "min_ms": round(min(durations) * 1000, 3),
+    }
+
+
+def run_benchmarks(
+    dataset: Dataset, repeat: int = 5, only: List[str] = ()
+) -> Dict[str, Dict[str, Any]]:
+    """Time all registered benchmarks against the database bound to Session."""
+    functions = query_functions()
+    results = {}
+    for name, benchmark_func in sorted(BENCHMARKS.items()):
+        if only and not any(pattern in name for pattern in only):
+            continue
+        cold, warm = [], []
+        try:
+            for i in range(repeat):
+                clear_caches(functions)
+                cold.append(_time_call(benchmark_func, dataset, i))
+                warm.append(_time_call(benchmark_func, dataset, i))
+        except Exception as e:
+            print(f"{name}: {e!r}")
+            results[name] = {
+                "error": repr(e),
+                "traceback": traceback.format_exc(limit=-3),
+            }
+            continue
+        results[name] = {"cold": _summary(cold), "warm": _summary(warm)}
+        print(
+            f"{name}: cold {results[name]['cold']['median_ms']:.1f} ms, "
+            f"warm {results[name]['warm']['median_ms']:.1f} ms"
+        )
+    return results
+
+
+def skipped_functions() -> List[str]:
+    """Return the query functions without a benchmark."""
+    return sorted(
+        name
+        for name in query_functions()
+        if name not in BENCHMARKS and name not in NOT_BENCHMARKED
+    )
+
+
+@contextmanager
+def synthetic_environment(
+    url: str, size: DatasetSize, seed: int = 0, drop_existing: bool = False
+):
+    """Generate a dataset at url and point the queries to it.
+
+    See ``create_database`` for drop_existing.
+
+    Yields the dataset and the time it took to generate it. The placeholder
+    model files and the Escher map and MEMOTE summary caches are kept in a
+    temporary directory, all Escher maps are built before the dataset is
+    yielded.
+    """
+    global model_dir
+    start = time.perf_counter()
+    engine, dataset = create_database(url, size, seed=seed, drop_existing=drop_existing)
+    build_seconds = time.perf_counter() - start
+    Session.configure(bind=engine)
+    clear_caches(query_functions())
+    try:
+        with tempfile.TemporaryDirectory(prefix="biggr_benchmark_") as directory:
+            model_dir = os.path.join(directory, "models")
+            write_model_files(model_dir, dataset)
+            escher_queries.ESCHER_MAP_CACHE_DIR = os.path.join(directory, "escher")
+            memote_queries.MEMOTE_SUMMARY_CACHE_DIR = os.path.join(directory, "memote")
+            # built in this process, the build pool would use the configured
+            # database instead of the synthetic one
+            for model_bigg_id, map_bigg_id in dataset.escher_maps:
+                try:
+                    warm_escher_cache.warm_escher_map(model_bigg_id, map_bigg_id)
+                except Exception as e:
+                    print(f"Could not build {model_bigg_id}/{map_bigg_id}: {e!r}")
+            yield dataset, build_seconds
+    finally:
+        engine.dispose()
+
+
+def run_scale(
+    url: str,
+    scale: float,
+    size: DatasetSize,
+    repeat: int = 5,
+    only: List[str] = (),
+    seed: int = 0,
+    drop_existing: bool = False,
+) -> Dict[str, Any]:
+    """Generate the dataset of one scale factor at url and run the benchmarks."""
+    print(f"Generating dataset at scale {scale}")
+    with synthetic_environment(
+        url, size.scaled(scale), seed=seed, drop_existing=drop_existing
+    ) as (dataset, build_seconds):
+        results = run_benchmarks(dataset, repeat=repeat, only=only)
+    return {
+        "size": asdict(dataset.size),
+        "build_seconds": round(build_seconds, 3),
+        "results": results,
+    }
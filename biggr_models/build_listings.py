@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Build the denormalized listing tables of the model data tables.
+
+Run this after loading a new database version, e.g.
+``python -m biggr_models.build_listings``. Until a listing is built for the
+current database version, its data table is queried through the joins. The
+MEMOTE summaries of all models are stored with the listings.
+"""
+
+import argparse
+
+from cobradb.models import Session
+
+# the handlers register their listings on import
+from biggr_models.handlers import (  # noqa: F401
+    gene_handlers,
+    metabolite_handlers,
+    reaction_handlers,
+)
+from biggr_models.queries import listing_queries, memote_queries
+
+
+def build_listings(force: bool = False):
+    session = Session()
+    try:
+        rebuilt = listing_queries.refresh_listings(session, force=force)
+        summaries = memote_queries.build_memote_summaries(session, force=force)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    if not rebuilt:
+        print("All listings are up to date")
+    if summaries:
+        print(f"Stored {summaries} MEMOTE summaries")
+    return rebuilt
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild all listings and MEMOTE summaries, also if they are up to "
+        "date.",
+    )
+    args = parser.parse_args()
+    build_listings(force=args.force)
+
+
+if __name__ == "__main__":
+    run()
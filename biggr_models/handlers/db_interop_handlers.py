@@ -1,14 +1,61 @@
+from bisect import bisect_left
+import gzip
+from hashlib import sha1
+import json
 import tornado
+from tornado.iostream import StreamClosedError
 from tornado.web import RedirectHandler, RequestHandler, HTTPError
 from tornado.escape import json_decode
 
 from biggr_models.handlers import utils
-from biggr_models.queries import gene_queries, genome_queries
+from biggr_models.queries import gene_queries, genome_queries, utils as query_utils
 
 from sqlalchemy import inspect
 
 
-class BaseInteropQueryHandler(tornado.web.RequestHandler):
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+
+class BaseInteropQueryHandler(utils.BaseHandler):
+    # Number of requested items that are loaded from the database at once when
+    # streaming results as NDJSON.
+    stream_chunk_size = 100
+
+    def initialize(self):
+        super().initialize()
+        self._connection_closed = False
+
+    def on_connection_close(self):
+        self._connection_closed = True
+        super().on_connection_close()
+
+    def wants_ndjson(self) -> bool:
+        """True if the client asked for a newline-delimited JSON stream."""
+        return NDJSON_CONTENT_TYPE in self.request.headers.get("Accept", "")
+
+    def iter_chunks(self, items):
+        """Split items into chunks of stream_chunk_size items."""
+        for i in range(0, len(items), self.stream_chunk_size):
+            yield items[i : i + self.stream_chunk_size]
+
+    async def stream_ndjson(self, records):
+        """Write records as newline-delimited JSON, one record per line.
+
+        Every record is flushed before the next one is produced, so only one
+        record is held in the output buffer at a time. Producing records stops
+        as soon as the client disconnects.
+        """
+        self.set_header("Content-Type", f"{NDJSON_CONTENT_TYPE}; charset=utf-8")
+        for record in records:
+            if self._connection_closed:
+                return
+            self.write(json.dumps(record, cls=utils.BiGGrJSONEncoder) + "\n")
+            try:
+                await self.flush()
+            except StreamClosedError:
+                return
+        if not self._connection_closed:
+            self.finish()
 
     def _parse_json(self):
         try:
@@ -16,6 +63,27 @@ class BaseInteropQueryHandler(tornado.web.RequestHandler):
         except ValueError:
             raise tornado.web.HTTPError(400, reason="Invalid JSON payload.")
 
+    def _parse_projection(self, data):
+        """Parse the genome region projection options of a request.
+
+        'fields' restricts the genome region columns that are returned, and
+        'include_sequences' (default true) can be set to false to leave out the
+        DNA and protein sequences.
+        """
+        fields = data.get("fields")
+        if fields is not None and (
+            not isinstance(fields, list) or not all(isinstance(f, str) for f in fields)
+        ):
+            raise tornado.web.HTTPError(
+                400, reason="'fields' must be a list of strings."
+            )
+        include_sequences = data.get("include_sequences", True)
+        if not isinstance(include_sequences, bool):
+            raise tornado.web.HTTPError(
+                400, reason="'include_sequences' must be a boolean."
+            )
+        return {"fields": fields, "include_sequences": include_sequences}
+
     def write_error(self, status_code: int, **kwargs):
         exc_info = kwargs.get("exc_info")
         if exc_info is not None:
@@ -25,7 +93,30 @@ class BaseInteropQueryHandler(tornado.web.RequestHandler):
             self.write({"error": self._reason})
 
 
+def build_gene_results(genes_info, regions):
+    gene_info_map = {g["id"]: g for g in genes_info}
+
+    results = []
+    for region in regions:
+        gid = region["id"]
+        ginfo = gene_info_map.get(gid, {})
+
+        results.append(
+            {
+                "gene_id": gid,
+                "name": ginfo.get("name"),
+                "bigg_id": ginfo.get("bigg_id"),
+                "locus_tag": ginfo.get("locus_tag"),
+                "mapped_to_genbank": ginfo.get("mapped_to_genbank"),
+                "genome_region": {k: v for k, v in region.items()},
+            }
+        )
+    return results
+
+
 class QueryByGeneHandler(BaseInteropQueryHandler):
+    stream_chunk_size = 1000
+
     async def post(self):
         print("interop-query: query-by-gene")
 
@@ -34,41 +125,36 @@ class QueryByGeneHandler(BaseInteropQueryHandler):
         if not isinstance(gene_names, list):
             raise tornado.web.HTTPError(400, reason="'ids' must be a list.")
 
-        gene_ids = [
-            row
-            for gene in gene_names
-            for row in utils.safe_query(gene_queries.get_gene_ids_for_gene_name, gene)
-        ]
+        projection = self._parse_projection(data)
 
-        if not gene_ids:
-            self.finish({"results": []})
+        gene_names = [str(gene) for gene in gene_names]
+        if self.wants_ndjson():
+            await self.stream_ndjson(self.iter_records(gene_names, projection))
             return
 
-        genes_info = utils.safe_query(gene_queries.get_genes, gene_ids)
-        gene_info_map = {g["id"]: g for g in genes_info}
-
-        regions = utils.safe_query(gene_queries.get_genome_region_for_gene_id, gene_ids)
-
-        results = []
-        for region in regions:
-            gid = region["id"]
-            ginfo = gene_info_map.get(gid, {})
-
-            results.append(
-                {
-                    "gene_id": gid,
-                    "name": ginfo.get("name"),
-                    "bigg_id": ginfo.get("bigg_id"),
-                    "locus_tag": ginfo.get("locus_tag"),
-                    "mapped_to_genbank": ginfo.get("mapped_to_genbank"),
-                    "genome_region": {k: v for k, v in region.items()},
-                }
-            )
+        matches, genes_info, regions = utils.do_safe_query(
+            gene_queries.get_genes_and_regions_for_gene_names, gene_names, **projection
+        )
+        results = build_gene_results(genes_info, regions)
 
-        self.finish({"results": results})
+        self.finish({"results": results, "matches": matches})
+
+    def iter_records(self, gene_names, projection):
+        """Yield a 'matches' record followed by the gene results, per chunk."""
+        for chunk in self.iter_chunks(gene_names):
+            if self._connection_closed:
+                return
+            matches, genes_info, regions = utils.do_safe_query(
+                gene_queries.get_genes_and_regions_for_gene_names, chunk, **projection
+            )
+            yield {"matches": matches}
+            yield from build_gene_results(genes_info, regions)
 
 
 class QueryByStrainHandler(BaseInteropQueryHandler):
+    # A single strain can already be very large.
+    stream_chunk_size = 1
+
     async def post(self):
         print("interop-query: query-by-strain")
 
@@ -77,22 +163,47 @@ class QueryByStrainHandler(BaseInteropQueryHandler):
         if not isinstance(accession_ids, list):
             raise tornado.web.HTTPError(400, reason="'ids' must be a list.")
 
+        projection = self._parse_projection(data)
+
+        accession_ids = [str(accession_id) for accession_id in accession_ids]
+        if self.wants_ndjson():
+            await self.stream_ndjson(self.iter_records(accession_ids, projection))
+            return
+
         if not accession_ids:
             self.finish({"results": []})
             return
 
-        results = []
-        for accession_id in accession_ids:
-            genome_results = utils.safe_query(
-                genome_queries.get_genomes_with_chromosomes,
-                accession_id,
-            )
-            results.extend(genome_results)
+        genomes_by_accession = utils.do_safe_query(
+            genome_queries.get_genomes_with_chromosomes_for_accessions,
+            accession_ids,
+            **projection,
+        )
+        results = [
+            genome_dict
+            for accession_id in accession_ids
+            for genome_dict in genomes_by_accession.get(accession_id, [])
+        ]
 
         self.finish({"results": results})
 
+    def iter_records(self, accession_ids, projection):
+        """Yield one genome per record, loading one chunk of strains at a time."""
+        for chunk in self.iter_chunks(accession_ids):
+            if self._connection_closed:
+                return
+            genomes_by_accession = utils.do_safe_query(
+                genome_queries.get_genomes_with_chromosomes_for_accessions,
+                chunk,
+                **projection,
+            )
+            for accession_id in chunk:
+                yield from genomes_by_accession.get(accession_id, [])
+
 
 class QueryByPairHandler(BaseInteropQueryHandler):
+    stream_chunk_size = 20
+
     async def post(self):
         print("interop-query: query-by-pair")
         data = self._parse_json()
@@ -109,53 +220,177 @@ class QueryByPairHandler(BaseInteropQueryHandler):
                     reason=f"Each element in 'pairs' must be an object with 'gene' and 'strain' keys (error at index {i}).",
                 )
 
-        pair_results = []
-        for pair in pairs:
-            gene_name = pair["gene"]
-            strain_id = str(pair["strain"])
+        projection = self._parse_projection(data)
 
-            gene_ids = [
-                row
-                for row in utils.safe_query(
-                    gene_queries.get_gene_ids_for_gene_name,
-                    gene_name,
-                )
-            ]
+        pairs = [(str(pair["gene"]), str(pair["strain"])) for pair in pairs]
+        if self.wants_ndjson():
+            await self.stream_ndjson(self.iter_records(pairs, projection))
+            return
 
-            if not gene_ids:
-                pair_results.append(
-                    {"gene": gene_name, "strain": strain_id, "genomes": []}
-                )
-                continue
+        pair_genomes = utils.do_safe_query(
+            genome_queries.get_genomes_for_gene_strain_pairs, pairs, **projection
+        )
+        pair_results = [
+            {"gene": gene_name, "strain": strain_id, "genomes": genomes}
+            for (gene_name, strain_id), genomes in zip(pairs, pair_genomes)
+        ]
 
-            genomes = utils.safe_query(
-                genome_queries.get_genomes_with_chromosomes,
-                accession_id=strain_id,
-                gene_id_filter=gene_ids,
-            )
+        self.finish({"pairs": pair_results})
 
-            pair_results.append(
-                {
-                    "gene": gene_name,
-                    "strain": strain_id,
-                    "genomes": genomes,
-                }
+    def iter_records(self, pairs, projection):
+        """Yield one pair per record, loading one chunk of pairs at a time."""
+        for chunk in self.iter_chunks(pairs):
+            if self._connection_closed:
+                return
+            pair_genomes = utils.do_safe_query(
+                genome_queries.get_genomes_for_gene_strain_pairs, chunk, **projection
             )
+            for (gene_name, strain_id), genomes in zip(chunk, pair_genomes):
+                yield {"gene": gene_name, "strain": strain_id, "genomes": genomes}
 
-        self.finish({"pairs": pair_results})
 
+class SequenceHandler(BaseInteropQueryHandler):
+    """Bulk lookup of the DNA and protein sequences of genome regions.
 
-class StrainListHandler(BaseInteropQueryHandler):
-    async def get(self):
-        print("interop-query: strain-list")
-        strains = utils.safe_query(genome_queries.get_all_genomes)
-        strains = [strain for strain in strains if strain is not None]
-        self.finish({"strains": strains})
+    Meant to be combined with coordinate-only queries that were made with
+    'include_sequences' set to false.
+    """
 
+    stream_chunk_size = 1000
+
+    async def post(self):
+        print("interop-query: sequences")
+
+        data = self._parse_json()
+        region_ids = data.get("ids")
+        if not isinstance(region_ids, list):
+            raise tornado.web.HTTPError(400, reason="'ids' must be a list.")
+        try:
+            region_ids = [int(region_id) for region_id in region_ids]
+        except (TypeError, ValueError):
+            raise tornado.web.HTTPError(400, reason="'ids' must be integers.")
+
+        if self.wants_ndjson():
+            await self.stream_ndjson(self.iter_records(region_ids))
+            return
+
+        sequences = utils.do_safe_query(
+            gene_queries.get_genome_region_sequences, region_ids
+        )
+        self.finish({"sequences": sequences})
+
+    def iter_records(self, region_ids):
+        """Yield one genome region per record, loading one chunk at a time."""
+        for chunk in self.iter_chunks(region_ids):
+            if self._connection_closed:
+                return
+            sequences = utils.do_safe_query(
+                gene_queries.get_genome_region_sequences, chunk
+            )
+            for region_id in chunk:
+                if region_id in sequences:
+                    yield {"id": region_id} | sequences[region_id]
+
+
+CATALOG_QUERIES = {
+    "strains": genome_queries.get_strain_catalog,
+    "genes": gene_queries.get_gene_name_catalog,
+}
+
+
+@query_utils.cache_per_database_version()
+def get_encoded_catalog(session, catalog_name):
+    """Get a catalog together with its encoded and compressed full response."""
+    items = CATALOG_QUERIES[catalog_name](session)
+    body = json.dumps({catalog_name: items}).encode("utf-8")
+    return {
+        "items": items,
+        "lowered": [x.lower() for x in items],
+        "body": body,
+        "body_gzip": gzip.compress(body),
+        "etag": sha1(body).hexdigest(),
+    }
+
+
+class CatalogHandler(BaseInteropQueryHandler):
+    """Serves a sorted list of names that is built once per database version.
+
+    Without query arguments the full, precompressed catalog is returned. The
+    optional 'prefix' (case-insensitive), 'offset' and 'limit' query arguments
+    select a part of the catalog, in which case the total number of matching
+    names is included in the response.
+    """
+
+    catalog_name = None
+
+    def _get_int_argument(self, name):
+        value = self.get_query_argument(name, None)
+        if value is None:
+            return None
+        try:
+            value = int(value)
+        except ValueError:
+            value = -1
+        if value < 0:
+            raise tornado.web.HTTPError(
+                400, reason=f"'{name}' must be a non-negative integer."
+            )
+        return value
+
+    def _write_json_body(self, body, etag, body_gzip=None):
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("Vary", "Accept-Encoding")
+        self.set_header("Etag", f'"{etag}"')
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+            return
+        if "gzip" in self.request.headers.get("Accept-Encoding", ""):
+            if body_gzip is None:
+                body_gzip = gzip.compress(body)
+            self.set_header("Content-Encoding", "gzip")
+            body = body_gzip
+        self.finish(body)
 
-class GeneListHandler(BaseInteropQueryHandler):
     async def get(self):
-        print("interop-query: gene-list")
-        genes = utils.safe_query(gene_queries.get_all_genes)
-        gene_names = [gene["name"] for gene in genes if gene["name"] is not None]
-        self.finish({"genes": gene_names})
+        print(f"interop-query: {self.catalog_name}-list")
+        prefix = self.get_query_argument("prefix", "")
+        offset = self._get_int_argument("offset") or 0
+        limit = self._get_int_argument("limit")
+
+        catalog = utils.do_safe_query(get_encoded_catalog, self.catalog_name)
+        if not prefix and offset == 0 and limit is None:
+            self._write_json_body(
+                catalog["body"], catalog["etag"], body_gzip=catalog["body_gzip"]
+            )
+            return
+
+        items = catalog["items"]
+        if prefix:
+            lowered_prefix = prefix.lower()
+            start = bisect_left(catalog["lowered"], lowered_prefix)
+            end = bisect_left(catalog["lowered"], lowered_prefix + "\U0010ffff")
+            items = items[start:end]
+        page = items[offset:] if limit is None else items[offset : offset + limit]
+
+        body = json.dumps(
+            {
+                self.catalog_name: page,
+                "total": len(items),
+                "offset": offset,
+                "limit": limit,
+            }
+        ).encode("utf-8")
+        etag = sha1(
+            f"{catalog['etag']}:{prefix}:{offset}:{limit}".encode("utf-8")
+        ).hexdigest()
+        self._write_json_body(body, etag)
+
+
+class StrainListHandler(CatalogHandler):
+    catalog_name = "strains"
+
+
+class GeneListHandler(CatalogHandler):
+    catalog_name = "genes"
@@ -1,11 +1,15 @@
+from concurrent import futures
+import contextvars
 from typing import Any, Dict
+from tornado.ioloop import IOLoop
 from tornado.web import HTTPError
+from biggr_models import __api_version__ as api_v
 from biggr_models.handlers import utils
 from escher import plots
 import json
 from cobradb.api.escher import ESCHER_MODULE_DEFINITIONS
 
-from biggr_models.queries.escher_queries import get_model_reactions_for_escher_map
+from biggr_models.queries.escher_queries import check_escher_map, get_escher_map
 
 ESCHER_CSS = """svg.escher-svg #mouse-node {
   fill: none;
@@ -169,8 +173,16 @@ def builder_to_html_string(builder: plots.Builder, **kwargs):
     html = template.render(
         escher_url=plots.get_url("escher_min"),
         embedded_css_b64=embedded_css_b64,
-        map_data_json_b64=plots.b64dump(builder._loaded_map_json),
-        model_data_json_b64=plots.b64dump(builder._loaded_model_json),
+        map_data_json_b64=(
+            plots.b64dump(builder._loaded_map_json)
+            if builder._loaded_map_json is not None
+            else None
+        ),
+        model_data_json_b64=(
+            plots.b64dump(builder._loaded_model_json)
+            if builder._loaded_model_json is not None
+            else None
+        ),
         options_json_b64=plots.b64dump(options_json),
         **kwargs
     )
@@ -185,19 +197,36 @@ class EscherHandler(utils.BaseHandler):
         self.name = kwargs.get("name")
 
     def prepare(self):
+        super().prepare()
         self.api = self.path_kwargs.get("api") is not None
 
-    def get(self, model_bigg_id: str, map_bigg_id: str, **kwargs):
-        escher_module = ESCHER_MODULE_DEFINITIONS.get(map_bigg_id)
-        if escher_module is None:
+    async def get(self, model_bigg_id: str, map_bigg_id: str, **kwargs):
+        if map_bigg_id not in ESCHER_MODULE_DEFINITIONS:
             raise HTTPError(status_code=404, reason="Map BiGG ID not found.")
-        model_reactions = utils.do_safe_query(
-            get_model_reactions_for_escher_map, model_bigg_id, map_bigg_id
-        )
-        escher_map = utils.do_safe_query(escher_module.build_map, model_reactions)
-        escher_map.fit_canvas(expand_only=False)
-        escher_map_json = escher_map.to_escher()
         if self.api:
+            # Wait for the map off the event loop, it may be built in the build pool
+            try:
+                escher_map = await IOLoop.current().run_in_executor(
+                    None,
+                    contextvars.copy_context().run,
+                    utils.do_safe_query,
+                    get_escher_map,
+                    model_bigg_id,
+                    map_bigg_id,
+                )
+            except futures.TimeoutError:
+                self.set_status(503, reason="The map is being built, try again later.")
+                self.set_header("Retry-After", "10")
+                self.finish()
+                return
+            self.set_header("Cache-Control", "no-cache")
+            self.set_header("Vary", "Accept-Encoding")
+            self.set_header("Etag", escher_map.etag)
+            if self.check_etag_header():
+                self.set_status(304)
+                self.finish()
+                return
+            self.set_header("Content-Type", "application/json; charset=utf-8")
             if (
                 str(self.get_query_argument("download", default="false")).lower()
                 == "true"
@@ -206,30 +235,31 @@ class EscherHandler(utils.BaseHandler):
                 self.set_header(
                     "Content-Disposition", 'attachment; filename="biggr_reactions.json"'
                 )
-            self.write(escher_map_json)
-            self.finish()
+            body = escher_map.body
+            if "gzip" in self.request.headers.get("Accept-Encoding", ""):
+                self.set_header("Content-Encoding", "gzip")
+                body = escher_map.body_gzip
+            self.finish(body)
         else:
+            # The page only holds the builder options, the map itself is loaded
+            # from the API route so that the browser can cache it separately.
+            utils.do_safe_query(check_escher_map, model_bigg_id, map_bigg_id)
             sel_reactions = set(self.get_query_arguments("reaction"))
             reaction_data = None
-            zoom_to_element = None
+            zoom_to_reaction = None
             if sel_reactions:
                 reaction_data = {rx: 1 for rx in sel_reactions}
                 if len(sel_reactions) == 1:
-                    zoom_reaction_bigg_id = sel_reactions.pop()
-                    zoom_to_element_id = next(
-                        (
-                            k
-                            for k, x in escher_map.reactions.items()
-                            if x.bigg_id == zoom_reaction_bigg_id
-                        ),
-                        None,
-                    )
-                    if zoom_to_element_id is not None:
-                        zoom_to_element = {"type": "reaction", "id": zoom_to_element_id}
+                    zoom_to_reaction = sel_reactions.pop()
+            map_data_url = f"/api/{api_v}/models/{model_bigg_id}/escher/{map_bigg_id}"
+            builder_opts = dict(
+                model_bigg_id=model_bigg_id,
+                map_data_url=map_data_url,
+                zoom_to_reaction=zoom_to_reaction,
+            )
 
             if str(self.get_query_argument("edit", default="false")).lower() == "true":
                 self.write_map(
-                    json.dumps(escher_map_json),
                     menu="all",
                     scroll_behavior="pan",
                     never_ask_before_quit=False,
@@ -238,13 +268,11 @@ class EscherHandler(utils.BaseHandler):
                     reaction_data=reaction_data,
                     reaction_styles=["color"],
                     metabolite_styles=["color"],
-                    zoom_to_element=zoom_to_element,
                     embedded_css=ESCHER_CSS,
-                    builder_opts=dict(model_bigg_id=model_bigg_id),
+                    builder_opts=builder_opts,
                 )
             else:
                 self.write_map(
-                    json.dumps(escher_map_json),
                     menu="zoom",
                     scroll_behavior=None,
                     never_ask_before_quit=True,
@@ -253,12 +281,11 @@ class EscherHandler(utils.BaseHandler):
                     reaction_data=reaction_data,
                     reaction_styles=["color"],
                     metabolite_styles=["color"],
-                    zoom_to_element=zoom_to_element,
                     embedded_css=ESCHER_CSS,
-                    builder_opts=dict(model_bigg_id=model_bigg_id),
+                    builder_opts=builder_opts,
                 )
 
-    def write_map(self, map_json: str, builder_opts: Dict[str, Any] = {}, **kwargs):
-        builder = plots.Builder(map_json=map_json, **kwargs)
+    def write_map(self, builder_opts: Dict[str, Any] = {}, **kwargs):
+        builder = plots.Builder(**kwargs)
         html = builder_to_html_string(builder, **builder_opts)
         self.write(html)
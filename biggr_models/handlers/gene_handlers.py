@@ -1,7 +1,7 @@
 from typing import Optional
 from cobradb.models import Chromosome, Gene, Genome, Model, ModelGene
 from biggr_models.handlers import utils
-from biggr_models.queries import gene_queries
+from biggr_models.queries import gene_queries, listing_queries
 
 
 class GeneListViewHandler(utils.DataHandler):
@@ -46,8 +46,12 @@ class GeneListViewHandler(utils.DataHandler):
         ),
     ]
 
+    listing = listing_queries.register_listing(
+        "biggr_model_gene_listing", column_specs, "model__bigg_id"
+    )
+
     def pre_filter(self, query):
-        return query.filter(Model.bigg_id == self.model_bigg_id)
+        return query.filter(self.column_expression(Model.bigg_id) == self.model_bigg_id)
 
     def breadcrumbs(self):
         return [
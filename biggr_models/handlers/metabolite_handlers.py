@@ -15,7 +15,11 @@ from cobradb.models import (
 )
 from sqlalchemy import func, select
 from biggr_models.handlers import utils
-from biggr_models.queries import metabolite_queries, utils as query_utils
+from biggr_models.queries import (
+    listing_queries,
+    metabolite_queries,
+    utils as query_utils,
+)
 
 import re
 
@@ -103,8 +107,12 @@ class MetaboliteListViewHandler(utils.DataHandler):
         ),
     ]
 
+    listing = listing_queries.register_listing(
+        "biggr_model_metabolite_listing", column_specs, "model__bigg_id"
+    )
+
     def pre_filter(self, query):
-        return query.filter(Model.bigg_id == self.model_bigg_id)
+        return query.filter(self.column_expression(Model.bigg_id) == self.model_bigg_id)
 
     def breadcrumbs(self):
         return [
@@ -1,7 +1,14 @@
 from cobradb.models import Model, ModelCount, ModelCollection
 from biggr_models.handlers import utils
-from biggr_models.queries import model_queries
+from biggr_models.queries import (
+    memote_queries,
+    model_file_queries,
+    model_queries,
+    taxonomy_queries,
+)
+from biggr_models.queries import utils as query_utils
 from os import path
+from typing import Optional, Tuple
 
 
 class ModelsListViewHandler(utils.DataHandler):
@@ -172,16 +179,94 @@ class ModelHandler(utils.BaseHandler):
         self.return_result(result)
 
 
+class EscherModulesForModelHandler(utils.BaseHandler):
+    def get(self, model_bigg_id):
+        result = utils.do_safe_query(
+            model_queries.get_escher_modules_for_model, model_bigg_id
+        )
+        self.write({"model_bigg_id": model_bigg_id, "escher_modules": result})
+        self.finish()
+
+
+class MemoteFlagsForModelHandler(utils.BaseHandler):
+    def get(self, model_bigg_id):
+        result = utils.do_safe_query(
+            memote_queries.get_memote_flags_for_model, model_bigg_id
+        )
+        self.write(result)
+        self.finish()
+
+
+class ModelFilesHandler(utils.BaseHandler):
+    def get(self, model_bigg_id):
+        try:
+            files = model_file_queries.get_model_files(
+                model_bigg_id, utils.static_model_dir
+            )
+        except query_utils.NotFoundError as e:
+            raise utils.HTTPError(status_code=404, reason=e.args[0])
+        self.write({"model_bigg_id": model_bigg_id, "files": files})
+        self.finish()
+
+
+class ModelFileListingHandler(utils.BaseHandler):
+    def get(self):
+        self.write(
+            {
+                "results": model_file_queries.get_model_file_listing(
+                    utils.static_model_dir
+                )
+            }
+        )
+        self.finish()
+
+
+class TaxonModelsHandler(utils.BaseHandler):
+    def get(self, taxon):
+        result = utils.do_safe_query(taxonomy_queries.get_models_under_taxon, taxon)
+        self.write(result)
+        self.finish()
+
+
+class TaxonCollectionsHandler(utils.BaseHandler):
+    def get(self, taxon):
+        result = utils.do_safe_query(
+            taxonomy_queries.get_collections_under_taxon, taxon
+        )
+        self.write(result)
+        self.finish()
+
+
 class ModelCollectionsTreeViewHandler(utils.BaseHandler):
     template = utils.env.get_template("modelcollections_treeview.html")
+    # The last rendered page, as (etag, html)
+    _rendered: Optional[Tuple[str, str]] = None
 
     def get(self):
         result = utils.do_safe_query(
             model_queries.get_model_collections_and_taxons,
         )
-        result["breadcrumbs"] = [
-            ("Home", "/"),
-            ("Collections", "/collections/"),
-        ]
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("Etag", result["etag"])
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+            return
 
-        self.return_result(result)
+        if self.request.uri.startswith("/api"):
+            self.write({"tree": result["tree"]})
+            self.finish()
+            return
+
+        rendered = ModelCollectionsTreeViewHandler._rendered
+        if rendered is None or rendered[0] != result["etag"]:
+            html = self.template.render(
+                tree=result["tree"],
+                breadcrumbs=[
+                    ("Home", "/"),
+                    ("Collections", "/collections/"),
+                ],
+            )
+            rendered = (result["etag"], html)
+            ModelCollectionsTreeViewHandler._rendered = rendered
+        self.finish(rendered[1])
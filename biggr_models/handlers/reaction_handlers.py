@@ -6,8 +6,9 @@ from cobradb.models import (
     UniversalReaction,
 )
 from biggr_models.handlers import utils
-from biggr_models.queries import reaction_queries, utils as query_utils
+from biggr_models.queries import listing_queries, reaction_queries, utils as query_utils
 import re
+from typing import Optional
 from cobradb.parse import hash_metabolite_dictionary
 
 
@@ -68,10 +69,59 @@ class UniversalReactionHandler(utils.BaseHandler):
                     f"/universal/reactions/{reaction_bigg_id}",
                 ),
             ]
+            if not self.request.uri.startswith("/api"):
+                # Only the page draws the table, the API returns plain data
+                result["reaction_in_models_url"] = (
+                    f"/universal/reaction_in_models/{reaction_bigg_id}"
+                )
+                result["reaction_in_models_columns"] = (
+                    ReactionInModelsListViewHandler.column_specs
+                )
 
             self.return_result(result)
 
 
+class ReactionInModelsListViewHandler(utils.DataHandler):
+    title = "Reaction in Models"
+    bigg_id: Optional[str] = None
+    page_data = {
+        "row_icon": "model_S",
+    }
+    column_specs = [
+        utils.DataColumnSpec(
+            ModelReaction.bigg_id,
+            "BiGG ID",
+            hyperlink="/models/${row['model__bigg_id']}/reactions/${row['modelreaction__bigg_id']}",
+            priority=1,
+        ),
+        utils.DataColumnSpec(
+            Model.bigg_id,
+            "Model",
+            hyperlink="/models/${row['model__bigg_id']}",
+            requires=[ModelReaction.model],
+            priority=0,
+        ),
+        utils.DataColumnSpec(
+            Model.organism,
+            "Organism",
+            requires=[ModelReaction.model],
+            priority=2,
+        ),
+    ]
+
+    def pre_filter(self, query):
+        return (
+            query.join(ModelReaction.reaction)
+            .join(Reaction.universal_reaction)
+            .filter(UniversalReaction.bigg_id == self.bigg_id)
+        )
+
+    def post_filter(self, query):
+        # Most rows share the BiGG ID of the default order, break the ties so
+        # that the pages do not overlap
+        return query.order_by(Model.bigg_id, ModelReaction.id)
+
+
 class ReactionListViewHandler(utils.DataHandler):
     title = "Reactions"
     model_bigg_id = None
@@ -111,8 +161,12 @@ class ReactionListViewHandler(utils.DataHandler):
         ),
     ]
 
+    listing = listing_queries.register_listing(
+        "biggr_model_reaction_listing", column_specs, "model__bigg_id"
+    )
+
     def pre_filter(self, query):
-        return query.filter(Model.bigg_id == self.model_bigg_id)
+        return query.filter(self.column_expression(Model.bigg_id) == self.model_bigg_id)
 
     def breadcrumbs(self):
         return [
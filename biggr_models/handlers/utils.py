@@ -1,6 +1,8 @@
+from copy import copy
 from datetime import datetime
 from operator import itemgetter
 import re
+import time
 from typing import (
     Any,
     Callable,
@@ -16,6 +18,7 @@ from typing import (
 from cobradb.models import Base, Session
 from sqlalchemy import Row, and_, or_
 from sqlalchemy.sql.expression import Select
+from biggr_models import instrumentation, monitoring
 from biggr_models.queries import utils as query_utils
 import json
 from tornado.web import (
@@ -29,7 +32,6 @@ from os import path
 import mimetypes
 from pprint import pprint
 
-
 MODELS_CLASS_MAP = {x.__name__: x for x in Base.__subclasses__()}
 
 
@@ -184,6 +186,7 @@ def format_gene_reaction_rule(grr: str) -> str:
 
 # set up jinja2 template location
 env = Environment(loader=PackageLoader("biggr_models", "templates"))
+env.template_class = instrumentation.TimedTemplate
 env.filters["format_reference"] = lambda x: format_reference(x)
 env.filters["format_id"] = format_bigg_id
 env.filters["format_gene_reaction_rule"] = format_gene_reaction_rule
@@ -197,14 +200,23 @@ static_model_dir = path.join(directory, "static", "models")
 def safe_query(func, *args, **kwargs):
     session = Session()
     kwargs["session"] = session
+    start = time.perf_counter()
     try:
         return func(*args, **kwargs)
     except query_utils.NotFoundError as e:
         raise HTTPError(status_code=404, reason=e.args[0])
     except ValueError as e:
         raise HTTPError(status_code=400, reason=e.args[0])
+    except Exception:
+        monitoring.inc("biggr_query_errors_total", query=func.__name__)
+        raise
     finally:
         session.close()
+        monitoring.observe(
+            "biggr_query_duration_seconds",
+            time.perf_counter() - start,
+            query=func.__name__,
+        )
 
 
 # This type annotation is only available for python 3.12+
@@ -233,30 +245,62 @@ def do_safe_query(func, *args, **kwargs):
 
     """
     session = Session()
+    start = time.perf_counter()
     try:
         return func(session, *args, **kwargs)
     except query_utils.NotFoundError as e:
         raise HTTPError(status_code=404, reason=e.args[0])
     except ValueError as e:
         raise HTTPError(status_code=400, reason=e.args[0])
+    except Exception:
+        monitoring.inc("biggr_query_errors_total", query=func.__name__)
+        raise
     finally:
         session.close()
+        monitoring.observe(
+            "biggr_query_duration_seconds",
+            time.perf_counter() - start,
+            query=func.__name__,
+        )
 
 
 class BaseHandler(RequestHandler):
     """Base RequestHandler that handles standard requests."""
 
+    metrics: Optional[instrumentation.RequestMetrics] = None
+
     def set_default_headers(self):
         self.set_header("Access-Control-Allow-Origin", "*")
         self.set_header("Access-Control-Allow-Headers", "x-requested-with")
         self.set_header("Access-Control-Allow-Methods", "POST, GET, OPTIONS")
 
+    def prepare(self):
+        self.metrics = instrumentation.start_request()
+
+    def finish(self, chunk=None):
+        if self.metrics is not None and not self._headers_written:
+            if chunk is not None:
+                self.write(chunk)
+                chunk = None
+            self.set_header("Server-Timing", self.metrics.server_timing())
+        return super().finish(chunk)
+
+    def on_finish(self):
+        monitoring.InstrumentedApplication.request_done(self.request)
+        if self.metrics is not None:
+            instrumentation.log_request(self, self.metrics)
+
+    def on_connection_close(self):
+        super().on_connection_close()
+        monitoring.InstrumentedApplication.request_done(self.request)
+
     def write(self, chunk):
         # note that serving a json list is a security risk
         # This is meant to be serving public-read only data only.
         if isinstance(chunk, (dict, list, tuple, Base)):
             try:
-                value_str = json.dumps(chunk, cls=BiGGrJSONEncoder)
+                with instrumentation.timed("json"):
+                    value_str = json.dumps(chunk, cls=BiGGrJSONEncoder)
             except Exception as e:
                 pprint(chunk)
                 print(e)
@@ -461,9 +505,12 @@ class DataColumnSpec:
         search_query_remove_namespace: bool = False,
         priority: Optional[int] = None,
         visible: bool = True,
+        identifier: Optional[str] = None,
     ):
         self.prop = prop
-        self.identifier: str = str(prop).lower().replace(".", "__")
+        if identifier is None:
+            identifier = str(prop).lower().replace(".", "__")
+        self.identifier: str = identifier
         self.name: str = name
         self.global_search = global_search
         self.requires: List[Any] = []
@@ -505,6 +552,19 @@ class DataColumn:
     def __getattr__(self, name):
         return getattr(self.spec, name)
 
+    def for_listing(self, table) -> "DataColumn":
+        """Return a copy of this column that targets the column of a listing table.
+
+        The copy keeps the identifier and the user specified filters, but selects
+        the listing column of the same name instead of joining the source tables.
+        """
+        spec = copy(self.spec)
+        spec.prop = table.c[self.spec.identifier]
+        spec.requires = []
+        column = DataColumn(spec)
+        column.__dict__.update({k: v for k, v in self.__dict__.items() if k != "spec"})
+        return column
+
     def search(self, query):
         if self.search_value != "":
             print(f"{self.identifier}: '{self.search_value}' ({self.search_type})")
@@ -537,6 +597,9 @@ def get_reverse_url(handler, name, path_kwargs):
 _TT = TypeVar("_TT")
 _TD = TypeVar("_TD")
 
+# Page length used by DataTables.js when none is configured
+DEFAULT_PAGE_LENGTH = 10
+
 
 class DataHandler(BaseHandler):
     """Request handler that implements data tables (API) logic."""
@@ -553,11 +616,54 @@ class DataHandler(BaseHandler):
     search_regex: bool = False
     api: bool = False
     page_data: Optional[Dict[str, Any]] = None
+    # Optional denormalized copy of the table rows (see queries.listing_queries),
+    # it is used instead of the joins of column_specs once it has been built.
+    listing: Optional[Any] = None
+    listing_table: Optional[Any] = None
 
     def initialize(self, **kwargs):
         self.columns = [DataColumn(col_spec) for col_spec in self.column_specs]
         self.name = kwargs.get("name")
 
+    @classmethod
+    def first_page(
+        cls, session: Session, length: int = DEFAULT_PAGE_LENGTH, **attributes
+    ) -> Dict[str, Any]:
+        """Query the first page of the table outside of a request.
+
+        This allows detail pages to embed the counts and first rows of a table,
+        so that the table does not need a request before it is first drawn.
+        The rows are ordered by the first column, like the initial draw.
+
+        Parameters
+        ----------
+        session: Session
+            The database session.
+        length: int
+            Number of rows to return.
+        **attributes
+            Handler attributes used by the filters, normally the path arguments
+            (e.g. bigg_id).
+
+        Returns
+        -------
+        dict
+            The data tables response: data, recordsTotal and recordsFiltered.
+        """
+        handler = cls.__new__(cls)
+        for k, v in attributes.items():
+            setattr(handler, k, v)
+        columns = [DataColumn(col_spec) for col_spec in cls.column_specs]
+        columns[0].order_priority = 0
+        data, total, filtered = query_utils.get_list(
+            session,
+            columns,
+            length=length,
+            pre_filter=handler.pre_filter,
+            post_filter=handler.post_filter,
+        )
+        return {"recordsTotal": total, "recordsFiltered": filtered, "data": data}
+
     def breadcrumbs(self) -> Any:
         return None
 
@@ -567,6 +673,12 @@ class DataHandler(BaseHandler):
     def post_filter(self, query):
         return query
 
+    def column_expression(self, prop):
+        """Return prop, or the listing column of the same name when it is used."""
+        if self.listing_table is None:
+            return prop
+        return self.listing_table.c[str(prop).lower().replace(".", "__")]
+
     def get(self, *args, **kwargs):
         if self.api:
             return self.return_data(*args, **kwargs)
@@ -688,6 +800,7 @@ class DataHandler(BaseHandler):
             i += 1
 
     def prepare(self):
+        super().prepare()
         for k, v in self.path_kwargs.items():
             if hasattr(self, k):
                 setattr(self, k, v)
@@ -706,9 +819,17 @@ class DataHandler(BaseHandler):
             post_filter=self.post_filter,
         )
         opts = opts | kwargs
+        if self.listing is not None:
+            return do_safe_query(self._listing_data_query, f, **opts)
         results = do_safe_query(f, **opts)
         return results
 
+    def _listing_data_query(self, session, f, column_specs, **kwargs):
+        self.listing_table = self.listing.get_table(session)
+        if self.listing_table is not None:
+            column_specs = [col.for_listing(self.listing_table) for col in column_specs]
+        return f(session, column_specs=column_specs, **kwargs)
+
     def write_data(self, data: Any, total_count: int, filtered_count: int):
         result = {
             "recordsTotal": total_count,
@@ -0,0 +1,175 @@
+"""Request scoped instrumentation of database queries, rendering and serialization.
+
+When enabled (``--server_timing``), every request collects the number of SQL
+statements, the time spent executing them and the number of returned rows, as
+well as the time spent rendering templates and encoding JSON. The numbers are
+sent as a ``Server-Timing`` header and printed as one JSON log line.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+enabled = False
+
+
+@dataclass
+class RequestMetrics:
+    """Metrics of a single request.
+
+    Queries of a request may run in several threads (see
+    ``queries.utils.run_concurrently``), so all updates hold a lock.
+    """
+
+    start: float = field(default_factory=time.perf_counter)
+    statements: int = 0
+    rows: int = 0
+    db_time: float = 0.0
+    durations: Dict[str, float] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add_statement(self, duration: float, rows: int):
+        with self._lock:
+            self.statements += 1
+            self.db_time += duration
+            if rows > 0:
+                self.rows += rows
+
+    def add_duration(self, name: str, duration: float):
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + duration
+
+    def server_timing(self) -> str:
+        """Format the metrics as Server-Timing header value, durations in ms."""
+        total = time.perf_counter() - self.start
+        with self._lock:
+            parts = [
+                'db;dur=%.1f;desc="%d queries, %d rows"'
+                % (self.db_time * 1000, self.statements, self.rows)
+            ]
+            parts.extend(
+                "%s;dur=%.1f" % (name, duration * 1000)
+                for name, duration in self.durations.items()
+            )
+            accounted = self.db_time + sum(self.durations.values())
+        # everything else, e.g. ORM hydration and the handler's own code
+        parts.append("app;dur=%.1f" % (max(total - accounted, 0.0) * 1000))
+        parts.append("total;dur=%.1f" % (total * 1000))
+        return ", ".join(parts)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "statements": self.statements,
+                "rows": self.rows,
+                "db_ms": round(self.db_time * 1000, 1),
+                **{
+                    f"{name}_ms": round(duration * 1000, 1)
+                    for name, duration in self.durations.items()
+                },
+                "total_ms": round((time.perf_counter() - self.start) * 1000, 1),
+            }
+
+
+_current_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar(
+    "current_metrics", default=None
+)
+
+
+def start_request() -> Optional[RequestMetrics]:
+    """Start collecting metrics for the request running in the current context."""
+    if not enabled:
+        return None
+    metrics = RequestMetrics()
+    _current_metrics.set(metrics)
+    return metrics
+
+
+def current() -> Optional[RequestMetrics]:
+    return _current_metrics.get()
+
+
+@contextmanager
+def timed(name: str):
+    """Add the duration of the block to the metrics of the current request."""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_duration(name, time.perf_counter() - start)
+
+
+def log_request(handler, metrics: RequestMetrics):
+    print(
+        json.dumps(
+            {
+                "event": "request",
+                "method": handler.request.method,
+                "uri": handler.request.uri,
+                "handler": handler.__class__.__name__,
+                "status": handler.get_status(),
+                **metrics.as_dict(),
+            }
+        )
+    )
+
+
+class TimedTemplate(Template):
+    """Jinja template that adds its render time to the current request."""
+
+    def render(self, *args, **kwargs):
+        with timed("render"):
+            return super().render(*args, **kwargs)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_metrics.get() is not None:
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+    metrics.add_statement(duration, getattr(cursor, "rowcount", -1))
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute, drop its start
+    # time so that the next statement on the connection is timed correctly
+    if context.connection is None:
+        return
+    start_times = context.connection.info.get("query_start_time")
+    if not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.add_statement(duration, -1)
+
+
+def install():
+    """Enable the instrumentation, this hooks into all SQLAlchemy engines."""
+    global enabled
+    if enabled:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    enabled = True
@@ -0,0 +1,358 @@
+"""Prometheus metrics of the web server, aggregated over all server processes.
+
+Each process keeps its own counters, histograms and gauges, and periodically
+writes a snapshot of them to ``metrics_dir``, one directory per server port.
+The ``/metrics`` endpoint sums the counters and histograms of the snapshots of
+all live processes, and reports the gauges per process, in the Prometheus text
+exposition format.
+
+Requests of all handlers (including the static file handlers) are recorded by
+``InstrumentedApplication``, queries by ``handlers.utils.safe_query`` and
+``do_safe_query``. The metrics are off by default, the server's ``--metrics``
+option enables them.
+"""
+
+from bisect import bisect_left
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.web import Application, RequestHandler
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds between two snapshots written by each process
+SNAPSHOT_INTERVAL = 5.0
+# Snapshots older than this are from processes that are gone
+SNAPSHOT_MAX_AGE = 60.0
+# Seconds between two event loop lag measurements
+EVENT_LOOP_LAG_INTERVAL = 0.5
+
+metrics_dir = os.path.join(tempfile.gettempdir(), "biggr_metrics")
+process_label = str(os.getpid())
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_counters: Dict[str, Dict[Labels, float]] = {}
+_histograms: Dict[str, Dict[Labels, List[float]]] = {}
+_gauges: Dict[str, Dict[Labels, float]] = {}
+# name -> (type, help)
+_descriptions: Dict[str, Tuple[str, str]] = {
+    "biggr_http_requests_total": ("counter", "Finished HTTP requests."),
+    "biggr_http_request_duration_seconds": (
+        "histogram",
+        "Duration of HTTP requests.",
+    ),
+    "biggr_http_requests_in_flight": ("gauge", "HTTP requests being handled."),
+    "biggr_query_duration_seconds": ("histogram", "Duration of database queries."),
+    "biggr_query_errors_total": ("counter", "Failed database queries."),
+    "biggr_db_pool_checkout_duration_seconds": (
+        "histogram",
+        "Time spent waiting for a pooled database connection.",
+    ),
+    "biggr_cache_hits_total": ("counter", "Hits of the per-version query caches."),
+    "biggr_cache_misses_total": ("counter", "Misses of the per-version query caches."),
+    "biggr_event_loop_lag_seconds": (
+        "gauge",
+        "Delay of the last event loop lag probe callback.",
+    ),
+    "biggr_event_loop_lag_max_seconds": (
+        "gauge",
+        "Largest event loop lag since the previous snapshot.",
+    ),
+}
+
+
+def _labels(**labels) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    key = _labels(**labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0.0) + value
+
+
+def set_gauge(name: str, value: float, **labels):
+    with _lock:
+        _gauges.setdefault(name, {})[_labels(**labels)] = value
+
+
+def observe(name: str, value: float, **labels):
+    """Add a value to a histogram with LATENCY_BUCKETS."""
+    key = _labels(**labels)
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        # one count per bucket, followed by the sum and the total count
+        values = series.get(key)
+        if values is None:
+            values = series[key] = [0.0] * (len(LATENCY_BUCKETS) + 2)
+        i = bisect_left(LATENCY_BUCKETS, value)
+        if i < len(LATENCY_BUCKETS):
+            values[i] += 1
+        values[-2] += value
+        values[-1] += 1
+
+
+def snapshot() -> dict:
+    from biggr_models.queries import utils as query_utils
+
+    for name, stats in query_utils.get_cache_stats().items():
+        with _lock:
+            _counters.setdefault("biggr_cache_hits_total", {})[_labels(cache=name)] = (
+                stats["hits"]
+            )
+            _counters.setdefault("biggr_cache_misses_total", {})[
+                _labels(cache=name)
+            ] = stats["misses"]
+    with _lock:
+        return {
+            "time": time.time(),
+            "process": process_label,
+            "counters": {
+                name: [[list(k), v] for k, v in series.items()]
+                for name, series in _counters.items()
+            },
+            "histograms": {
+                name: [[list(k), list(v)] for k, v in series.items()]
+                for name, series in _histograms.items()
+            },
+            "gauges": {
+                name: [[list(k), v] for k, v in series.items()]
+                for name, series in _gauges.items()
+            },
+        }
+
+
+def write_snapshot():
+    os.makedirs(metrics_dir, exist_ok=True)
+    data = snapshot()
+    # the worst event loop lag is reported per snapshot interval
+    with _lock:
+        _gauges.pop("biggr_event_loop_lag_max_seconds", None)
+    path = os.path.join(metrics_dir, f"{process_label}.json")
+    fd, tmp_path = tempfile.mkstemp(dir=metrics_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read_snapshots() -> List[dict]:
+    snapshots = []
+    now = time.time()
+    try:
+        names = os.listdir(metrics_dir)
+    except OSError:
+        return snapshots
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(metrics_dir, name)
+        try:
+            if now - os.path.getmtime(path) > SNAPSHOT_MAX_AGE:
+                os.remove(path)
+                continue
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            '%s="%s"'
+            % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for k, v in labels
+        )
+        + "}"
+    )
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render(snapshots: List[dict]) -> str:
+    """Aggregate the snapshots to the Prometheus text format."""
+    counters: Dict[str, Dict[Labels, float]] = {}
+    histograms: Dict[str, Dict[Labels, List[float]]] = {}
+    gauges: Dict[str, Dict[Labels, float]] = {}
+    for data in snapshots:
+        for name, series in data["counters"].items():
+            target = counters.setdefault(name, {})
+            for labels, value in series:
+                key = tuple(map(tuple, labels))
+                target[key] = target.get(key, 0.0) + value
+        for name, series in data["histograms"].items():
+            target = histograms.setdefault(name, {})
+            for labels, values in series:
+                key = tuple(map(tuple, labels))
+                if key in target:
+                    target[key] = [a + b for a, b in zip(target[key], values)]
+                else:
+                    target[key] = list(values)
+        for name, series in data["gauges"].items():
+            target = gauges.setdefault(name, {})
+            for labels, value in series:
+                key = tuple(map(tuple, labels)) + (("process", data["process"]),)
+                target[key] = value
+
+    lines = []
+    for metrics, metric_type in (
+        (counters, "counter"),
+        (gauges, "gauge"),
+        (histograms, "histogram"),
+    ):
+        for name in sorted(metrics):
+            help_text = _descriptions.get(name, (metric_type, name))[1]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(metrics[name].items()):
+                if metric_type != "histogram":
+                    lines.append(
+                        f"{name}{_format_labels(labels)} {_format_value(value)}"
+                    )
+                    continue
+                cumulative = 0.0
+                for bound, count in zip(LATENCY_BUCKETS, value):
+                    cumulative += count
+                    bucket_labels = labels + (("le", str(bound)),)
+                    lines.append(
+                        f"{name}_bucket{_format_labels(bucket_labels)} "
+                        f"{_format_value(cumulative)}"
+                    )
+                bucket_labels = labels + (("le", "+Inf"),)
+                lines.append(
+                    f"{name}_bucket{_format_labels(bucket_labels)} "
+                    f"{_format_value(value[-1])}"
+                )
+                lines.append(
+                    f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}"
+                )
+                lines.append(
+                    f"{name}_count{_format_labels(labels)} {_format_value(value[-1])}"
+                )
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(RequestHandler):
+    def get(self):
+        write_snapshot()
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.finish(render(read_snapshots()))
+
+
+class InstrumentedApplication(Application):
+    """Application that records the latency, status and concurrency of all requests."""
+
+    _in_flight = 0
+
+    def find_handler(self, request, **kwargs):
+        request._biggr_in_flight = True
+        InstrumentedApplication._in_flight += 1
+        set_gauge("biggr_http_requests_in_flight", self._in_flight)
+        return super().find_handler(request, **kwargs)
+
+    @staticmethod
+    def request_done(request):
+        """Stop counting a request as in flight.
+
+        Called when the request is logged, and by the handlers when they finish
+        or the client disconnects, since a handler whose connection closed is
+        not always finished and logged. Only the first call counts.
+        """
+        if getattr(request, "_biggr_in_flight", False):
+            request._biggr_in_flight = False
+            InstrumentedApplication._in_flight -= 1
+            set_gauge(
+                "biggr_http_requests_in_flight", InstrumentedApplication._in_flight
+            )
+
+    def log_request(self, handler: RequestHandler):
+        super().log_request(handler)
+        self.request_done(handler.request)
+        route = handler.__class__.__name__
+        method = handler.request.method
+        status = handler.get_status()
+        inc(
+            "biggr_http_requests_total",
+            route=route,
+            method=method,
+            status_class=f"{status // 100}xx",
+        )
+        observe(
+            "biggr_http_request_duration_seconds",
+            handler.request.request_time(),
+            route=route,
+            method=method,
+        )
+
+
+def instrument_engine(engine):
+    """Measure how long sessions wait for a connection of the engine's pool."""
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return raw_connection(*args, **kwargs)
+        finally:
+            observe(
+                "biggr_db_pool_checkout_duration_seconds", time.perf_counter() - start
+            )
+
+    engine.raw_connection = timed_raw_connection
+
+
+def _probe_event_loop_lag():
+    expected = time.monotonic() + EVENT_LOOP_LAG_INTERVAL
+
+    def measure():
+        lag = max(time.monotonic() - expected, 0.0)
+        set_gauge("biggr_event_loop_lag_seconds", lag)
+        with _lock:
+            series = _gauges.setdefault("biggr_event_loop_lag_max_seconds", {})
+            series[()] = max(series.get((), 0.0), lag)
+
+    IOLoop.current().call_later(EVENT_LOOP_LAG_INTERVAL, measure)
+
+
+def start(
+    process: Optional[int] = None,
+    directory: Optional[str] = None,
+    port: Optional[int] = None,
+):
+    """Start the periodic snapshots and event loop lag probes of this process.
+
+    The snapshots are written to directory, by default to a subdirectory of
+    ``metrics_dir`` per port, so that the processes of one server share their
+    metrics, and servers on other ports do not.
+    """
+    global process_label, metrics_dir
+    if process is not None:
+        process_label = str(process)
+    if directory:
+        metrics_dir = directory
+    elif port is not None:
+        metrics_dir = os.path.join(metrics_dir, str(port))
+
+    from cobradb.models import Session
+
+    engine = Session.kw.get("bind")
+    if engine is not None:
+        instrument_engine(engine)
+
+    PeriodicCallback(_probe_event_loop_lag, EVENT_LOOP_LAG_INTERVAL * 1000).start()
+    PeriodicCallback(write_snapshot, SNAPSHOT_INTERVAL * 1000).start()
@@ -9,47 +9,397 @@ from cobradb.models import (
     NotFoundError,
     Reaction,
     ReactionMatrix,
+    Session as SessionFactory,
+    UniversalCompartmentalizedComponent,
+    UniversalComponent,
+    UniversalReaction,
+    UniversalReactionMatrix,
 )
-from sqlalchemy import select
-from sqlalchemy.orm import Session, joinedload, subqueryload
+from cobradb.api.escher import ESCHER_MODULE_DEFINITIONS
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import Session
+from biggr_models.queries import utils
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+import gzip
+from hashlib import sha1
+import json
+import multiprocessing
+from os.path import join
+import tempfile
+import threading
+from typing import Any, List, NamedTuple, Optional, Tuple
 
+# Number of built maps kept in memory by each server process
+ESCHER_MAP_CACHE_SIZE = 128
+# Built maps are also stored on disk, so that they are shared between the server
+# processes and survive restarts. Subdirectories are named after the database version.
+ESCHER_MAP_CACHE_DIR = join(tempfile.gettempdir(), "biggr_escher_cache")
 
-def get_model_reactions_for_escher_map(
-    session: Session, model_bigg_id: str, map_bigg_id: str
-):
-    model_db = session.scalars(
-        select(Model).filter(Model.bigg_id == model_bigg_id).limit(1)
-    ).first()
-    if model_db is None:
-        raise NotFoundError("Model not found.")
-    model_reactions = session.scalars(
-        select(ModelReaction)
-        .options(
-            joinedload(ModelReaction.reaction).options(
-                joinedload(Reaction.universal_reaction),
-                subqueryload(Reaction.matrix).options(
-                    joinedload(ReactionMatrix.universal_reaction_matrix),
-                    joinedload(ReactionMatrix.compartmentalized_component).options(
-                        joinedload(
-                            CompartmentalizedComponent.universal_compartmentalized_component
-                        ),
-                        joinedload(CompartmentalizedComponent.component).joinedload(
-                            Component.universal_component
+# Maps are laid out in separate processes, since building is CPU bound and would
+# block the server process. Builds that take longer than the timeout continue in
+# the background and are picked up from the disk cache by later requests.
+ESCHER_BUILD_PROCESSES = 2
+ESCHER_BUILD_CONCURRENCY = 4
+ESCHER_BUILD_TIMEOUT = 60.0
+
+_escher_build_pool: Optional[futures.ProcessPoolExecutor] = None
+_escher_build_pool_lock = threading.Lock()
+_escher_build_slots = threading.BoundedSemaphore(ESCHER_BUILD_CONCURRENCY)
+
+
+class EscherProjection:
+    """Lightweight stand-in for an ORM object, passed to the map builders.
+
+    Holds the column values of the object as attributes and the related objects
+    as projections (or lists of projections), so it is cheap to build and can
+    be pickled to the build processes.
+    """
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+    def __repr__(self):
+        return f"<EscherProjection bigg_id={self.__dict__.get('bigg_id')!r}>"
+
+
+class ProjectionNode(NamedTuple):
+    """An entity in the projection tree, attached to its parent as `name`."""
+
+    name: str
+    entity: Any
+    many: bool = False
+    children: Tuple["ProjectionNode", ...] = ()
+
+
+# The model reaction objects as accessed by the Escher module builders
+ESCHER_REACTION_PROJECTION = ProjectionNode(
+    "model_reaction",
+    ModelReaction,
+    children=(
+        ProjectionNode(
+            "reaction",
+            Reaction,
+            children=(
+                ProjectionNode("universal_reaction", UniversalReaction),
+                ProjectionNode(
+                    "matrix",
+                    ReactionMatrix,
+                    many=True,
+                    children=(
+                        ProjectionNode(
+                            "universal_reaction_matrix", UniversalReactionMatrix
                         ),
-                        subqueryload(
-                            CompartmentalizedComponent.model_compartmentalized_components.and_(
-                                ModelCompartmentalizedComponent.model_id == model_db.id
-                            )
+                        ProjectionNode(
+                            "compartmentalized_component",
+                            CompartmentalizedComponent,
+                            children=(
+                                ProjectionNode(
+                                    "universal_compartmentalized_component",
+                                    UniversalCompartmentalizedComponent,
+                                ),
+                                ProjectionNode(
+                                    "component",
+                                    Component,
+                                    children=(
+                                        ProjectionNode(
+                                            "universal_component", UniversalComponent
+                                        ),
+                                    ),
+                                ),
+                                ProjectionNode(
+                                    "model_compartmentalized_components",
+                                    ModelCompartmentalizedComponent,
+                                    many=True,
+                                ),
+                            ),
                         ),
                     ),
                 ),
+            ),
+        ),
+    ),
+)
+
+
+def _flatten_projection(node: ProjectionNode, parent: Optional[int] = None, out=None):
+    """List (node, parent index) pairs of a projection tree in pre-order."""
+    if out is None:
+        out = []
+    index = len(out)
+    out.append((node, parent))
+    for child in node.children:
+        _flatten_projection(child, index, out)
+    return out
+
+
+def assemble_projections(
+    rows, projection: ProjectionNode = ESCHER_REACTION_PROJECTION
+) -> List[EscherProjection]:
+    """Turn flat rows of a projection query into linked EscherProjection objects.
+
+    Every row holds the columns of all nodes of the projection tree in
+    pre-order, objects that appear in multiple rows are created once.
+    """
+    nodes = _flatten_projection(projection)
+    layout = []
+    offset = 0
+    for node, parent in nodes:
+        column_keys = [attr.key for attr in inspect(node.entity).mapper.column_attrs]
+        pk_key = inspect(node.entity).mapper.primary_key[0].key
+        layout.append((node, parent, column_keys, offset, column_keys.index(pk_key)))
+        offset += len(column_keys)
+
+    objects = {}
+    linked = set()
+    roots = []
+    for row in rows:
+        row_objects = []
+        for i, (node, parent, column_keys, start, pk_index) in enumerate(layout):
+            pk = row[start + pk_index]
+            if pk is None:
+                # Missing on the outer join side
+                row_objects.append(None)
+                continue
+            obj = objects.get((i, pk))
+            if obj is None:
+                obj = objects[(i, pk)] = EscherProjection(
+                    **dict(zip(column_keys, row[start : start + len(column_keys)]))
+                )
+                for child in node.children:
+                    setattr(obj, child.name, [] if child.many else None)
+                if parent is None:
+                    roots.append(obj)
+            row_objects.append(obj)
+
+            if parent is not None and (parent_obj := row_objects[parent]) is not None:
+                if not node.many:
+                    setattr(parent_obj, node.name, obj)
+                elif (link := (id(parent_obj), i, pk)) not in linked:
+                    linked.add(link)
+                    getattr(parent_obj, node.name).append(obj)
+    return roots
+
+
+def get_model_reactions_for_escher_map(
+    session: Session, model_bigg_id: str, map_bigg_id: str
+) -> List[EscherProjection]:
+    """Load the reactions of a model in an Escher module with a single query.
+
+    Only columns are selected, the rows are assembled into EscherProjection
+    objects with the same attributes as the ORM objects used by the builders.
+    """
+    columns = [
+        getattr(node.entity, attr.key).label(f"n{i}_{attr.key}")
+        for i, (node, _) in enumerate(_flatten_projection(ESCHER_REACTION_PROJECTION))
+        for attr in inspect(node.entity).mapper.column_attrs
+    ]
+    rows = session.execute(
+        select(*columns)
+        .select_from(ModelReaction)
+        .join(ModelReaction.model)
+        .join(ModelReaction.escher_mappings)
+        .join(ModelReactionEscherMapping.escher_module)
+        .join(ModelReaction.reaction)
+        .join(Reaction.universal_reaction)
+        .join(Reaction.matrix, isouter=True)
+        .join(ReactionMatrix.universal_reaction_matrix, isouter=True)
+        .join(ReactionMatrix.compartmentalized_component, isouter=True)
+        .join(
+            CompartmentalizedComponent.universal_compartmentalized_component,
+            isouter=True,
+        )
+        .join(CompartmentalizedComponent.component, isouter=True)
+        .join(Component.universal_component, isouter=True)
+        .join(
+            CompartmentalizedComponent.model_compartmentalized_components.and_(
+                ModelCompartmentalizedComponent.model_id == ModelReaction.model_id
+            ),
+            isouter=True,
+        )
+        .filter(Model.bigg_id == model_bigg_id)
+        .filter(EscherModule.bigg_id == map_bigg_id)
+        .order_by(ModelReaction.bigg_id, ReactionMatrix.id)
+    ).all()
+    if not rows:
+        model_id = session.scalars(
+            select(Model.id).filter(Model.bigg_id == model_bigg_id).limit(1)
+        ).first()
+        if model_id is None:
+            raise NotFoundError("Model not found.")
+    return assemble_projections(rows)
+
+
+class EscherMapData(NamedTuple):
+    """A built Escher map, ready to be served."""
+
+    body: bytes
+    body_gzip: bytes
+    etag: str
+
+
+def _store_escher_map_json(cache_path: str, body: bytes):
+    try:
+        utils.write_file_atomic(cache_path, body)
+    except OSError as e:
+        print(f"Could not store Escher map {cache_path}: {e}")
+
+
+def _build_and_store_escher_map_json(
+    session: Session, map_bigg_id: str, model_reactions, cache_path: str
+) -> bytes:
+    escher_module = ESCHER_MODULE_DEFINITIONS[map_bigg_id]
+    escher_map = escher_module.build_map(session, model_reactions)
+    escher_map.fit_canvas(expand_only=False)
+    body = json.dumps(escher_map.to_escher()).encode("utf-8")
+    _store_escher_map_json(cache_path, body)
+    return body
+
+
+def _build_escher_map_json_in_worker(
+    map_bigg_id: str, model_reactions: List[EscherProjection], cache_path: str
+) -> bytes:
+    session = SessionFactory()
+    try:
+        return _build_and_store_escher_map_json(
+            session, map_bigg_id, model_reactions, cache_path
+        )
+    finally:
+        session.close()
+
+
+def _get_escher_build_pool() -> futures.ProcessPoolExecutor:
+    global _escher_build_pool
+    with _escher_build_pool_lock:
+        if _escher_build_pool is None:
+            # Spawn fresh processes, forked ones would share database connections
+            _escher_build_pool = futures.ProcessPoolExecutor(
+                max_workers=ESCHER_BUILD_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
             )
+        return _escher_build_pool
+
+
+def _build_escher_map_json_in_pool(
+    map_bigg_id: str, model_reactions: List[EscherProjection], cache_path: str
+) -> bytes:
+    """Build a map in the build pool, raises futures.TimeoutError when it is busy."""
+    global _escher_build_pool
+    if not _escher_build_slots.acquire(timeout=ESCHER_BUILD_TIMEOUT):
+        raise futures.TimeoutError("Too many Escher maps are being built.")
+    try:
+        future = _get_escher_build_pool().submit(
+            _build_escher_map_json_in_worker, map_bigg_id, model_reactions, cache_path
         )
+    except BaseException:
+        _escher_build_slots.release()
+        raise
+    # The slot stays taken until the build finishes, also after a timeout
+    future.add_done_callback(lambda _: _escher_build_slots.release())
+    try:
+        return future.result(timeout=ESCHER_BUILD_TIMEOUT)
+    except BrokenProcessPool:
+        with _escher_build_pool_lock:
+            _escher_build_pool = None
+        raise
+
+
+def escher_map_data_from_json(body: bytes) -> EscherMapData:
+    return EscherMapData(
+        body=body,
+        body_gzip=gzip.compress(body),
+        etag=f'"{sha1(body).hexdigest()}"',
+    )
+
+
+def get_escher_map_cache_version_dir(db_version: str) -> str:
+    return join(ESCHER_MAP_CACHE_DIR, utils.safe_path_component(db_version))
+
+
+def get_escher_map_cache_path(
+    db_version: str, model_bigg_id: str, map_bigg_id: str
+) -> str:
+    return join(
+        get_escher_map_cache_version_dir(db_version),
+        utils.safe_path_component(model_bigg_id),
+        f"{utils.safe_path_component(map_bigg_id)}.json",
+    )
+
+
+def load_or_build_escher_map(
+    session: Session, model_bigg_id: str, map_bigg_id: str, use_build_pool=False
+) -> EscherMapData:
+    """Read a built map from the disk cache, or build and store it.
+
+    Parameters
+    ----------
+    session: Session
+        The database session.
+    model_bigg_id: str
+        BiGG ID of the model.
+    map_bigg_id: str
+        BiGG ID of the Escher module.
+    use_build_pool: bool
+        Lay out the map in the build process pool instead of the current
+        process. Raises futures.TimeoutError if that takes too long.
+    """
+    cache_path = get_escher_map_cache_path(
+        utils.get_database_version_key(session), model_bigg_id, map_bigg_id
+    )
+    try:
+        with open(cache_path, "rb") as f:
+            return escher_map_data_from_json(f.read())
+    except FileNotFoundError:
+        pass
+
+    if map_bigg_id not in ESCHER_MODULE_DEFINITIONS:
+        raise utils.NotFoundError("Map BiGG ID not found.")
+    model_reactions = get_model_reactions_for_escher_map(
+        session, model_bigg_id, map_bigg_id
+    )
+    if use_build_pool:
+        body = _build_escher_map_json_in_pool(map_bigg_id, model_reactions, cache_path)
+    else:
+        body = _build_and_store_escher_map_json(
+            session, map_bigg_id, model_reactions, cache_path
+        )
+    return escher_map_data_from_json(body)
+
+
+@utils.cache_per_database_version(maxsize=ESCHER_MAP_CACHE_SIZE)
+def get_escher_map(
+    session: Session, model_bigg_id: str, map_bigg_id: str
+) -> EscherMapData:
+    """Get a built Escher map, cached in memory and on disk per database version."""
+    return load_or_build_escher_map(
+        session, model_bigg_id, map_bigg_id, use_build_pool=True
+    )
+
+
+def check_escher_map(session: Session, model_bigg_id: str, map_bigg_id: str):
+    """Raise NotFoundError if the model or the Escher module does not exist."""
+    if map_bigg_id not in ESCHER_MODULE_DEFINITIONS:
+        raise utils.NotFoundError("Map BiGG ID not found.")
+    model_id = session.scalars(
+        select(Model.id).filter(Model.bigg_id == model_bigg_id).limit(1)
+    ).first()
+    if model_id is None:
+        raise utils.NotFoundError("Model not found.")
+
+
+def get_all_escher_map_ids(session: Session) -> List[Tuple[str, str]]:
+    """List all (model BiGG ID, map BiGG ID) pairs for which a map can be built."""
+    result = session.execute(
+        select(Model.bigg_id, EscherModule.bigg_id)
+        .select_from(ModelReaction)
         .join(ModelReaction.model)
         .join(ModelReaction.escher_mappings)
         .join(ModelReactionEscherMapping.escher_module)
-        .filter(Model.id == model_db.id)
-        .filter(EscherModule.bigg_id == map_bigg_id)
-        .order_by(ModelReaction.bigg_id)
+        .distinct()
+        .order_by(Model.bigg_id, EscherModule.bigg_id)
     ).all()
-    return model_reactions
+    return [
+        (model_bigg_id, map_bigg_id)
+        for model_bigg_id, map_bigg_id in result
+        if map_bigg_id in ESCHER_MODULE_DEFINITIONS
+    ]
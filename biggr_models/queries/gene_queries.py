@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from biggr_models.queries import utils
 from cobradb.util import ref_tuple_to_str
 from cobradb.models import (
@@ -14,7 +14,7 @@ from cobradb.models import (
     GenomeRegion,
 )
 
-from sqlalchemy import func, select
+from sqlalchemy import func, inspect, select
 from sqlalchemy.orm import Session, subqueryload, contains_eager
 
 
@@ -25,6 +25,71 @@ def get_gene_ids_for_gene_name(name, session):
     ).all()
 
 
+# Maximum number of names or ids passed in a single IN clause when resolving gene
+# names and loading their genes and genome regions.
+GENE_NAME_CHUNK_SIZE = 10000
+
+
+def get_gene_ids_for_gene_names(
+    session: Session, names: List[str]
+) -> Dict[str, List[int]]:
+    """Resolve many gene names to gene ids at once.
+
+    Names are matched case-insensitively, like get_gene_ids_for_gene_name, but
+    all names are resolved with a single query (split into chunks of
+    GENE_NAME_CHUNK_SIZE names for very long lists) on the same session.
+
+    Returns
+    -------
+    Dict[str, List[int]]
+        Mapping of every input name to the list of matching gene ids. Names
+        that did not match any gene map to an empty list.
+    """
+    lowered_names = list({name.lower() for name in names})
+    ids_by_lowered_name: Dict[str, List[int]] = {}
+    for i in range(0, len(lowered_names), GENE_NAME_CHUNK_SIZE):
+        chunk = lowered_names[i : i + GENE_NAME_CHUNK_SIZE]
+        rows = session.execute(
+            select(func.lower(Gene.name), Gene.id).filter(
+                func.lower(Gene.name).in_(chunk)
+            )
+        ).all()
+        for lowered_name, gene_id in rows:
+            ids_by_lowered_name.setdefault(lowered_name, []).append(gene_id)
+
+    return {name: ids_by_lowered_name.get(name.lower(), []) for name in names}
+
+
+def get_genes_and_regions_for_gene_names(
+    session: Session,
+    names: List[str],
+    fields: Optional[List[str]] = None,
+    include_sequences: bool = True,
+) -> Tuple[Dict[str, List[int]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Get the name to id mapping, gene info and genome regions for gene names.
+
+    All queries are run on the given session, the gene ids are loaded in chunks
+    of GENE_NAME_CHUNK_SIZE ids. The fields and include_sequences arguments
+    select the genome region columns, see get_genome_region_columns.
+    """
+    matches = get_gene_ids_for_gene_names(session, names)
+    gene_ids = sorted({gene_id for ids in matches.values() for gene_id in ids})
+    if not gene_ids:
+        return matches, [], []
+
+    genes = []
+    regions = []
+    for i in range(0, len(gene_ids), GENE_NAME_CHUNK_SIZE):
+        chunk = gene_ids[i : i + GENE_NAME_CHUNK_SIZE]
+        genes.extend(get_genes(chunk, session))
+        regions.extend(
+            get_genome_region_for_gene_id(
+                chunk, session, fields=fields, include_sequences=include_sequences
+            )
+        )
+    return matches, genes, regions
+
+
 def get_genes(gene_ids, session):
     """Get the genes for a list of gene ids."""
     rows = session.execute(
@@ -45,23 +110,93 @@ def get_all_genes(session):
     return [dict(r._mapping) for r in rows]
 
 
-def get_genome_region_for_gene_id(ids, session):
+# Large text columns of GenomeRegion that are only loaded when requested.
+GENOME_REGION_SEQUENCE_FIELDS = ("dna_sequence", "protein_sequence")
+# Columns that are always loaded, since results are grouped by them.
+GENOME_REGION_REQUIRED_FIELDS = ("id", "chromosome_id")
+
+
+def get_genome_region_columns(
+    fields: Optional[List[str]] = None, include_sequences: bool = True
+):
+    """Get the GenomeRegion columns to select for a field projection.
+
+    Parameters
+    ----------
+    fields: list of str, optional
+        Names of the GenomeRegion columns to include. All columns are included
+        if None. The id and chromosome_id columns are always included.
+    include_sequences: bool
+        If False, the DNA and protein sequence columns are left out, even when
+        they are listed in fields.
+
+    Returns
+    -------
+    list
+        Labeled columns to pass to select().
+
+    Raises
+    ------
+    ValueError
+        If fields contains a name that is not a GenomeRegion column.
+    """
+    all_fields = [col.key for col in inspect(GenomeRegion).mapper.column_attrs]
+    if fields is None:
+        selected = all_fields
+    else:
+        unknown = [f for f in fields if f not in all_fields]
+        if unknown:
+            raise ValueError(f"Unknown genome region fields: {', '.join(unknown)}")
+        selected = [
+            f
+            for f in all_fields
+            if f in fields or f in GENOME_REGION_REQUIRED_FIELDS
+        ]
+    if not include_sequences:
+        selected = [f for f in selected if f not in GENOME_REGION_SEQUENCE_FIELDS]
+    return [getattr(GenomeRegion, f).label(f) for f in selected]
+
+
+@utils.cache_per_database_version()
+def get_gene_name_catalog(session: Session) -> Tuple[str, ...]:
+    """Get all distinct gene names, sorted case-insensitively."""
+    names = session.scalars(
+        select(Gene.name).filter(Gene.name != None).distinct()
+    ).all()
+    return tuple(sorted(names, key=lambda x: (x.lower(), x)))
+
+
+def get_genome_region_for_gene_id(
+    ids,
+    session,
+    fields: Optional[List[str]] = None,
+    include_sequences: bool = True,
+):
     """Get the genome region for a gene id."""
+    rows = session.execute(
+        select(*get_genome_region_columns(fields, include_sequences)).filter(
+            GenomeRegion.id.in_(list(ids))
+        )
+    ).all()
+
+    return [dict(r._mapping) for r in rows]
+
+
+def get_genome_region_sequences(
+    session: Session, ids: List[int]
+) -> Dict[int, Dict[str, Optional[str]]]:
+    """Get the DNA and protein sequences of genome regions.
+
+    Returns a dict mapping each found genome region id to its sequences.
+    """
     rows = session.execute(
         select(
             GenomeRegion.id,
-            GenomeRegion.chromosome_id,
-            GenomeRegion.bigg_id,
-            GenomeRegion.leftpos,
-            GenomeRegion.rightpos,
-            GenomeRegion.strand,
-            GenomeRegion.type,
-            GenomeRegion.dna_sequence,
-            GenomeRegion.protein_sequence,
+            *(getattr(GenomeRegion, f).label(f) for f in GENOME_REGION_SEQUENCE_FIELDS),
         ).filter(GenomeRegion.id.in_(list(ids)))
     ).all()
 
-    return [dict(r._mapping) for r in rows]
+    return {r[0]: dict(zip(GENOME_REGION_SEQUENCE_FIELDS, r[1:])) for r in rows}
 
 
 def get_model_genes_count(model_bigg_id, session):
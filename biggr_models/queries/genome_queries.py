@@ -1,5 +1,5 @@
 from biggr_models.handlers import gene_handlers
-from biggr_models.queries import utils
+from biggr_models.queries import gene_queries, utils
 from cobradb.util import ref_tuple_to_str, ref_str_to_tuple
 from cobradb.models import Genome, Chromosome, Model, GenomeRegion
 from sqlalchemy import func, select
@@ -20,6 +20,17 @@ def get_all_genomes(session):
     return [r[0] for r in rows]
 
 
+@utils.cache_per_database_version()
+def get_strain_catalog(session):
+    """Get all distinct genome accession values, sorted case-insensitively."""
+    accessions = session.scalars(
+        select(Genome.accession_value)
+        .filter(Genome.accession_value != None)
+        .distinct()
+    ).all()
+    return tuple(sorted(accessions, key=lambda x: (x.lower(), x)))
+
+
 def get_genomes(
     session,
     page=None,
@@ -92,13 +103,21 @@ def get_genome_and_models(genome_ref_string, session):
     }
 
 
-def get_reactions_for_genome(genome_id, session):
-    """Get all reactions associated with a genome through its models."""
+def get_reactions_for_genomes(session, genome_ids):
+    """Get all reactions associated with genomes through their models.
+
+    Returns a dict mapping each genome id to its list of reactions.
+    """
     from cobradb.models import Model, ModelReaction, Reaction, UniversalReaction
 
-    # Get reactions through the model associated with this genome
+    genome_ids = list(set(genome_ids))
+    if not genome_ids:
+        return {}
+
+    # Get reactions through the models associated with these genomes
     reactions = session.execute(
         select(
+            Model.genome_id,
             UniversalReaction.bigg_id,
             UniversalReaction.name,
             ModelReaction.gene_reaction_rule,
@@ -110,26 +129,36 @@ def get_reactions_for_genome(genome_id, session):
         .join(Reaction, Reaction.universal_reaction_id == UniversalReaction.id)
         .join(ModelReaction, ModelReaction.reaction_id == Reaction.id)
         .join(Model, Model.id == ModelReaction.model_id)
-        .filter(Model.genome_id == genome_id)
+        .filter(Model.genome_id.in_(genome_ids))
         .distinct()
     ).all()
 
-    return [
-        {
-            "bigg_id": f"{r[0]}:{r[5]}" if r[5] != 1 else r[0],
-            "name": r[1],
-            "gene_reaction_rule": r[2],
-            "lower_bound": r[3],
-            "upper_bound": r[4],
-            "copy_number": r[5],
-            "subsystem": r[6],
-        }
-        for r in reactions
-    ]
+    result = {genome_id: [] for genome_id in genome_ids}
+    for r in reactions:
+        result[r[0]].append(
+            {
+                "bigg_id": f"{r[1]}:{r[6]}" if r[6] != 1 else r[1],
+                "name": r[2],
+                "gene_reaction_rule": r[3],
+                "lower_bound": r[4],
+                "upper_bound": r[5],
+                "copy_number": r[6],
+                "subsystem": r[7],
+            }
+        )
+    return result
 
 
-def get_metabolites_for_genome(genome_id, session):
-    """Get all metabolites associated with a genome through its models."""
+def get_reactions_for_genome(genome_id, session):
+    """Get all reactions associated with a genome through its models."""
+    return get_reactions_for_genomes(session, [genome_id])[genome_id]
+
+
+def get_metabolites_for_genomes(session, genome_ids):
+    """Get all metabolites associated with genomes through their models.
+
+    Returns a dict mapping each genome id to its list of metabolites.
+    """
     from cobradb.models import (
         Model,
         ModelCompartmentalizedComponent,
@@ -137,9 +166,14 @@ def get_metabolites_for_genome(genome_id, session):
         Component,
     )
 
-    # Get metabolites through the model associated with this genome
+    genome_ids = list(set(genome_ids))
+    if not genome_ids:
+        return {}
+
+    # Get metabolites through the models associated with these genomes
     metabolites = session.execute(
         select(
+            Model.genome_id,
             Component.bigg_id,
             Component.name,
             Component.formula,
@@ -156,40 +190,80 @@ def get_metabolites_for_genome(genome_id, session):
             == CompartmentalizedComponent.id,
         )
         .join(Model, Model.id == ModelCompartmentalizedComponent.model_id)
-        .filter(Model.genome_id == genome_id)
+        .filter(Model.genome_id.in_(genome_ids))
         .distinct()
     ).all()
 
-    return [
-        {
-            "bigg_id": m[0],
-            "name": m[1],
-            "formula": m[2],
-            "charge": m[3],
-            "compartmentalized_bigg_id": m[4],
-        }
-        for m in metabolites
-    ]
+    result = {genome_id: [] for genome_id in genome_ids}
+    for m in metabolites:
+        result[m[0]].append(
+            {
+                "bigg_id": m[1],
+                "name": m[2],
+                "formula": m[3],
+                "charge": m[4],
+                "compartmentalized_bigg_id": m[5],
+            }
+        )
+    return result
 
 
-def get_genomes_with_chromosomes(
-    accession_id,
+def get_metabolites_for_genome(genome_id, session):
+    """Get all metabolites associated with a genome through its models."""
+    return get_metabolites_for_genomes(session, [genome_id])[genome_id]
+
+
+def get_genomes_with_chromosomes_for_accessions(
     session,
-    gene_id_filter=None,
+    accession_ids,
+    gene_id_filters=None,
     include_metabolites=True,
     include_reactions=True,
+    fields=None,
+    include_sequences=True,
 ):
-    if not accession_id:
-        return []
+    """Get genomes with chromosomes, regions, reactions and metabolites in bulk.
+
+    Duplicate accessions are loaded only once and every table is queried with a
+    single IN query for all requested genomes.
+
+    Parameters
+    ----------
+    accession_ids: list of str
+        Accession values of the genomes to load.
+    gene_id_filters: dict, optional
+        If given, maps accession values to the gene (genome region) ids that
+        should be included for that accession. Accessions that are missing
+        from this dict get no genome regions.
+    include_metabolites: bool
+        Add the metabolites of the models of each genome.
+    include_reactions: bool
+        Add the reactions of the models of each genome.
+    fields: list of str, optional
+        GenomeRegion columns to include, see
+        gene_queries.get_genome_region_columns.
+    include_sequences: bool
+        If False, the sequence columns of the genome regions are not loaded.
+
+    Returns
+    -------
+    dict
+        Mapping of accession value to a list of genome dicts.
+    """
+    accession_ids = list({str(x) for x in accession_ids if x})
+    if not accession_ids:
+        return {}
 
     genomes = session.scalars(
-        select(Genome).filter(Genome.accession_value == accession_id)
+        select(Genome).filter(Genome.accession_value.in_(accession_ids))
     ).all()
 
+    results = {accession_id: [] for accession_id in accession_ids}
     if not genomes:
-        return []
+        return results
 
     genome_ids = [g.id for g in genomes]
+    genome_accessions = {g.id: g.accession_value for g in genomes}
 
     chromosomes = session.scalars(
         select(Chromosome).filter(Chromosome.genome_id.in_(genome_ids))
@@ -199,26 +273,32 @@ def get_genomes_with_chromosomes(
     else:
         chrom_ids = [c.id for c in chromosomes]
 
-        region_query = select(GenomeRegion).filter(
-            GenomeRegion.chromosome_id.in_(chrom_ids)
-        )
+        region_query = select(
+            *gene_queries.get_genome_region_columns(fields, include_sequences)
+        ).filter(GenomeRegion.chromosome_id.in_(chrom_ids))
 
-        if gene_id_filter is not None:
-            filt_ids = set(map(int, gene_id_filter))
-            if filt_ids:
-                region_query = region_query.filter(GenomeRegion.id.in_(filt_ids))
+        chrom_accessions = {c.id: genome_accessions[c.genome_id] for c in chromosomes}
+        if gene_id_filters is not None:
+            filt_ids = {
+                accession_id: set(map(int, gene_id_filters.get(accession_id, [])))
+                for accession_id in accession_ids
+            }
+            all_filt_ids = set().union(*filt_ids.values())
+            if all_filt_ids:
+                region_query = region_query.filter(GenomeRegion.id.in_(all_filt_ids))
             else:
                 region_query = region_query.filter(False)
 
-        regions = session.scalars(region_query).all()
+        regions = session.execute(region_query).all()
 
         region_map = {}
         for r in regions:
-            region_dict = {
-                col.key: getattr(r, col.key)
-                for col in inspect(GenomeRegion).mapper.column_attrs
-            }
-            region_map.setdefault(r.chromosome_id, []).append(region_dict)
+            if (
+                gene_id_filters is not None
+                and r.id not in filt_ids[chrom_accessions[r.chromosome_id]]
+            ):
+                continue
+            region_map.setdefault(r.chromosome_id, []).append(dict(r._mapping))
 
         chrom_map = {}
         for c in chromosomes:
@@ -229,7 +309,11 @@ def get_genomes_with_chromosomes(
             chrom_dict["genome_region"] = region_map.get(c.id, [])
             chrom_map.setdefault(c.genome_id, []).append(chrom_dict)
 
-    results = []
+    if include_metabolites:
+        metabolite_map = get_metabolites_for_genomes(session, genome_ids)
+    if include_reactions:
+        reaction_map = get_reactions_for_genomes(session, genome_ids)
+
     for g in genomes:
         genome_dict = {
             col.key: getattr(g, col.key) for col in inspect(Genome).mapper.column_attrs
@@ -238,12 +322,103 @@ def get_genomes_with_chromosomes(
 
         # Add metabolites if requested
         if include_metabolites:
-            genome_dict["metabolites"] = get_metabolites_for_genome(g.id, session)
+            genome_dict["metabolites"] = metabolite_map[g.id]
 
         # Add reactions if requested
         if include_reactions:
-            genome_dict["reactions"] = get_reactions_for_genome(g.id, session)
+            genome_dict["reactions"] = reaction_map[g.id]
 
-        results.append(genome_dict)
+        results[g.accession_value].append(genome_dict)
 
     return results
+
+
+def get_genomes_with_chromosomes(
+    accession_id,
+    session,
+    gene_id_filter=None,
+    include_metabolites=True,
+    include_reactions=True,
+    fields=None,
+    include_sequences=True,
+):
+    if not accession_id:
+        return []
+
+    accession_id = str(accession_id)
+    return get_genomes_with_chromosomes_for_accessions(
+        session,
+        [accession_id],
+        gene_id_filters=(
+            None if gene_id_filter is None else {accession_id: gene_id_filter}
+        ),
+        include_metabolites=include_metabolites,
+        include_reactions=include_reactions,
+        fields=fields,
+        include_sequences=include_sequences,
+    )[accession_id]
+
+
+def _filter_genome_regions(genome_dict, gene_ids):
+    """Copy a genome dict, keeping only the genome regions with the given ids."""
+    return genome_dict | {
+        "chromosome": [
+            chrom_dict
+            | {
+                "genome_region": [
+                    r for r in chrom_dict["genome_region"] if r["id"] in gene_ids
+                ]
+            }
+            for chrom_dict in genome_dict["chromosome"]
+        ]
+    }
+
+
+def get_genomes_for_gene_strain_pairs(
+    session, pairs, fields=None, include_sequences=True
+):
+    """Get the genomes, restricted to the given genes, for (gene, strain) pairs.
+
+    Gene names are resolved in bulk and every strain is loaded only once, after
+    which the results are fanned out to the pairs. Genomes of pairs that share
+    a strain share their reaction and metabolite lists.
+
+    Parameters
+    ----------
+    pairs: list of (str, str)
+        Gene name and strain accession value pairs.
+
+    Returns
+    -------
+    list
+        For each pair, the list of genome dicts with only the genome regions of
+        the matching genes.
+
+    The fields and include_sequences arguments select the genome region
+    columns, see gene_queries.get_genome_region_columns.
+    """
+    gene_matches = gene_queries.get_gene_ids_for_gene_names(
+        session, list({gene_name for gene_name, _ in pairs})
+    )
+    pair_gene_ids = [set(gene_matches[gene_name]) for gene_name, _ in pairs]
+
+    gene_id_filters = {}
+    for (_, strain_id), gene_ids in zip(pairs, pair_gene_ids):
+        if gene_ids:
+            gene_id_filters.setdefault(strain_id, set()).update(gene_ids)
+
+    genomes_by_strain = get_genomes_with_chromosomes_for_accessions(
+        session,
+        list(gene_id_filters.keys()),
+        gene_id_filters=gene_id_filters,
+        fields=fields,
+        include_sequences=include_sequences,
+    )
+
+    return [
+        [
+            _filter_genome_regions(genome_dict, gene_ids)
+            for genome_dict in genomes_by_strain.get(strain_id, [])
+        ]
+        for (_, strain_id), gene_ids in zip(pairs, pair_gene_ids)
+    ]
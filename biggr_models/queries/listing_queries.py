@@ -0,0 +1,223 @@
+"""Denormalized listing tables for the model reaction, metabolite and gene tables.
+
+A listing holds the joined rows of a data table, with one column per data table
+column named after its identifier, so that sorting and filtering only touch a
+single indexed table. On PostgreSQL listings are materialized views, which are
+built under a temporary name and then renamed, on other databases plain tables
+created with CREATE TABLE AS. Listings are rebuilt when the database version
+changes, see ``python -m biggr_models.build_listings``.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column,
+    Index,
+    MetaData,
+    String,
+    Table,
+    delete,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.orm import Session
+from biggr_models.queries import utils
+
+# Seconds before a listing that was not current is checked again
+LISTING_CHECK_INTERVAL = 60.0
+# Seconds between two checks of the server for listings of an old database version
+LISTING_REFRESH_INTERVAL = 600
+
+listing_metadata = MetaData()
+
+listing_versions = Table(
+    "biggr_listing_versions",
+    listing_metadata,
+    Column("name", String, primary_key=True),
+    Column("db_version", String, nullable=False),
+)
+
+
+class Listing:
+    """A denormalized copy of the rows of a data table.
+
+    Parameters
+    ----------
+    name: str
+        Name of the table or materialized view.
+    column_specs: list of DataColumnSpec
+        The columns of the data table, the listing is built from the same joins.
+    filter_identifier: str
+        Identifier of the column that the data table is always filtered on, it
+        leads all indexes.
+    """
+
+    def __init__(self, name: str, column_specs: list, filter_identifier: str):
+        self.name = name
+        self.column_specs = column_specs
+        self.filter_identifier = filter_identifier
+        self._table: Optional[Table] = None
+        self._indexes: Optional[List[Index]] = None
+        self._checked: Tuple[Optional[str], float, bool] = (None, 0.0, False)
+        self._lock = threading.Lock()
+
+    def source_query(self):
+        return utils.get_list_base_query(self.column_specs, label=True)
+
+    @property
+    def table(self) -> Table:
+        if self._table is None:
+            self._table = Table(
+                self.name,
+                listing_metadata,
+                *(
+                    Column(col.name, col.type)
+                    for col in self.source_query().selected_columns
+                ),
+            )
+        return self._table
+
+    def indexes(self) -> List[Index]:
+        if self._indexes is None:
+            # the filter column, and the filter column with every sortable column
+            table = self.table
+            filter_col = table.c[self.filter_identifier]
+            self._indexes = [Index(f"{self.name}_filter_idx", filter_col)]
+            for i, col in enumerate(table.c):
+                if col is not filter_col:
+                    self._indexes.append(Index(f"{self.name}_{i}_idx", filter_col, col))
+        return self._indexes
+
+    def build(self, session: Session, db_version: str):
+        """(Re)create the listing and record the database version it was built for.
+
+        On PostgreSQL the materialized view is built under a temporary name and
+        swapped in with a short transaction, so the data tables keep reading
+        the previous listing while it is built.
+        """
+        bind = session.get_bind()
+        source_sql = self.source_query().compile(
+            dialect=bind.dialect, compile_kwargs={"literal_binds": True}
+        )
+        if bind.dialect.name == "postgresql":
+            self._build_materialized_view(session, source_sql)
+        else:
+            session.execute(text(f"DROP TABLE IF EXISTS {self.name}"))
+            session.execute(text(f"CREATE TABLE {self.name} AS {source_sql}"))
+            connection = session.connection()
+            for index in self.indexes():
+                index.create(connection)
+
+        listing_versions.create(session.connection(), checkfirst=True)
+        session.execute(delete(listing_versions).filter_by(name=self.name))
+        session.execute(
+            insert(listing_versions).values(name=self.name, db_version=db_version)
+        )
+        session.commit()
+        with self._lock:
+            self._checked = (db_version, time.monotonic(), True)
+
+    def _build_materialized_view(self, session: Session, source_sql):
+        building = f"{self.name}_building"
+        session.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {building}"))
+        session.execute(text(f"CREATE MATERIALIZED VIEW {building} AS {source_sql}"))
+        # index names are unique per schema, the indexes are renamed with the view
+        suffixes = []
+        for index in self.indexes():
+            suffix = index.name[len(self.name) :]
+            columns = ", ".join(f'"{col.name}"' for col in index.columns)
+            session.execute(
+                text(f"CREATE INDEX {building}{suffix} ON {building} ({columns})")
+            )
+            suffixes.append(suffix)
+        suffixes.extend(self._create_trigram_indexes(session, building))
+        session.commit()
+
+        # only this part locks the listing, it is committed with its version
+        session.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {self.name}"))
+        session.execute(
+            text(f"ALTER MATERIALIZED VIEW {building} RENAME TO {self.name}")
+        )
+        for suffix in suffixes:
+            session.execute(
+                text(f"ALTER INDEX {building}{suffix} RENAME TO {self.name}{suffix}")
+            )
+
+    def _create_trigram_indexes(self, session: Session, view: str) -> List[str]:
+        """Create the trigram indexes of the view, return their name suffixes."""
+        # The data table searches are case-insensitive LIKE '%...%' queries, which
+        # can only use trigram indexes on lower(column).
+        try:
+            with session.begin_nested():
+                session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except Exception as e:
+            print(f"Skipping trigram indexes of {self.name}: {e}")
+            return []
+        suffixes = []
+        for i, col in enumerate(self.table.c):
+            if isinstance(col.type, String):
+                session.execute(
+                    text(
+                        f"CREATE INDEX {view}_{i}_trgm_idx ON {view} "
+                        f'USING gin (lower("{col.name}") gin_trgm_ops)'
+                    )
+                )
+                suffixes.append(f"_{i}_trgm_idx")
+        return suffixes
+
+    def built_version(self, session: Session) -> Optional[str]:
+        if not inspect(session.get_bind()).has_table(listing_versions.name):
+            return None
+        return session.scalars(
+            select(listing_versions.c.db_version).filter_by(name=self.name)
+        ).first()
+
+    def get_table(self, session: Session) -> Optional[Table]:
+        """Return the listing table if it is built for the current database version."""
+        db_version = utils.get_database_version_key(session)
+        now = time.monotonic()
+        with self._lock:
+            checked_version, checked_at, current = self._checked
+            if checked_version == db_version and (
+                current or now - checked_at < LISTING_CHECK_INTERVAL
+            ):
+                return self.table if current else None
+        current = self.built_version(session) == db_version
+        with self._lock:
+            self._checked = (db_version, now, current)
+        return self.table if current else None
+
+
+# Registered by the data table handlers that use a listing
+LISTINGS: Dict[str, Listing] = {}
+
+
+def register_listing(name: str, column_specs: list, filter_identifier: str):
+    LISTINGS[name] = Listing(name, column_specs, filter_identifier)
+    return LISTINGS[name]
+
+
+def refresh_listings(session: Session, force: bool = False) -> List[str]:
+    """Rebuild the listings that are not built for the current database version.
+
+    Returns the names of the rebuilt listings.
+    """
+    db_version = utils.get_database_version_key(session)
+    rebuilt = []
+    for listing in LISTINGS.values():
+        if not force and listing.built_version(session) == db_version:
+            continue
+        start = time.perf_counter()
+        listing.build(session, db_version)
+        row_count = session.scalar(select(func.count()).select_from(listing.table))
+        print(
+            f"Built listing {listing.name} ({row_count} rows, "
+            f"{time.perf_counter() - start:.1f}s)"
+        )
+        rebuilt.append(listing.name)
+    return rebuilt
@@ -1,11 +1,22 @@
-from sqlalchemy.orm import aliased
+from dataclasses import asdict, dataclass, field
+import json
+import os
+from os.path import join
+import shutil
+import tempfile
+from typing import Any, Dict, List, Tuple
 
 from cobradb.models import (
     MemoteTest,
     MemoteResult,
+    Model,
+    ModelCompartmentalizedComponent,
+    ModelReaction,
 )
 
-from sqlalchemy import select
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import Session
+from biggr_models.queries import utils
 
 REACTION_TESTS = [
     "test_blocked_reactions",
@@ -25,92 +36,261 @@ METABOLITE_TESTS = [
 GENE_TESTS = []
 
 
-def get_general_results_for_model(session, model_id):
-    result_db = session.execute(
-        select(MemoteTest, MemoteResult)
-        .join(MemoteResult, MemoteResult.test_id == MemoteTest.id)
-        .filter(
-            (MemoteResult.model_id == model_id)
-            & (MemoteResult.model_reaction_id == None)
-            & (MemoteResult.model_compartmentalized_component_id == None)
-            & (MemoteResult.model_gene_id == None)
-            & (MemoteResult.result != None)
-        )
-    ).all()
+# Number of model summaries kept in memory by each server process
+MEMOTE_SUMMARY_CACHE_SIZE = 64
+# Summaries are also stored on disk when the listings are built, so that they
+# are shared between the server processes. Subdirectories are named after the
+# database version.
+MEMOTE_SUMMARY_CACHE_DIR = join(tempfile.gettempdir(), "biggr_memote_summaries")
 
-    if result_db is not None:
-        result_db = {r[0].bigg_id: tuple(r) for r in result_db}
+ENTITY_TESTS = {
+    "reaction": REACTION_TESTS,
+    "metabolite": METABOLITE_TESTS,
+    "gene": GENE_TESTS,
+}
 
-    return result_db
 
+def _columns_as_dict(obj) -> Dict[str, Any]:
+    mapper = inspect(obj).mapper
+    result = {"_type": mapper.class_.__name__}
+    result.update({col.key: getattr(obj, col.key) for col in mapper.column_attrs})
+    return result
 
-def get_memote_results_for_reaction(session, model_reaction_id):
-    reaction_result_alias = aliased(MemoteResult)
-    general_result_alias = aliased(MemoteResult)
 
-    result_db = session.execute(
-        select(reaction_result_alias, general_result_alias, MemoteTest)
-        .join(
-            general_result_alias,
-            (general_result_alias.test_id == reaction_result_alias.test_id)
-            & (general_result_alias.model_id == reaction_result_alias.model_id)
-            & (general_result_alias.model_reaction_id == None)
-            & (general_result_alias.model_compartmentalized_component_id == None)
-            & (general_result_alias.model_gene_id == None),
-        )
-        .join(MemoteTest, MemoteTest.id == reaction_result_alias.test_id)
-        .filter(
-            (reaction_result_alias.model_reaction_id == model_reaction_id)
-            & (MemoteTest.bigg_id.in_(REACTION_TESTS))
-        )
-    ).all()
-    return [tuple(r) for r in result_db]
+@dataclass
+class MemoteModelSummary:
+    """Denormalized MEMOTE results of one model.
 
+    Entity flags are stored as bitsets, bit i is set if the entity was flagged
+    in the i-th test of ``entity_tests[kind]``. Entity results are keyed by
+    ``entity_result_key``.
+    """
 
-def get_memote_results_for_metabolite(session, model_compartmentalized_component_id):
-    metabolite_result_alias = aliased(MemoteResult)
-    general_result_alias = aliased(MemoteResult)
+    tests: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    general: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    entity_tests: Dict[str, List[int]] = field(default_factory=dict)
+    flags: Dict[str, Dict[int, int]] = field(default_factory=dict)
+    entity_results: Dict[str, Dict[str, Any]] = field(default_factory=dict)
 
-    result_db = session.execute(
-        select(metabolite_result_alias, general_result_alias, MemoteTest)
-        .join(
-            general_result_alias,
-            (general_result_alias.test_id == metabolite_result_alias.test_id)
-            & (general_result_alias.model_id == metabolite_result_alias.model_id)
-            & (general_result_alias.model_reaction_id == None)
-            & (general_result_alias.model_compartmentalized_component_id == None)
-            & (general_result_alias.model_gene_id == None),
+    @staticmethod
+    def entity_result_key(kind: str, entity_id: int, test_id: int) -> str:
+        return f"{kind}:{entity_id}:{test_id}"
+
+    def to_json(self) -> bytes:
+        return json.dumps(asdict(self), default=str).encode("utf-8")
+
+    @classmethod
+    def from_json(cls, body: bytes) -> "MemoteModelSummary":
+        # JSON object keys are strings, turn the database IDs back into ints
+        data = json.loads(body)
+        return cls(
+            tests={int(k): v for k, v in data["tests"].items()},
+            general={int(k): v for k, v in data["general"].items()},
+            entity_tests=data["entity_tests"],
+            flags={
+                kind: {int(k): v for k, v in flags.items()}
+                for kind, flags in data["flags"].items()
+            },
+            entity_results=data["entity_results"],
         )
-        .join(MemoteTest, MemoteTest.id == metabolite_result_alias.test_id)
-        .filter(
+
+    def general_results(self) -> Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]]:
+        return {
+            self.tests[test_id]["bigg_id"]: (self.tests[test_id], result)
+            for test_id, result in self.general.items()
+            if result["result"] is not None
+        }
+
+    def entity_flags(self, kind: str, entity_id: int) -> List[int]:
+        bits = self.flags[kind].get(entity_id, 0)
+        return [
+            test_id
+            for i, test_id in enumerate(self.entity_tests[kind])
+            if bits & (1 << i)
+        ]
+
+    def results_for_entity(self, kind: str, entity_id: int) -> List[tuple]:
+        return [
             (
-                metabolite_result_alias.model_compartmentalized_component_id
-                == model_compartmentalized_component_id
+                self.entity_results[self.entity_result_key(kind, entity_id, test_id)],
+                self.general[test_id],
+                self.tests[test_id],
             )
-            & (MemoteTest.bigg_id.in_(METABOLITE_TESTS))
-        )
-    ).all()
-    return [tuple(r) for r in result_db]
+            for test_id in self.entity_flags(kind, entity_id)
+        ]
+
+
+def _entity_of_result(result: MemoteResult) -> Tuple[str, int]:
+    if result.model_reaction_id is not None:
+        return "reaction", result.model_reaction_id
+    if result.model_compartmentalized_component_id is not None:
+        return "metabolite", result.model_compartmentalized_component_id
+    if result.model_gene_id is not None:
+        return "gene", result.model_gene_id
+    return "model", result.model_id
+
+
+def get_memote_summary_cache_path(db_version: str, model_id: int) -> str:
+    return join(
+        MEMOTE_SUMMARY_CACHE_DIR,
+        utils.safe_path_component(db_version),
+        f"{model_id}.json",
+    )
+
+
+def _store_memote_summary(cache_path: str, body: bytes):
+    try:
+        utils.write_file_atomic(cache_path, body)
+    except OSError as e:
+        print(f"Could not store MEMOTE summary {cache_path}: {e}")
+
 
+@utils.cache_per_database_version(maxsize=MEMOTE_SUMMARY_CACHE_SIZE)
+def get_memote_summary(session: Session, model_id: int) -> MemoteModelSummary:
+    """Get the MEMOTE results of a model, see ``build_memote_summaries``.
 
-def get_memote_results_for_gene(session, model_gene_id):
-    gene_result_alias = aliased(MemoteResult)
-    general_result_alias = aliased(MemoteResult)
+    The summary is read from the disk cache, or loaded with one query and
+    stored. It is cached in memory until the database version changes.
+    """
+    cache_path = get_memote_summary_cache_path(
+        utils.get_database_version_key(session), model_id
+    )
+    try:
+        with open(cache_path, "rb") as f:
+            return MemoteModelSummary.from_json(f.read())
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, AttributeError) as e:
+        print(f"Could not read MEMOTE summary {cache_path}: {e!r}")
+    body = _query_memote_summary(session, model_id).to_json()
+    _store_memote_summary(cache_path, body)
+    # Return the stored form, so that all processes see the same values
+    return MemoteModelSummary.from_json(body)
 
+
+def build_memote_summaries(session: Session, force: bool = False) -> int:
+    """Store the summaries of all models that are missing from the disk cache.
+
+    Called with the listings, so that no request loads a summary from the
+    database. The summaries of other database versions are removed. Returns the
+    number of stored summaries.
+    """
+    db_version = utils.get_database_version_key(session)
+    keep = join(MEMOTE_SUMMARY_CACHE_DIR, utils.safe_path_component(db_version))
+    if os.path.isdir(MEMOTE_SUMMARY_CACHE_DIR):
+        for name in os.listdir(MEMOTE_SUMMARY_CACHE_DIR):
+            path = join(MEMOTE_SUMMARY_CACHE_DIR, name)
+            if path != keep and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+    built = 0
+    for model_id in session.scalars(select(Model.id).order_by(Model.id)).all():
+        cache_path = get_memote_summary_cache_path(db_version, model_id)
+        if not force and os.path.exists(cache_path):
+            continue
+        body = _query_memote_summary(session, model_id).to_json()
+        _store_memote_summary(cache_path, body)
+        built += 1
+    return built
+
+
+def _query_memote_summary(session: Session, model_id: int) -> MemoteModelSummary:
+    """Load all MEMOTE results of a model in one query."""
     result_db = session.execute(
-        select(gene_result_alias, general_result_alias, MemoteTest)
-        .join(
-            general_result_alias,
-            (general_result_alias.test_id == gene_result_alias.test_id)
-            & (general_result_alias.model_id == gene_result_alias.model_id)
-            & (general_result_alias.model_reaction_id == None)
-            & (general_result_alias.model_compartmentalized_component_id == None)
-            & (general_result_alias.model_gene_id == None),
+        select(MemoteResult, MemoteTest)
+        .join(MemoteTest, MemoteResult.test_id == MemoteTest.id)
+        .filter(MemoteResult.model_id == model_id)
+    ).all()
+
+    summary = MemoteModelSummary()
+    entity_rows = []
+    for result, test in result_db:
+        if test.id not in summary.tests:
+            summary.tests[test.id] = _columns_as_dict(test)
+        kind, entity_id = _entity_of_result(result)
+        if kind == "model":
+            summary.general[test.id] = _columns_as_dict(result)
+        else:
+            entity_rows.append((kind, entity_id, test, result))
+
+    for kind, test_bigg_ids in ENTITY_TESTS.items():
+        summary.entity_tests[kind] = sorted(
+            test_id
+            for test_id, test in summary.tests.items()
+            if test["bigg_id"] in test_bigg_ids
         )
-        .join(MemoteTest, MemoteTest.id == gene_result_alias.test_id)
-        .filter(
-            (gene_result_alias.model_gene_id == model_gene_id)
-            & (MemoteTest.bigg_id.in_(GENE_TESTS))
+        summary.flags[kind] = {}
+    bit_positions = {
+        (kind, test_id): i
+        for kind, test_ids in summary.entity_tests.items()
+        for i, test_id in enumerate(test_ids)
+    }
+
+    for kind, entity_id, test, result in entity_rows:
+        # Entity results are only shown together with the general result
+        bit = bit_positions.get((kind, test.id))
+        if bit is None or test.id not in summary.general:
+            continue
+        summary.flags[kind][entity_id] = summary.flags[kind].get(entity_id, 0) | (
+            1 << bit
         )
-    ).all()
-    return [tuple(r) for r in result_db]
+        key = summary.entity_result_key(kind, entity_id, test.id)
+        summary.entity_results[key] = _columns_as_dict(result)
+    return summary
+
+
+def get_general_results_for_model(session, model_id):
+    return get_memote_summary(session, model_id).general_results()
+
+
+def get_memote_results_for_reaction(session, model_id, model_reaction_id):
+    return get_memote_summary(session, model_id).results_for_entity(
+        "reaction", model_reaction_id
+    )
+
+
+def get_memote_results_for_metabolite(
+    session, model_id, model_compartmentalized_component_id
+):
+    return get_memote_summary(session, model_id).results_for_entity(
+        "metabolite", model_compartmentalized_component_id
+    )
+
+
+def get_memote_results_for_gene(session, model_id, model_gene_id):
+    return get_memote_summary(session, model_id).results_for_entity(
+        "gene", model_gene_id
+    )
+
+
+def get_memote_flags_for_model(session: Session, model_bigg_id: str) -> Dict[str, Any]:
+    """Return the MEMOTE flags of all reactions and metabolites of a model.
+
+    The flags of each entity are returned as a bitset, bit i refers to the i-th
+    test in the "tests" list of the entity type. Entities without flags are
+    omitted.
+    """
+    model_id = session.scalars(
+        select(Model.id).filter(Model.bigg_id == model_bigg_id).limit(1)
+    ).first()
+    if model_id is None:
+        raise utils.NotFoundError("No Model found with BiGG ID " + model_bigg_id)
+    summary = get_memote_summary(session, model_id)
+
+    result: Dict[str, Any] = {"model_bigg_id": model_bigg_id, "tests": {}}
+    for kind, entity, key in (
+        ("reaction", ModelReaction, "reactions"),
+        ("metabolite", ModelCompartmentalizedComponent, "metabolites"),
+    ):
+        result["tests"][key] = [
+            summary.tests[test_id]["bigg_id"] for test_id in summary.entity_tests[kind]
+        ]
+        flags = summary.flags[kind]
+        bigg_ids = (
+            session.execute(
+                select(entity.id, entity.bigg_id).filter(entity.id.in_(list(flags)))
+            ).all()
+            if flags
+            else []
+        )
+        result[key] = {bigg_id: flags[entity_id] for entity_id, bigg_id in bigg_ids}
+    return result
@@ -7,7 +7,8 @@ from sqlalchemy.orm import (
 )
 from biggr_models.handlers import metabolite_handlers
 from biggr_models.queries import utils
-from typing import Any, Dict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Tuple
 
 from cobradb.models import (
     Annotation,
@@ -258,6 +259,128 @@ def process_annotation_for_template(ann: Annotation):
     return d
 
 
+@dataclass
+class AnnotationAggregator:
+    """Merge the properties and links of processed annotations for the templates.
+
+    Sources are ``(type, identifier)`` tuples numbered in order of first
+    appearance; properties and links record the indices of the sources they
+    came from. Source lookup goes through a dict, so merging is linear in the
+    number of property and link values.
+    """
+
+    sources: List[Tuple[str, str]] = field(default_factory=list)
+    properties: Dict[str, Dict[str, set]] = field(default_factory=dict)
+    links: Dict[str, Dict[str, Tuple[str, set]]] = field(default_factory=dict)
+    _source_index: Dict[Tuple[str, str], int] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    def source_index(self, source: Tuple[str, str]) -> int:
+        index = self._source_index.get(source)
+        if index is None:
+            index = self._source_index[source] = len(self.sources)
+            self.sources.append(source)
+        return index
+
+    def add(self, annotation: Dict[str, Any]):
+        source = (annotation["type"], annotation["identifier"])
+        for k, vs in annotation["properties"].items():
+            props = self.properties.setdefault(k, {})
+            for v in vs:
+                props.setdefault(v, set()).add(self.source_index(source))
+        for k, vs in annotation["links"].items():
+            links = self.links.setdefault(k, {})
+            for v in vs:
+                links.setdefault(v["value"], (v["url"], set()))[1].add(
+                    self.source_index(source)
+                )
+
+    @classmethod
+    def from_annotations(cls, annotations) -> "AnnotationAggregator":
+        """Aggregate a list of (processed annotation, annotation mapping) tuples."""
+        aggregator = cls()
+        for annotation, _ in annotations:
+            aggregator.add(annotation)
+        return aggregator
+
+    def as_template_dict(self) -> Dict[str, Any]:
+        return {
+            "annotation_sources": self.sources,
+            "annotation_properties": self.properties,
+            "annotation_linkouts": self.links,
+        }
+
+
+def get_annotations_for_metabolites(
+    session: Session,
+    reference_compound_ids: Iterable[int] = (),
+    component_ids: Iterable[int] = (),
+    exclude_obsolete_component_annotations: bool = False,
+) -> Tuple[Dict[int, List[Tuple[Dict[str, Any], Any]]], Dict[int, List[Tuple]]]:
+    """Load the annotations of many reference compounds and components at once.
+
+    All reference compound annotations are loaded with one query and all
+    component annotations with another (plus the constant number of select-in
+    loads for properties and links), regardless of the number of ids.
+
+    Returns
+    -------
+    tuple of two dicts
+        Mappings of reference compound id and component id to lists of
+        (processed annotation, annotation mapping) tuples, as expected by the
+        templates.
+    """
+    processed = {}
+
+    def process(ann):
+        if ann.id not in processed:
+            processed[ann.id] = process_annotation_for_template(ann)
+        return processed[ann.id]
+
+    ref_annotations = {}
+    reference_compound_ids = list(set(reference_compound_ids))
+    if reference_compound_ids:
+        ref_ann = session.execute(
+            select(Annotation, ReferenceCompoundAnnotationMapping)
+            .options(
+                selectinload(Annotation.properties),
+                selectinload(Annotation.links).joinedload(AnnotationLink.data_source),
+            )
+            .join(Annotation.reference_compound_mappings)
+            .filter(
+                ReferenceCompoundAnnotationMapping.reference_compound_id.in_(
+                    reference_compound_ids
+                )
+            )
+        ).all()
+        for ann, ann_map in ref_ann:
+            ref_annotations.setdefault(ann_map.reference_compound_id, []).append(
+                (process(ann), ann_map)
+            )
+
+    comp_annotations = {}
+    component_ids = list(set(component_ids))
+    if component_ids:
+        comp_query = (
+            select(Annotation, ComponentAnnotationMapping)
+            .options(
+                selectinload(Annotation.properties),
+                selectinload(Annotation.links).joinedload(AnnotationLink.data_source),
+            )
+            .join(Annotation.component_mappings)
+            .filter(ComponentAnnotationMapping.component_id.in_(component_ids))
+        )
+        if exclude_obsolete_component_annotations:
+            comp_query = comp_query.filter(Annotation.is_obsolete == False)
+        for ann, ann_map in session.execute(comp_query).all():
+            comp_annotations.setdefault(ann_map.component_id, []).append(
+                (process(ann), ann_map)
+            )
+
+    return ref_annotations, comp_annotations
+
+
 def get_metabolite(met_bigg_id, session):
     result_db = session.execute(
         select(UniversalComponent.bigg_id, UniversalComponent.name)
@@ -279,31 +402,6 @@ def get_metabolite(met_bigg_id, session):
         # else:
         #     raise utils.NotFoundError("No Component found with BiGG ID " + met_bigg_id)
 
-    comp_comp_db = session.execute(
-        select(
-            CompartmentalizedComponent.bigg_id,
-            Model.bigg_id,
-            Model.organism,
-        )
-        .join(
-            UniversalCompartmentalizedComponent,
-            CompartmentalizedComponent.universal_compartmentalized_component_id
-            == UniversalCompartmentalizedComponent.id,
-        )
-        .join(
-            ModelCompartmentalizedComponent,
-            ModelCompartmentalizedComponent.compartmentalized_component_id
-            == CompartmentalizedComponent.id,
-        )
-        .join(Model, Model.id == ModelCompartmentalizedComponent.model_id)
-        .join(
-            UniversalComponent,
-            UniversalComponent.id
-            == UniversalCompartmentalizedComponent.universal_component_id,
-        )
-        .filter(UniversalComponent.bigg_id == met_bigg_id)
-    ).all()
-
     default_component_db = session.scalars(
         select(Component)
         .join(
@@ -375,39 +473,8 @@ def get_metabolite(met_bigg_id, session):
                     for m in ref_map_db.reference_compound.reactive_part_matrix
                 ],
             }
-            ref_ann = session.execute(
-                select(Annotation, ReferenceCompoundAnnotationMapping)
-                .options(
-                    selectinload(Annotation.properties),
-                    selectinload(Annotation.links).joinedload(
-                        AnnotationLink.data_source
-                    ),
-                )
-                .join(Annotation.reference_compound_mappings)
-                .filter(
-                    ReferenceCompoundAnnotationMapping.reference_compound_id
-                    == ref_map_db.reference_compound.id
-                )
-                .join(ReferenceCompoundAnnotationMapping.reference_compound)
-            ).all()
-            if ref_ann:
-                ref["annotations"] = [
-                    (process_annotation_for_template(ann), ann_map)
-                    for ann, ann_map in ref_ann
-                ]
             references.append(ref)
 
-        comp_ann = session.execute(
-            select(Annotation, ComponentAnnotationMapping)
-            .options(
-                selectinload(Annotation.properties),
-                selectinload(Annotation.links).joinedload(AnnotationLink.data_source),
-            )
-            .join(Annotation.component_mappings)
-            .filter(Annotation.is_obsolete == False)
-            .filter(ComponentAnnotationMapping.component_id == component.id)
-        ).all()
-
         d = {
             "id": component.id,
             "bigg_id": component.bigg_id,
@@ -416,11 +483,6 @@ def get_metabolite(met_bigg_id, session):
             "formula": component.formula,
             "reference": references,
         }
-        if comp_ann:
-            d["annotations"] = [
-                (process_annotation_for_template(ann), ann_map)
-                for ann, ann_map in comp_ann
-            ]
         if (
             default_component is not None
             and default_component["bigg_id"] == d["bigg_id"]
@@ -430,6 +492,21 @@ def get_metabolite(met_bigg_id, session):
         else:
             components.append(d)
 
+    ref_annotations, comp_annotations = get_annotations_for_metabolites(
+        session,
+        reference_compound_ids=(
+            ref["id"] for comp in components for ref in comp["reference"]
+        ),
+        component_ids=(comp["id"] for comp in components),
+        exclude_obsolete_component_annotations=True,
+    )
+    for comp in components:
+        for ref in comp["reference"]:
+            if ref["id"] in ref_annotations:
+                ref["annotations"] = ref_annotations[ref["id"]]
+        if comp["id"] in comp_annotations:
+            comp["annotations"] = comp_annotations[comp["id"]]
+
     for comp in components:
         all_annotations = []
         for ref in comp["reference"]:
@@ -438,49 +515,28 @@ def get_metabolite(met_bigg_id, session):
         comp["all_annotations"] = all_annotations
 
     for comp in components:
-        a_sources = []
-        ap = {}
-        al = {}
-        for annotation, _ in comp["all_annotations"]:
-            for k, vs in annotation["properties"].items():
-                if k not in ap:
-                    ap[k] = {}
-                for v in vs:
-                    if v not in ap[k]:
-                        ap[k][v] = set()
-                    source = (annotation["type"], annotation["identifier"])
-                    if source not in a_sources:
-                        a_sources.append(source)
-                    ap[k][v].add(a_sources.index(source))
-            for k, vs in annotation["links"].items():
-                if k not in al:
-                    al[k] = {}
-                for v in vs:
-                    if v["value"] not in al[k]:
-                        al[k][v["value"]] = (v["url"], set())
-                    source = (annotation["type"], annotation["identifier"])
-                    if source not in a_sources:
-                        a_sources.append(source)
-                    al[k][v["value"]][1].add(a_sources.index(source))
-
-        comp["annotation_properties"] = ap
-        comp["annotation_linkouts"] = al
-        comp["annotation_sources"] = a_sources
+        aggregator = AnnotationAggregator.from_annotations(comp["all_annotations"])
+        comp["annotation_properties"] = aggregator.properties
+        comp["annotation_linkouts"] = aggregator.links
+        comp["annotation_sources"] = aggregator.sources
 
     metabolite_in_models_url = f"/universal/metabolite_in_models/{result_db[0]}"
     metabolite_in_models_columns = (
         metabolite_handlers.MetaboliteInModelsListViewHandler.column_specs
     )
+    # Only the first page of models is embedded, the table pages through the rest
+    metabolite_in_models = (
+        metabolite_handlers.MetaboliteInModelsListViewHandler.first_page(
+            session, bigg_id=result_db[0]
+        )
+    )
 
     return {
         "bigg_id": result_db[0],
         "name": result_db[1],
         "components": components,
         "default_component": default_component,
-        "compartments_in_models": [
-            {"bigg_id": c[0], "model_bigg_id": c[1], "organism": c[2]}
-            for c in comp_comp_db
-        ],
+        "metabolite_in_models": metabolite_in_models,
         "metabolite_in_models_url": metabolite_in_models_url,
         "metabolite_in_models_columns": metabolite_in_models_columns,
     }
@@ -563,25 +619,6 @@ def get_model_comp_metabolite(comp_met_id, model_bigg_id, session):
                 for m in ref_map_db.reference_compound.reactive_part_matrix
             ],
         }
-        ref_ann = session.execute(
-            select(Annotation, ReferenceCompoundAnnotationMapping)
-            .options(
-                selectinload(Annotation.properties),
-                selectinload(Annotation.links).joinedload(AnnotationLink.data_source),
-            )
-            .join(Annotation.reference_compound_mappings)
-            .filter(
-                ReferenceCompoundAnnotationMapping.reference_compound_id
-                == ref_map_db.reference_compound.id
-            )
-            .join(ReferenceCompoundAnnotationMapping.reference_compound)
-        ).all()
-        if ref_ann:
-            ref["annotations"] = [
-                (process_annotation_for_template(ann), ann_map)
-                for ann, ann_map in ref_ann
-            ]
-
         references.append(ref)
 
     model_db = get_model_list_for_metabolite(
@@ -589,54 +626,31 @@ def get_model_comp_metabolite(comp_met_id, model_bigg_id, session):
     )
     model_result = [x for x in model_db if x["bigg_id"] != model_bigg_id]
 
-    comp_ann = session.execute(
-        select(Annotation, ComponentAnnotationMapping)
-        .options(
-            selectinload(Annotation.properties),
-            selectinload(Annotation.links).joinedload(AnnotationLink.data_source),
-        )
-        .join(Annotation.component_mappings)
-        .filter(
-            ComponentAnnotationMapping.component_id
-            == model_comp_comp_db.compartmentalized_component.component.id
-        )
-    ).all()
+    component_db = model_comp_comp_db.compartmentalized_component.component
+    ref_annotations, comp_annotations = get_annotations_for_metabolites(
+        session,
+        reference_compound_ids=(
+            ref_map_db.reference_compound.id
+            for ref_map_db in component_db.reference_mappings
+        ),
+        component_ids=[component_db.id],
+    )
+    for ref, ref_map_db in zip(references, component_db.reference_mappings):
+        if ref_map_db.reference_compound.id in ref_annotations:
+            ref["annotations"] = ref_annotations[ref_map_db.reference_compound.id]
 
-    comp_ann = [
-        (process_annotation_for_template(ann), ann_map) for ann, ann_map in comp_ann
-    ]
+    comp_ann = comp_annotations.get(component_db.id, [])
     all_ann = []
     for ref in references:
         if (ref_ann := ref.get("annotations")) is not None:
             all_ann.extend(ref_ann)
     all_ann.extend(comp_ann)
 
-    annotation_sources = []
-    annotation_properties = {}
-    annotation_links = {}
-    for annotation, _ in all_ann:
-        for k, vs in annotation["properties"].items():
-            if k not in annotation_properties:
-                annotation_properties[k] = {}
-            for v in vs:
-                if v not in annotation_properties[k]:
-                    annotation_properties[k][v] = set()
-                source = (annotation["type"], annotation["identifier"])
-                if source not in annotation_sources:
-                    annotation_sources.append(source)
-                annotation_properties[k][v].add(annotation_sources.index(source))
-        for k, vs in annotation["links"].items():
-            if k not in annotation_links:
-                annotation_links[k] = {}
-            for v in vs:
-                if v["value"] not in annotation_links[k]:
-                    annotation_links[k][v["value"]] = (v["url"], set())
-                source = (annotation["type"], annotation["identifier"])
-                if source not in annotation_sources:
-                    annotation_sources.append(source)
-                annotation_links[k][v["value"]][1].add(annotation_sources.index(source))
+    aggregator = AnnotationAggregator.from_annotations(all_ann)
 
-    memote_result_db = get_memote_results_for_metabolite(session, model_comp_comp_db.id)
+    memote_result_db = get_memote_results_for_metabolite(
+        session, model_comp_comp_db.model_id, model_comp_comp_db.id
+    )
 
     metabolite_in_reactions_url = f"/models/{model_comp_comp_db.model.bigg_id}/metabolite_in_reactions/{model_comp_comp_db.bigg_id}"
     metabolite_in_reactions_columns = (
@@ -657,9 +671,7 @@ def get_model_comp_metabolite(comp_met_id, model_bigg_id, session):
         "other_models_with_metabolite": model_result,
         "references": references,
         "all_annotations": all_ann,
-        "annotation_sources": annotation_sources,
-        "annotation_properties": annotation_properties,
-        "annotation_linkouts": annotation_links,
+        **aggregator.as_template_dict(),
         "metabolite_in_reactions_url": metabolite_in_reactions_url,
         "metabolite_in_reactions_columns": metabolite_in_reactions_columns,
         "memote_result": memote_result_db,
@@ -0,0 +1,253 @@
+from biggr_models.queries import utils
+from hashlib import sha256
+import json
+import os
+from os import path
+import tempfile
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Downloadable model formats, as they appear in the file names
+MODEL_FILE_EXTENSIONS = ("xml", "xml.gz", "mat", "mat.gz", "json", "json.gz")
+# Seconds between two scans of the model directory
+MODEL_FILE_SCAN_INTERVAL = 300
+# Checksums computed by one server process, read by the others
+MODEL_FILE_CHECKSUM_FILE = path.join(
+    tempfile.gettempdir(), "biggr_model_file_checksums.json"
+)
+
+
+class ModelFileEntry(NamedTuple):
+    model_bigg_id: str
+    extension: str
+    filename: str
+    size: int
+    mtime: float
+    sha256: Optional[str]
+
+    def as_dict(self) -> dict:
+        return {
+            "filename": self.filename,
+            "format": self.extension,
+            "size": self.size,
+            "size_string": format_byte_size(self.size),
+            "modified": self.mtime,
+            "sha256": self.sha256,
+        }
+
+
+def format_byte_size(byte_size: int) -> Optional[str]:
+    if byte_size > 1048576:
+        return "%.1f MB" % (byte_size / 1048576.0)
+    elif byte_size > 1024:
+        return "%.1f kB" % (byte_size / 1024.0)
+    elif byte_size > 0:
+        return "%d B" % (byte_size)
+    return None
+
+
+def _split_model_filename(filename: str) -> Optional[Tuple[str, str]]:
+    for ext in sorted(MODEL_FILE_EXTENSIONS, key=len, reverse=True):
+        suffix = "." + ext
+        if filename.endswith(suffix) and len(filename) > len(suffix):
+            return filename[: -len(suffix)], ext
+    return None
+
+
+def _file_sha256(file_path: str) -> str:
+    digest = sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1048576), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelFileIndex:
+    """In-memory index of the downloadable model files.
+
+    The model directory is scanned once with ``os.scandir`` instead of calling
+    ``stat`` for every file on every request. Checksums are only recomputed for
+    files whose size or modification time changed since the previous scan.
+    Scans can share their checksums through a checksum file, so that only one
+    server process reads the files.
+    """
+
+    def __init__(self, model_dir: str):
+        self.model_dir = model_dir
+        self._entries: Dict[str, Dict[str, ModelFileEntry]] = {}
+        self._scanned = False
+        self._lock = threading.Lock()
+
+    @property
+    def scanned(self) -> bool:
+        return self._scanned
+
+    def scan(self, checksums: bool = True, checksum_file: Optional[str] = None) -> int:
+        """Rescan the model directory and return the number of indexed files.
+
+        Parameters
+        ----------
+        checksums: bool
+            Compute the checksums of new and changed files. Scans with
+            checksums write them to checksum_file.
+        checksum_file: str, optional
+            JSON file with the checksums of another scan, used for unchanged
+            files that have none in this index.
+        """
+        with self._lock:
+            previous = {
+                (entry.model_bigg_id, entry.extension): entry
+                for files in self._entries.values()
+                for entry in files.values()
+            }
+            if checksum_file is not None:
+                for key, entry in self._read_checksum_file(checksum_file).items():
+                    if previous.get(key) is None or previous[key].sha256 is None:
+                        previous[key] = entry
+            entries, count = self._scan_entries(previous, checksums)
+            # swap in the new index at once, readers never see a partial scan
+            self._entries = entries
+            self._scanned = True
+            if checksums and checksum_file is not None:
+                self._write_checksum_file(checksum_file, entries)
+            return count
+
+    def _scan_entries(
+        self, previous: Dict[Tuple[str, str], ModelFileEntry], checksums: bool
+    ) -> Tuple[Dict[str, Dict[str, ModelFileEntry]], int]:
+        entries: Dict[str, Dict[str, ModelFileEntry]] = {}
+        try:
+            dir_entries = list(os.scandir(self.model_dir))
+        except OSError as e:
+            print("Could not scan model directory %s: %s" % (self.model_dir, e))
+            dir_entries = []
+        count = 0
+        for dir_entry in dir_entries:
+            split = _split_model_filename(dir_entry.name)
+            if split is None:
+                continue
+            try:
+                if not dir_entry.is_file():
+                    continue
+                stat = dir_entry.stat()
+            except OSError:
+                continue
+            model_bigg_id, ext = split
+            old = previous.get(split)
+            checksum = None
+            if (
+                old is not None
+                and old.size == stat.st_size
+                and old.mtime == stat.st_mtime
+            ):
+                checksum = old.sha256
+            if checksum is None and checksums:
+                try:
+                    checksum = _file_sha256(dir_entry.path)
+                except OSError:
+                    checksum = None
+            entries.setdefault(model_bigg_id, {})[ext] = ModelFileEntry(
+                model_bigg_id=model_bigg_id,
+                extension=ext,
+                filename=dir_entry.name,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                sha256=checksum,
+            )
+            count += 1
+        return entries, count
+
+    def _read_checksum_file(
+        self, checksum_file: str
+    ) -> Dict[Tuple[str, str], ModelFileEntry]:
+        try:
+            with open(checksum_file) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("model_dir") != path.abspath(self.model_dir):
+            return {}
+        return {
+            (entry[0], entry[1]): ModelFileEntry(*entry)
+            for entry in data.get("files", [])
+        }
+
+    def _write_checksum_file(
+        self, checksum_file: str, entries: Dict[str, Dict[str, ModelFileEntry]]
+    ):
+        data = {
+            "model_dir": path.abspath(self.model_dir),
+            "files": [
+                list(entry) for files in entries.values() for entry in files.values()
+            ],
+        }
+        try:
+            utils.write_file_atomic(checksum_file, json.dumps(data).encode("utf-8"))
+        except OSError as e:
+            print("Could not store model file checksums %s: %s" % (checksum_file, e))
+
+    def get_files(self, model_bigg_id: str) -> Dict[str, ModelFileEntry]:
+        if not self._scanned:
+            # not scanned yet, only stat the files of this model
+            return self._stat_model_files(model_bigg_id)
+        return self._entries.get(model_bigg_id, {})
+
+    def get_all_files(self) -> Dict[str, Dict[str, ModelFileEntry]]:
+        if not self._scanned:
+            # not scanned yet, list the files without checksums
+            return self._scan_entries({}, checksums=False)[0]
+        return self._entries
+
+    def _stat_model_files(self, model_bigg_id: str) -> Dict[str, ModelFileEntry]:
+        files = {}
+        for ext in MODEL_FILE_EXTENSIONS:
+            filename = model_bigg_id + "." + ext
+            try:
+                stat = os.stat(path.join(self.model_dir, filename))
+            except OSError:
+                continue
+            files[ext] = ModelFileEntry(
+                model_bigg_id, ext, filename, stat.st_size, stat.st_mtime, None
+            )
+        return files
+
+
+_model_file_index: Optional[ModelFileIndex] = None
+
+
+def get_model_file_index(model_dir: str) -> ModelFileIndex:
+    """Return the process wide index of the files in model_dir."""
+    global _model_file_index
+    if _model_file_index is None or _model_file_index.model_dir != model_dir:
+        _model_file_index = ModelFileIndex(model_dir)
+    return _model_file_index
+
+
+def get_model_file_sizes(model_bigg_id: str, model_dir: str) -> Dict[str, str]:
+    """Return the formatted sizes for the model page, keyed by ``<ext>_size``."""
+    result = {}
+    for ext, entry in get_model_file_index(model_dir).get_files(model_bigg_id).items():
+        size_string = format_byte_size(entry.size)
+        if size_string is not None:
+            result[ext.replace(".", "_") + "_size"] = size_string
+    return result
+
+
+def get_model_files(model_bigg_id: str, model_dir: str) -> List[dict]:
+    files = get_model_file_index(model_dir).get_files(model_bigg_id)
+    if not files:
+        raise utils.NotFoundError("No model files found for " + model_bigg_id)
+    return [files[ext].as_dict() for ext in MODEL_FILE_EXTENSIONS if ext in files]
+
+
+def get_model_file_listing(model_dir: str) -> List[dict]:
+    all_files = get_model_file_index(model_dir).get_all_files()
+    return [
+        {
+            "model_bigg_id": model_bigg_id,
+            "files": [
+                files[ext].as_dict() for ext in MODEL_FILE_EXTENSIONS if ext in files
+            ],
+        }
+        for model_bigg_id, files in sorted(all_files.items())
+    ]
@@ -1,6 +1,6 @@
-from typing import Iterable, List, Optional, Tuple, Union
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 from sqlalchemy.orm import Session, joinedload, subqueryload
-from biggr_models.queries import utils
+from biggr_models.queries import model_file_queries, utils
 from dataclasses import dataclass
 
 from cobradb.util import ref_tuple_to_str
@@ -13,11 +13,14 @@ from cobradb.models import (
     ModelReaction,
     ModelReactionEscherMapping,
     PublicationModel,
+    Reaction,
     Taxon,
     TaxonomicRank,
 )
 
 from sqlalchemy import func, select
+from hashlib import sha1
+import json
 from os import path
 
 from biggr_models.queries.memote_queries import get_general_results_for_model
@@ -103,6 +106,80 @@ def get_models(
     ]
 
 
+@utils.cache_per_database_version()
+def get_escher_module_availability(session: Session) -> Dict[str, List[Dict[str, Any]]]:
+    """Compute the Escher modules available for every model.
+
+    The mappings of all models are aggregated at once, the result is cached
+    until the database version changes.
+
+    Returns
+    -------
+    dict
+        Mapping of model BiGG ID to a list of modules with keys 'id', 'bigg_id',
+        'name', 'description', 'reaction_count' (number of mapped model
+        reactions) and 'coverage' (fraction of the universal reactions mapped to
+        the module in any model that are present in this model).
+    """
+    module_totals = dict(
+        session.execute(
+            select(
+                EscherModule.id,
+                func.count(Reaction.universal_reaction_id.distinct()),
+            )
+            .join(EscherModule.model_reaction_mappings)
+            .join(ModelReactionEscherMapping.model_reaction)
+            .join(ModelReaction.reaction)
+            .group_by(EscherModule.id)
+        ).all()
+    )
+    result_db = session.execute(
+        select(
+            Model.bigg_id,
+            EscherModule.id,
+            EscherModule.bigg_id,
+            EscherModule.name,
+            EscherModule.description,
+            func.count(ModelReactionEscherMapping.id),
+            func.count(Reaction.universal_reaction_id.distinct()),
+        )
+        .select_from(EscherModule)
+        .join(EscherModule.model_reaction_mappings)
+        .join(ModelReactionEscherMapping.model_reaction)
+        .join(ModelReaction.reaction)
+        .join(ModelReaction.model)
+        .group_by(Model.bigg_id, EscherModule.id)
+        .order_by(Model.bigg_id, EscherModule.id)
+    ).all()
+
+    availability = {}
+    for model_bigg_id, module_id, bigg_id, name, description, count, n in result_db:
+        total = module_totals.get(module_id)
+        availability.setdefault(model_bigg_id, []).append(
+            {
+                "id": module_id,
+                "bigg_id": bigg_id,
+                "name": name,
+                "description": description,
+                "reaction_count": count,
+                "coverage": n / total if total else 0.0,
+            }
+        )
+    return availability
+
+
+def get_escher_modules_for_model(
+    session: Session, model_bigg_id: str
+) -> List[Dict[str, Any]]:
+    """Return the Escher module availability of a model."""
+    model_id = session.scalars(
+        select(Model.id).filter(Model.bigg_id == model_bigg_id).limit(1)
+    ).first()
+    if model_id is None:
+        raise utils.NotFoundError("No Model found with BiGG ID " + model_bigg_id)
+    return get_escher_module_availability(session).get(model_bigg_id, [])
+
+
 def get_model_and_counts(
     model_bigg_id,
     session,
@@ -126,16 +203,11 @@ def get_model_and_counts(
     if model_db is None:
         raise utils.NotFoundError("No Model found with BiGG ID " + model_bigg_id)
 
-    escher_modules = list(
-        session.scalars(
-            select(EscherModule)
-            .join(EscherModule.model_reaction_mappings)
-            .join(ModelReactionEscherMapping.model_reaction)
-            .filter(ModelReaction.model_id == model_db.id)
-            .group_by(EscherModule.id)
-            .having(func.count(ModelReactionEscherMapping.id) > 1)
-        ).all()
-    )
+    escher_modules = [
+        x
+        for x in get_escher_module_availability(session).get(model_db.bigg_id, [])
+        if x["reaction_count"] > 1
+    ]
     # genome ref
     genome_strain = None
     organism = getattr(model_db, "organism", None)
@@ -181,18 +253,9 @@ def get_model_and_counts(
     result["memote_result"] = memote_result_db
 
     if static_model_dir:
-        # get filesizes
-        for ext in ("xml", "xml_gz", "mat", "mat_gz", "json", "json_gz"):
-            fpath = path.join(
-                static_model_dir, model_bigg_id + "." + ext.replace("_", ".")
-            )
-            byte_size = path.getsize(fpath) if path.isfile(fpath) else 0
-            if byte_size > 1048576:
-                result[ext + "_size"] = "%.1f MB" % (byte_size / 1048576.0)
-            elif byte_size > 1024:
-                result[ext + "_size"] = "%.1f kB" % (byte_size / 1024.0)
-            elif byte_size > 0:
-                result[ext + "_size"] = "%d B" % (byte_size)
+        result.update(
+            model_file_queries.get_model_file_sizes(model_bigg_id, static_model_dir)
+        )
     return result
 
 
@@ -268,6 +331,14 @@ class TreeNode:
     def node_type(self):
         return self.__class__.__name__.lower().replace("treenode", "")
 
+    def as_dict(self) -> Dict[str, Any]:
+        """Serialize the (sub)tree to plain dicts, as used by the template."""
+        return {
+            "node_type": self.node_type,
+            "name": self.name,
+            "children": [child.as_dict() for child in self.children],
+        }
+
     def __repr__(self):
         return self._indented_repr()
 
@@ -309,6 +380,13 @@ class TaxonTreeNode(TreeNode):
 
         super().recursive_collapse(parent=parent, stops=stops)
 
+    def as_dict(self) -> Dict[str, Any]:
+        result = super().as_dict()
+        result["tax_id"] = self.tax_id
+        result["rank_id"] = self.rank_id
+        result["hidden_taxons"] = self.hidden_taxons
+        return result
+
 
 @dataclass
 class CollectionTreeNode(TreeNode):
@@ -324,28 +402,49 @@ class CollectionTreeNode(TreeNode):
             parent.children.append(single_child)
             single_child.recursive_collapse(parent, stops=stops)
 
+    def as_dict(self) -> Dict[str, Any]:
+        result = super().as_dict()
+        result["collection"] = {
+            "bigg_id": self.collection.bigg_id,
+            "oneliner": self.collection.oneliner,
+        }
+        return result
+
 
 @dataclass
 class ModelTreeNode(TreeNode):
     model: Model
 
+    def as_dict(self) -> Dict[str, Any]:
+        result = super().as_dict()
+        genome = self.model.genome
+        result["model"] = {
+            "bigg_id": self.model.bigg_id,
+            "organism": getattr(self.model, "organism", None),
+            "genome": None if genome is None else {"strain": genome.strain},
+        }
+        return result
+
 
-def get_model_collections_and_taxons(session: Session):
+@utils.cache_per_database_version()
+def get_model_collections_and_taxons(session: Session) -> Dict[str, Any]:
+    """Build the taxonomic tree of all model collections.
+
+    The tree is returned as plain dicts, together with an etag of its
+    serialization. The result is cached until the database version changes.
+    """
     collections_db = session.scalars(
         select(ModelCollection).options(
             subqueryload(ModelCollection.models).joinedload(Model.genome)
         )
     ).all()
 
-    tax_ids = set()
+    collections_by_taxon: Dict[int, List[ModelCollection]] = {}
     for collection in collections_db:
-        tax_ids.add(collection.taxon_id)
-        # for model in collection.models:
-        #     tax_ids.add(model.taxon_id)
-    try:
-        tax_ids.remove(None)
-    except KeyError:
-        pass
+        if collection.taxon_id is not None:
+            collections_by_taxon.setdefault(collection.taxon_id, []).append(
+                collection
+            )
 
     stop_rank_ids = list(
         session.scalars(
@@ -355,7 +454,12 @@ def get_model_collections_and_taxons(session: Session):
         ).all()
     )
 
-    taxons = get_taxons_recursively(session, starting_id=tax_ids)
+    taxons = get_taxons_recursively(session, starting_id=set(collections_by_taxon))
+
+    children_by_parent: Dict[int, List[Tuple[int, str, int]]] = {}
+    for tax_id, parent_id, name, rank_id in taxons:
+        if parent_id != tax_id:
+            children_by_parent.setdefault(parent_id, []).append((tax_id, name, rank_id))
 
     tree = next(
         TaxonTreeNode(name=name, tax_id=tax_id, rank_id=rank_id, children=[])
@@ -368,15 +472,13 @@ def get_model_collections_and_taxons(session: Session):
         old_front = front
         front = []
         for node in old_front:
-            new_nodes_gen = (
-                TaxonTreeNode(name=name, tax_id=tax_id, rank_id=rank_id, children=[])
-                for tax_id, parent_id, name, rank_id in taxons
-                if parent_id == node.tax_id and tax_id != node.tax_id
-            )
-            for new_node in new_nodes_gen:
+            for tax_id, name, rank_id in children_by_parent.get(node.tax_id, []):
+                new_node = TaxonTreeNode(
+                    name=name, tax_id=tax_id, rank_id=rank_id, children=[]
+                )
                 node.children.append(new_node)
                 front.append(new_node)
-            collection_node_gen = [
+            node.children.extend(
                 CollectionTreeNode(
                     name=collection.bigg_id,
                     collection=collection,
@@ -385,14 +487,14 @@ def get_model_collections_and_taxons(session: Session):
                         for model in collection.models
                     ],
                 )
-                for collection in collections_db
-                if collection.taxon_id == node.tax_id
-            ]
-            node.children.extend(collection_node_gen)
+                for collection in collections_by_taxon.get(node.tax_id, [])
+            )
 
     # Join taxon nodes with only one (taxon) child.
     for child in tree.children:
         if isinstance(child, TaxonTreeNode):
             child.recursive_collapse(parent=tree, stops=stop_rank_ids)
 
-    return {"tree": tree}
+    tree_dict = tree.as_dict()
+    etag = sha1(json.dumps(tree_dict, sort_keys=True).encode("utf-8")).hexdigest()
+    return {"tree": tree_dict, "etag": '"%s"' % etag}
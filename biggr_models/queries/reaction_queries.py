@@ -6,6 +6,7 @@ from sqlalchemy.orm import (
     joinedload,
     Session,
 )
+from biggr_models.handlers import reaction_handlers
 from biggr_models.handlers.utils import format_bigg_id
 from biggr_models.queries import utils
 from cobradb.models import (
@@ -35,10 +36,13 @@ from cobradb.models import (
 )
 from cobradb.parse import split_id_and_copy_tag
 from sqlalchemy import func, asc, select
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 from biggr_models.queries.memote_queries import get_memote_results_for_reaction
-from biggr_models.queries.metabolite_queries import process_annotation_for_template
+from biggr_models.queries.metabolite_queries import (
+    AnnotationAggregator,
+    process_annotation_for_template,
+)
 
 
 def get_universal_reactions_count(session):
@@ -286,21 +290,127 @@ def _get_metabolite_and_reference_list_for_reaction(reaction_id, session):
     ]
 
 
+# Number of universal reactions whose aligned reaction strings are kept in memory
+ALIGNED_REACTION_CACHE_SIZE = 2048
+
+
+def _format_aligned_participants(sides) -> List[str]:
+    l = []
+    for lr in [0, 1]:
+        prev_empty = True
+        for participant in sides[lr]:
+            if participant is None:
+                l.append("")
+                continue
+            formatted_bigg_id, m_coeff = participant
+            coeff = ""
+            if (m_coeff := abs(float(m_coeff))) != 1:
+                if m_coeff.is_integer():
+                    m_coeff = int(m_coeff)
+                coeff = f"<span class='fw-bold'>{m_coeff}</span> "
+            prefix = "" if prev_empty else "+ "
+
+            l.append(f"{prefix}{coeff}{formatted_bigg_id}")
+            prev_empty = False
+        if lr == 0:
+            l.append(" &#8652; ")
+    return l
+
+
+@utils.cache_per_database_version(maxsize=ALIGNED_REACTION_CACHE_SIZE)
+def get_aligned_reaction_strings(
+    session: Session, universal_reaction_id: int
+) -> Dict[Any, List[str]]:
+    """Align the participants of all reactions of a universal reaction.
+
+    Every reaction participant is placed in the column of its universal
+    reaction matrix entry. Participants without a universal column are put in
+    padding columns appended to the side they are on, shared between reactions
+    where possible.
+
+    Returns
+    -------
+    dict
+        The formatted universal reaction under the key "urm" and the formatted
+        reactions under their reaction id, all padded to the same length. The
+        result is cached and must not be modified.
+    """
+    urm_db = session.execute(
+        select(
+            UniversalReactionMatrix.id,
+            UniversalReactionMatrix.coefficient,
+            UniversalCompartmentalizedComponent.bigg_id,
+        )
+        .select_from(UniversalReaction)
+        .join(UniversalReaction.matrix)
+        .join(UniversalReactionMatrix.universal_compartmentalized_component)
+        .filter(UniversalReaction.id == universal_reaction_id)
+        .order_by(UniversalReactionMatrix.id)
+    ).all()
+    reaction_ids = session.scalars(
+        select(Reaction.id)
+        .filter(Reaction.universal_reaction_id == universal_reaction_id)
+        .order_by(Reaction.id)
+    ).all()
+    rm_db = session.execute(
+        select(
+            ReactionMatrix.reaction_id,
+            ReactionMatrix.universal_reaction_matrix_id,
+            UniversalReactionMatrix.coefficient,
+            CompartmentalizedComponent.bigg_id,
+        )
+        .join(ReactionMatrix.universal_reaction_matrix)
+        .join(ReactionMatrix.compartmentalized_component)
+        .join(Reaction, Reaction.id == ReactionMatrix.reaction_id)
+        .filter(Reaction.universal_reaction_id == universal_reaction_id)
+        .order_by(ReactionMatrix.reaction_id, ReactionMatrix.id)
+    ).all()
+
+    # Column of every universal matrix entry on its side of the reaction
+    urm_columns = ({}, {})
+    urm_sides = ([], [])
+    for urm_id, coefficient, bigg_id in urm_db:
+        lr = int(coefficient > 0)
+        urm_columns[lr][urm_id] = len(urm_sides[lr])
+        urm_sides[lr].append(
+            (format_bigg_id(bigg_id, format_type="universal_comp_comp"), coefficient)
+        )
+    # Padding columns without a universal participant, appended per side
+    padding_columns = ([], [])
+
+    reaction_columns = {reaction_id: ({}, {}) for reaction_id in reaction_ids}
+    for reaction_id, urm_id, coefficient, bigg_id in rm_db:
+        lr = int(coefficient > 0)
+        columns = reaction_columns[reaction_id][lr]
+        participant = (format_bigg_id(bigg_id, format_type="comp_comp"), coefficient)
+        pos = urm_columns[lr].get(urm_id)
+        if pos is None:
+            pos = next((i for i in padding_columns[lr] if i not in columns), None)
+            if pos is None:
+                pos = len(urm_sides[lr]) + len(padding_columns[lr])
+                padding_columns[lr].append(pos)
+        columns[pos] = participant
+
+    side_lengths = [len(urm_sides[lr]) + len(padding_columns[lr]) for lr in [0, 1]]
+    aligned_reaction_strings = {
+        "urm": _format_aligned_participants(
+            [urm_sides[lr] + [None] * len(padding_columns[lr]) for lr in [0, 1]]
+        )
+    }
+    for reaction_id, sides in reaction_columns.items():
+        aligned_reaction_strings[reaction_id] = _format_aligned_participants(
+            [[sides[lr].get(i) for i in range(side_lengths[lr])] for lr in [0, 1]]
+        )
+    return aligned_reaction_strings
+
+
 def get_universal_reaction_and_models(
     session: Session, reaction_bigg_id: str
 ) -> Dict[str, Any]:
     universal_reaction_db = session.scalars(
         select(UniversalReaction)
         .options(
-            subqueryload(UniversalReaction.reactions).options(
-                subqueryload(Reaction.model_reactions).joinedload(ModelReaction.model),
-                subqueryload(Reaction.matrix).options(
-                    joinedload(ReactionMatrix.universal_reaction_matrix),
-                    joinedload(ReactionMatrix.compartmentalized_component).joinedload(
-                        CompartmentalizedComponent.compartment
-                    ),
-                ),
-            ),
+            subqueryload(UniversalReaction.reactions),
             joinedload(UniversalReaction.collection),
             joinedload(UniversalReaction.reference).options(
                 subqueryload(
@@ -336,12 +446,6 @@ def get_universal_reaction_and_models(
     if not universal_reaction_db:
         raise utils.NotFoundError("No Reaction found with BiGG ID " + reaction_bigg_id)
 
-    model_reactions = [
-        model_reaction_db
-        for reaction_db in universal_reaction_db.reactions
-        for model_reaction_db in reaction_db.model_reactions
-    ]
-
     all_annotations = []
     if universal_reaction_db.reference:
         all_annotations.extend(
@@ -360,110 +464,24 @@ def get_universal_reaction_and_models(
         for annotation_mapping in reaction_db.annotation_mappings
     )
 
-    aligned_metabolite_ids = {"universal": ([], []), "urm": ([], [])}
-    for urm in universal_reaction_db.matrix:
-        aligned_metabolite_ids["universal"][int(urm.coefficient > 0)].append(urm.id)
-        aligned_metabolite_ids["urm"][int(urm.coefficient > 0)].append(urm)
+    aligned_reaction_strings = get_aligned_reaction_strings(
+        session, universal_reaction_db.id
+    )
 
-    for reaction_db in universal_reaction_db.reactions:
-        aligned_metabolite_ids[reaction_db.id] = (
-            [None] * len(aligned_metabolite_ids["universal"][0]),
-            [None] * len(aligned_metabolite_ids["universal"][1]),
-        )
-        for rm in reaction_db.matrix:
-            urm_id = rm.universal_reaction_matrix_id
-            lr = int(rm.universal_reaction_matrix.coefficient > 0)
-            if urm_id in aligned_metabolite_ids["universal"][lr]:
-                aligned_metabolite_ids[reaction_db.id][lr][
-                    aligned_metabolite_ids["universal"][lr].index(urm_id)
-                ] = rm
-            else:
-                pos = None
-                for i in range(len(aligned_metabolite_ids["universal"][lr])):
-                    if aligned_metabolite_ids["universal"][lr][i] is not None:
-                        continue
-                    if aligned_metabolite_ids[reaction_db.id][lr][i] is not None:
-                        continue
-                    pos = i
-                    break
-                if pos is None:
-                    for k in aligned_metabolite_ids.keys():
-                        aligned_metabolite_ids[k][lr].append(None)
-                    pos = -1
-                aligned_metabolite_ids[reaction_db.id][lr][pos] = rm
-
-    del aligned_metabolite_ids["universal"]
-    aligned_reaction_strings = {}
-    for k, v in aligned_metabolite_ids.items():
-        l = []
-        for lr in [0, 1]:
-            prev_empty = True
-            for rm in v[lr]:
-                if rm is None:
-                    l.append("")
-                    continue
-                if k == "urm":
-                    formatted_bigg_id = format_bigg_id(
-                        rm.universal_compartmentalized_component.bigg_id,
-                        format_type="universal_comp_comp",
-                    )
-                else:
-                    formatted_bigg_id = format_bigg_id(
-                        rm.compartmentalized_component.bigg_id, format_type="comp_comp"
-                    )
+    # Only the first page of models is embedded, the table pages through the rest
+    reaction_in_models = reaction_handlers.ReactionInModelsListViewHandler.first_page(
+        session, bigg_id=reaction_bigg_id
+    )
 
-                coeff = ""
-                if k == "urm":
-                    m_coeff = rm.coefficient
-                else:
-                    m_coeff = rm.universal_reaction_matrix.coefficient
-                if (m_coeff := abs(float(m_coeff))) != 1:
-                    if m_coeff.is_integer():
-                        m_coeff = int(m_coeff)
-                    coeff = f"<span class='fw-bold'>{coeff}</span> "
-                prefix = "" if prev_empty else "+ "
-
-                s = f"{prefix}{coeff}{formatted_bigg_id}"
-                l.append(s)
-                prev_empty = False
-            if lr == 0:
-                l.append(" &#8652; ")
-        aligned_reaction_strings[k] = l
-
-    annotation_sources = []
-    annotation_properties = {}
-    annotation_links = {}
-    for annotation, _ in all_annotations:
-        for k, vs in annotation["properties"].items():
-            if k not in annotation_properties:
-                annotation_properties[k] = {}
-            for v in vs:
-                if v not in annotation_properties[k]:
-                    annotation_properties[k][v] = set()
-                source = (annotation["type"], annotation["identifier"])
-                if source not in annotation_sources:
-                    annotation_sources.append(source)
-                annotation_properties[k][v].add(annotation_sources.index(source))
-        for k, vs in annotation["links"].items():
-            if k not in annotation_links:
-                annotation_links[k] = {}
-            for v in vs:
-                if v["value"] not in annotation_links[k]:
-                    annotation_links[k][v["value"]] = (v["url"], set())
-                source = (annotation["type"], annotation["identifier"])
-                if source not in annotation_sources:
-                    annotation_sources.append(source)
-                annotation_links[k][v["value"]][1].add(annotation_sources.index(source))
+    aggregator = AnnotationAggregator.from_annotations(all_annotations)
 
     return {
         "universal_reaction": universal_reaction_db,
         "reference": universal_reaction_db.reference,
         "all_annotations": all_annotations,
         "aligned_reactions": aligned_reaction_strings,
-        "model_reactions": model_reactions,
-        "annotation_sources": annotation_sources,
-        "annotation_properties": annotation_properties,
-        "annotation_linkouts": annotation_links,
+        "reaction_in_models": reaction_in_models,
+        **aggregator.as_template_dict(),
     }
 
 
@@ -496,7 +514,7 @@ def get_model_list_for_reaction(reaction_bigg_id, session):
         .filter(UniversalReaction.bigg_id == reaction_bigg_id)
         .distinct()
     ).all()
-    return [{"bigg_id": x[0]} for x in result]
+    return [{"bigg_id": x} for x in result]
 
 
 def get_reference_for_reaction(reaction_bigg_id, session):
@@ -519,6 +537,55 @@ def get_reference_for_reaction(reaction_bigg_id, session):
     return result
 
 
+def _get_reference_and_annotations_for_reaction(reaction_bigg_id, session):
+    reference_db = get_reference_for_reaction(reaction_bigg_id, session)
+    if reference_db is None:
+        return None, []
+    ref_ann = session.execute(
+        select(Annotation, ReferenceReactionAnnotationMapping)
+        .options(
+            selectinload(Annotation.properties),
+            selectinload(Annotation.links).joinedload(AnnotationLink.data_source),
+        )
+        .join(Annotation.reference_reaction_mappings)
+        .filter(
+            ReferenceReactionAnnotationMapping.reference_reaction_id == reference_db.id
+        )
+        .join(ReferenceReactionAnnotationMapping.reference_reaction)
+    ).all()
+    return reference_db, [
+        (process_annotation_for_template(ann), ann_map) for ann, ann_map in ref_ann
+    ]
+
+
+def _get_annotations_for_reaction(reaction_id, session):
+    reaction_ann = session.execute(
+        select(Annotation, ReactionAnnotationMapping)
+        .options(
+            selectinload(Annotation.properties),
+            selectinload(Annotation.links).joinedload(AnnotationLink.data_source),
+        )
+        .join(Annotation.reaction_mappings)
+        .filter(ReactionAnnotationMapping.reaction_id == reaction_id)
+    ).all()
+    return [
+        (process_annotation_for_template(ann), ann_map) for ann, ann_map in reaction_ann
+    ]
+
+
+def _get_other_copy_numbers_for_model_reaction(
+    universal_reaction_id, model_id, copy_number, session
+):
+    all_other_copy_numbers = session.scalars(
+        select(ModelReaction.copy_number)
+        .join(Reaction, Reaction.id == ModelReaction.reaction_id)
+        .filter(Reaction.universal_reaction_id == universal_reaction_id)
+        .filter(ModelReaction.model_id == model_id)
+        .filter(ModelReaction.copy_number != copy_number)
+    ).all()
+    return list(sorted(x for x in all_other_copy_numbers))
+
+
 def get_model_reaction(model_bigg_id, biggr_id, session):
     """Get details about this reaction in the given model. Returns multiple
     results when the reaction appears in the model multiple times.
@@ -554,99 +621,49 @@ def get_model_reaction(model_bigg_id, biggr_id, session):
             "Reaction %s not found in model %s" % (reaction_bigg_id, model_bigg_id)
         )
 
-    # metabolites
-    metabolite_db = _get_metabolite_and_reference_list_for_reaction(
-        model_reaction_db.reaction_id, session
+    # The remaining queries only depend on the model reaction row. Read its
+    # columns here so that the worker threads do not touch this session.
+    model_reaction_id = model_reaction_db.id
+    reaction_id = model_reaction_db.reaction_id
+    universal_reaction_id = model_reaction_db.reaction.universal_reaction_id
+    model_id = model_reaction_db.model_id
+    copy_number = model_reaction_db.copy_number
+    results = utils.run_concurrently(
+        session,
+        {
+            "metabolites": lambda s: _get_metabolite_and_reference_list_for_reaction(
+                reaction_id, s
+            ),
+            "models": lambda s: get_model_list_for_reaction(reaction_bigg_id, s),
+            "reference": lambda s: _get_reference_and_annotations_for_reaction(
+                reaction_bigg_id, s
+            ),
+            "reaction_annotations": lambda s: _get_annotations_for_reaction(
+                reaction_id, s
+            ),
+            "other_copy_numbers": lambda s: _get_other_copy_numbers_for_model_reaction(
+                universal_reaction_id, model_id, copy_number, s
+            ),
+            "genes": lambda s: _get_gene_list_for_model_reaction(model_reaction_id, s),
+            "memote_result": lambda s: get_memote_results_for_reaction(
+                s, model_id, model_reaction_id
+            ),
+        },
     )
-
-    # models
-    model_db = get_model_list_for_reaction(reaction_bigg_id, session)
-    model_result = [x for x in model_db if x != model_bigg_id]
-
-    # reference
-    reference_db = get_reference_for_reaction(reaction_bigg_id, session)
-
-    all_annotations = []
-    if reference_db is not None:
-        ref_ann = session.execute(
-            select(Annotation, ReferenceReactionAnnotationMapping)
-            .options(
-                selectinload(Annotation.properties),
-                selectinload(Annotation.links).joinedload(AnnotationLink.data_source),
-            )
-            .join(Annotation.reference_reaction_mappings)
-            .filter(
-                ReferenceReactionAnnotationMapping.reference_reaction_id
-                == reference_db.id
-            )
-            .join(ReferenceReactionAnnotationMapping.reference_reaction)
-        ).all()
-        if ref_ann:
-            ref_annotations = [
-                (process_annotation_for_template(ann), ann_map)
-                for ann, ann_map in ref_ann
-            ]
-            all_annotations.extend(ref_annotations)
-
-    reaction_ann = session.execute(
-        select(Annotation, ReactionAnnotationMapping)
-        .options(
-            selectinload(Annotation.properties),
-            selectinload(Annotation.links).joinedload(AnnotationLink.data_source),
-        )
-        .join(Annotation.reaction_mappings)
-        .filter(ReactionAnnotationMapping.reaction_id == model_reaction_db.reaction_id)
-    ).all()
-    if reaction_ann:
-        reaction_annotations = [
-            (process_annotation_for_template(ann), ann_map)
-            for ann, ann_map in reaction_ann
-        ]
-        all_annotations.extend(reaction_annotations)
-
-    annotation_sources = []
-    annotation_properties = {}
-    annotation_links = {}
-    for annotation, _ in all_annotations:
-        for k, vs in annotation["properties"].items():
-            if k not in annotation_properties:
-                annotation_properties[k] = {}
-            for v in vs:
-                if v not in annotation_properties[k]:
-                    annotation_properties[k][v] = set()
-                source = (annotation["type"], annotation["identifier"])
-                if source not in annotation_sources:
-                    annotation_sources.append(source)
-                annotation_properties[k][v].add(annotation_sources.index(source))
-        for k, vs in annotation["links"].items():
-            if k not in annotation_links:
-                annotation_links[k] = {}
-            for v in vs:
-                if v["value"] not in annotation_links[k]:
-                    annotation_links[k][v["value"]] = (v["url"], set())
-                source = (annotation["type"], annotation["identifier"])
-                if source not in annotation_sources:
-                    annotation_sources.append(source)
-                annotation_links[k][v["value"]][1].add(annotation_sources.index(source))
-
-    all_other_copy_numbers = session.scalars(
-        select(ModelReaction.copy_number)
-        .join(Reaction, Reaction.id == ModelReaction.reaction_id)
-        .filter(
-            Reaction.universal_reaction_id
-            == model_reaction_db.reaction.universal_reaction_id
-        )
-        .filter(ModelReaction.model_id == model_reaction_db.model_id)
-        .filter(ModelReaction.copy_number != model_reaction_db.copy_number)
-    ).all()
-    other_copy_numbers = list(sorted(x for x in all_other_copy_numbers))
+    metabolite_db = results["metabolites"]
+    model_result = [x for x in results["models"] if x["bigg_id"] != model_bigg_id]
+    reference_db, all_annotations = results["reference"]
+    all_annotations.extend(results["reaction_annotations"])
+    aggregator = AnnotationAggregator.from_annotations(all_annotations)
+    other_copy_numbers = results["other_copy_numbers"]
+    gene_db = results["genes"]
+    memote_result_db = results["memote_result"]
 
     # # old identifiers
     # old_id_results = id_queries._get_old_ids_for_model_reaction(
     #     model_bigg_id, reaction_bigg_id, session
     # )
 
-    gene_db = _get_gene_list_for_model_reaction(model_reaction_db.id, session)
     reaction_string = utils.build_reaction_string(
         metabolite_db,
         model_reaction_db.lower_bound,
@@ -654,7 +671,6 @@ def get_model_reaction(model_bigg_id, biggr_id, session):
         False,
         format_met="comp_comp",
     )
-    memote_result_db = get_memote_results_for_reaction(session, model_reaction_db.id)
 
     return {
         "bigg_id": reaction_bigg_id,
@@ -672,9 +688,7 @@ def get_model_reaction(model_bigg_id, biggr_id, session):
         "reference": reference_db,
         "other_models_with_reaction": model_result,
         "metabolites": metabolite_db,
-        "annotation_sources": annotation_sources,
-        "annotation_properties": annotation_properties,
-        "annotation_linkouts": annotation_links,
+        **aggregator.as_template_dict(),
     }
 
 
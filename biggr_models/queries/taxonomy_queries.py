@@ -0,0 +1,191 @@
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+from cobradb.models import Model, ModelCollection, Taxon
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload
+from biggr_models.queries import utils
+from biggr_models.queries.model_queries import get_taxons_recursively
+
+
+class TaxonomyIndex:
+    """Euler tour index of the part of the taxonomy that holds models.
+
+    Every taxon gets an entry and exit number from a depth-first walk, so a
+    taxon is a descendant of another one if its entry number lies within the
+    entry-exit range of the ancestor. Only the ancestors of taxons that are
+    referenced by models or collections are indexed.
+
+    Parameters
+    ----------
+    taxons: list of (tax_id, parent_id, name, rank_id) tuples
+    """
+
+    def __init__(self, taxons: List[Tuple[int, int, str, int]]):
+        self.names: Dict[int, str] = {}
+        self.parents: Dict[int, int] = {}
+        children: Dict[int, List[int]] = {}
+        for tax_id, parent_id, name, _ in taxons:
+            self.names[tax_id] = name
+            if parent_id is not None and parent_id != tax_id:
+                self.parents[tax_id] = parent_id
+                children.setdefault(parent_id, []).append(tax_id)
+
+        self.enter: Dict[int, int] = {}
+        self.exit: Dict[int, int] = {}
+        self.depth: Dict[int, int] = {}
+        counter = 0
+        roots = [tax_id for tax_id in self.names if tax_id not in self.parents]
+        for root in roots:
+            # iterative depth-first walk, the taxonomy can be deep
+            stack: List[Tuple[int, int, bool]] = [(root, 0, False)]
+            while stack:
+                tax_id, depth, done = stack.pop()
+                if done:
+                    self.exit[tax_id] = counter - 1
+                    continue
+                self.enter[tax_id] = counter
+                self.depth[tax_id] = depth
+                counter += 1
+                stack.append((tax_id, depth, True))
+                for child in reversed(children.get(tax_id, [])):
+                    stack.append((child, depth + 1, False))
+        # entry number -> taxon, to slice the descendants of a taxon
+        self._order = sorted(self.enter, key=self.enter.__getitem__)
+        self._order_enter = [self.enter[tax_id] for tax_id in self._order]
+
+    def __contains__(self, tax_id: int) -> bool:
+        return tax_id in self.enter
+
+    def is_descendant(self, tax_id: int, ancestor_id: int) -> bool:
+        if tax_id not in self.enter or ancestor_id not in self.enter:
+            return False
+        return self.enter[ancestor_id] <= self.enter[tax_id] <= self.exit[ancestor_id]
+
+    def descendants(self, tax_id: int) -> List[int]:
+        """Return the indexed descendants of tax_id, including tax_id itself."""
+        if tax_id not in self.enter:
+            return []
+        lo = bisect_left(self._order_enter, self.enter[tax_id])
+        hi = bisect_right(self._order_enter, self.exit[tax_id])
+        return self._order[lo:hi]
+
+    def ancestors(self, tax_id: int) -> List[Tuple[int, str, int]]:
+        """Return (tax_id, name, depth) of the ancestors, starting at the root."""
+        lineage = []
+        current: Optional[int] = tax_id
+        while current is not None and current in self.names:
+            lineage.append((current, self.names[current], self.depth.get(current, 0)))
+            current = self.parents.get(current)
+        return lineage[::-1]
+
+
+@utils.cache_per_database_version()
+def get_taxonomy_index(session: Session) -> TaxonomyIndex:
+    """Build the taxonomy index, it is cached until the database version changes."""
+    tax_ids = set(
+        session.scalars(select(Model.taxon_id).filter(Model.taxon_id.isnot(None)))
+    )
+    tax_ids.update(
+        session.scalars(
+            select(ModelCollection.taxon_id).filter(
+                ModelCollection.taxon_id.isnot(None)
+            )
+        )
+    )
+    if not tax_ids:
+        return TaxonomyIndex([])
+    return TaxonomyIndex(get_taxons_recursively(session, starting_id=tax_ids))
+
+
+def _get_taxon(session: Session, taxon: str) -> Tuple[int, str]:
+    """Find a taxon by its NCBI taxonomy ID or scientific name."""
+    if taxon.isdigit():
+        sel = Taxon.id == int(taxon)
+    else:
+        sel = Taxon.name == taxon
+    # Names are not unique, prefer the taxon with the lowest ID
+    taxon_db = session.execute(
+        select(Taxon.id, Taxon.name).filter(sel).order_by(Taxon.id).limit(1)
+    ).first()
+    if taxon_db is None:
+        raise utils.NotFoundError("No Taxon found with ID or name " + taxon)
+    return taxon_db.id, taxon_db.name
+
+
+def _taxon_result(index: TaxonomyIndex, tax_id: int, name: str) -> dict:
+    return {
+        "taxon_id": tax_id,
+        "name": name,
+        "lineage": [
+            {"taxon_id": ancestor_id, "name": ancestor_name}
+            for ancestor_id, ancestor_name, _ in index.ancestors(tax_id)[:-1]
+        ],
+    }
+
+
+def get_models_under_taxon(session: Session, taxon: str) -> dict:
+    """Return all models whose taxon is the given taxon or one of its descendants.
+
+    Parameters
+    ----------
+    taxon: str
+        NCBI taxonomy ID or scientific name, e.g. "Enterobacteriaceae".
+    """
+    tax_id, name = _get_taxon(session, taxon)
+    index = get_taxonomy_index(session)
+    result = _taxon_result(index, tax_id, name)
+    descendants = index.descendants(tax_id)
+    if not descendants:
+        result["models"] = []
+        return result
+
+    models_db = session.scalars(
+        select(Model)
+        .options(joinedload(Model.collection))
+        .filter(Model.taxon_id.in_(descendants))
+        .order_by(Model.bigg_id)
+    ).all()
+    result["models"] = [
+        {
+            "bigg_id": model.bigg_id,
+            "organism": model.organism,
+            "taxon_id": model.taxon_id,
+            "collection_bigg_id": (
+                model.collection.bigg_id if model.collection else None
+            ),
+        }
+        for model in models_db
+    ]
+    return result
+
+
+def get_collections_under_taxon(session: Session, taxon: str) -> dict:
+    """Return all collections anchored at the given taxon or one of its descendants.
+
+    Parameters
+    ----------
+    taxon: str
+        NCBI taxonomy ID or scientific name, e.g. "Enterobacteriaceae".
+    """
+    tax_id, name = _get_taxon(session, taxon)
+    index = get_taxonomy_index(session)
+    result = _taxon_result(index, tax_id, name)
+    descendants = index.descendants(tax_id)
+    if not descendants:
+        result["collections"] = []
+        return result
+
+    collections_db = session.execute(
+        select(
+            ModelCollection.bigg_id,
+            ModelCollection.oneliner,
+            ModelCollection.taxon_id,
+        )
+        .filter(ModelCollection.taxon_id.in_(descendants))
+        .order_by(ModelCollection.bigg_id)
+    ).all()
+    result["collections"] = [
+        {"bigg_id": bigg_id, "oneliner": oneliner, "taxon_id": taxon_id}
+        for bigg_id, oneliner, taxon_id in collections_db
+    ]
+    return result
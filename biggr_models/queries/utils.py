@@ -1,6 +1,13 @@
-from functools import reduce
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from functools import reduce, wraps
 import operator
-from typing import Dict, List, NewType, Optional, Type, Union
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, NewType, Optional, Type, Union
 
 from sqlalchemy.orm import Session
 from biggr_models.version import __version__ as version, __api_version__ as api_version
@@ -9,6 +16,7 @@ import biggr_models.handlers.utils as handler_utils
 from cobradb.models import (
     Base,
     DatabaseVersion,
+    Session as SessionFactory,
     Gene,
     Model,
     ModelGene,
@@ -33,6 +41,27 @@ class RedirectError(Exception):
     pass
 
 
+def get_list_base_query(
+    column_specs: List["handler_utils.DataColumnSpec"], label: bool = False
+):
+    """Select the columns of a data table, outer joining all required relationships.
+
+    If label is True, the columns are labeled with their identifiers.
+    """
+    joins = {}
+    for y in column_specs:
+        for x in y.requires:
+            if (x_str := str(x)) not in joins:
+                joins[x_str] = x
+    columns = [x.agg_func(x.prop) for x in column_specs]
+    if label:
+        columns = [col.label(x.identifier) for x, col in zip(column_specs, columns)]
+    query = select(*columns)
+    for x in joins.values():
+        query = query.join(x, isouter=True)
+    return query
+
+
 def get_list(
     session: Session,
     column_specs: List["handler_utils.DataColumnSpec"],
@@ -43,14 +72,7 @@ def get_list(
     pre_filter=None,
     post_filter=None,
 ):
-    joins = {}
-    for y in column_specs:
-        for x in y.requires:
-            if (x_str := str(x)) not in joins:
-                joins[x_str] = x
-    query = select(*(x.agg_func(x.prop) for x in column_specs))
-    for x in joins.values():
-        query = query.join(x, isouter=True)
+    query = get_list_base_query(column_specs)
     if pre_filter is not None:
         query = pre_filter(query)
     count_query = query
@@ -344,6 +366,188 @@ def database_version(session):
     }
 
 
+# Seconds between checks of the database version by cache_per_database_version.
+DATABASE_VERSION_CHECK_INTERVAL = 30.0
+
+_database_version_key: Optional[str] = None
+_database_version_checked: float = 0.0
+_database_version_lock = threading.Lock()
+
+
+def get_database_version_key(session) -> str:
+    """Return a string that identifies the currently loaded database.
+
+    The database is only queried when the previous check is older than
+    DATABASE_VERSION_CHECK_INTERVAL seconds, so this is cheap to call on every
+    request.
+    """
+    global _database_version_key, _database_version_checked
+    now = time.monotonic()
+    with _database_version_lock:
+        if (
+            _database_version_key is not None
+            and now - _database_version_checked < DATABASE_VERSION_CHECK_INTERVAL
+        ):
+            return _database_version_key
+
+    date_time = session.scalars(select(DatabaseVersion.date_time).limit(1)).first()
+    key = f"{version}-{date_time.isoformat() if date_time is not None else 'none'}"
+    with _database_version_lock:
+        _database_version_key = key
+        _database_version_checked = now
+    return key
+
+
+_UNSAFE_PATH_CHARACTERS = re.compile(r"[^\w.-]")
+
+
+def safe_path_component(name: str) -> str:
+    """Turn a database version or BiGG ID into a file or directory name."""
+    name = _UNSAFE_PATH_CHARACTERS.sub("_", name)
+    if name in (".", ".."):
+        return name.replace(".", "_")
+    return name
+
+
+def write_file_atomic(path: str, body: bytes):
+    """Write body to path, creating its directory, and replace the file at once.
+
+    Other processes may read the file concurrently, so the body is written to
+    a temporary file first. Raises OSError if the file cannot be written.
+    """
+    os.makedirs(dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+
+
+# Hit and miss counts of all per-version caches, by qualified function name
+_cache_stats: Dict[str, Dict[str, int]] = {}
+
+
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    return _cache_stats
+
+
+def cache_per_database_version(maxsize: Optional[int] = None):
+    """Decorator that caches query results until the database version changes.
+
+    The decorated function must take the session as its first argument, all
+    other arguments are used as cache key and must be hashable. Cached results
+    are shared between requests, so they must not be modified by the caller.
+
+    Parameters
+    ----------
+    maxsize: int, optional
+        Maximum number of cached results, the least recently used result is
+        dropped first. The cache is unbounded if None.
+    """
+
+    def decorator(func):
+        cache: OrderedDict = OrderedDict()
+        stats = {"hits": 0, "misses": 0}
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(session, *args, **kwargs):
+            db_version = get_database_version_key(session)
+            key = (args, tuple(sorted(kwargs.items())))
+            with lock:
+                entry = cache.get(key)
+                if entry is not None and entry[0] == db_version:
+                    cache.move_to_end(key)
+                    stats["hits"] += 1
+                    return entry[1]
+                stats["misses"] += 1
+
+            result = func(session, *args, **kwargs)
+
+            with lock:
+                for old_key in [k for k, v in cache.items() if v[0] != db_version]:
+                    del cache[old_key]
+                cache[key] = (db_version, result)
+                if maxsize is not None:
+                    while len(cache) > maxsize:
+                        cache.popitem(last=False)
+            return result
+
+        def cache_clear():
+            with lock:
+                cache.clear()
+
+        wrapper.cache_clear = cache_clear
+        wrapper.cache_stats = stats
+        _cache_stats[f"{func.__module__}.{func.__qualname__}"] = stats
+        return wrapper
+
+    return decorator
+
+
+# Number of threads used by run_concurrently, each holds at most one pooled
+# connection at a time. Set to 1 to run all sub-queries on the caller's session.
+QUERY_FANOUT_WORKERS = 4
+
+_query_executor: Optional[ThreadPoolExecutor] = None
+_query_executor_lock = threading.Lock()
+
+
+def _get_query_executor() -> ThreadPoolExecutor:
+    global _query_executor
+    with _query_executor_lock:
+        if _query_executor is None:
+            _query_executor = ThreadPoolExecutor(
+                max_workers=QUERY_FANOUT_WORKERS, thread_name_prefix="biggr-query"
+            )
+        return _query_executor
+
+
+def _run_in_own_session(bind, task: Callable[[Session], Any]):
+    session = SessionFactory(bind=bind)
+    try:
+        return task(session)
+    finally:
+        session.close()
+
+
+def run_concurrently(
+    session: Session, tasks: Dict[str, Callable[[Session], Any]]
+) -> Dict[str, Any]:
+    """Run independent sub-queries concurrently and collect their results.
+
+    Every task is called with its own session on the engine of the caller's
+    session, and therefore its own pooled connection, in a worker thread.
+    Returned ORM objects are detached when that session closes, so tasks must
+    eagerly load everything the caller uses.
+
+    Parameters
+    ----------
+    session: Session
+        The caller's session, used to run the tasks sequentially when there is
+        at most one task or QUERY_FANOUT_WORKERS is below 2.
+    tasks: dict
+        Mapping of result name to a callable taking a session.
+
+    Returns
+    -------
+    dict
+        Mapping of result name to the return value of its task. The first
+        exception raised by a task is re-raised.
+    """
+    if len(tasks) < 2 or QUERY_FANOUT_WORKERS < 2:
+        return {name: task(session) for name, task in tasks.items()}
+
+    executor = _get_query_executor()
+    bind = session.get_bind()
+    futures = {
+        name: executor.submit(
+            contextvars.copy_context().run, _run_in_own_session, bind, task
+        )
+        for name, task in tasks.items()
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+
 def convert_id_to_query_filter(bigg_id: IDType, obj_cls: Type[Base]):
     if isinstance(bigg_id, int):
         return obj_cls.id == bigg_id
@@ -61,6 +61,11 @@ def get_routes():
             reaction_handlers.UniversalReactionListViewHandler,
             name="reactions",
         ),
+        url(
+            api_regex + r"/universal/reaction_in_models/(?P<bigg_id>[^/]+)/?$",
+            reaction_handlers.ReactionInModelsListViewHandler,
+            name="reaction_in_models",
+        ),
         #
         (
             r"/(?:api/%s/)?(?:models/)?universal/reactions/([^/]+)/?$" % api_v,
@@ -118,8 +123,16 @@ def get_routes():
             r"/(?:api/%s/)?genomes/([^/]+)/?$" % api_v,
             genome_handlers.GenomeHandler,
         ),
+        (
+            r"/api/%s/taxons/([^/]+)/models/?$" % api_v,
+            model_handlers.TaxonModelsHandler,
+        ),
+        (
+            r"/api/%s/taxons/([^/]+)/collections/?$" % api_v,
+            model_handlers.TaxonCollectionsHandler,
+        ),
         url(
-            r"/collections/?$",
+            r"/(?:api/%s/)?collections/?$" % api_v,
             model_handlers.ModelCollectionsTreeViewHandler,
         ),
         url(
@@ -137,6 +150,19 @@ def get_routes():
         ),
         #
         (r"/(?:api/%s/)?models/([^/]+)/?$" % api_v, model_handlers.ModelHandler),
+        (
+            r"/api/%s/models/([^/]+)/escher_modules/?$" % api_v,
+            model_handlers.EscherModulesForModelHandler,
+        ),
+        (
+            r"/api/%s/models/([^/]+)/memote_flags/?$" % api_v,
+            model_handlers.MemoteFlagsForModelHandler,
+        ),
+        (
+            r"/api/%s/models/([^/]+)/files/?$" % api_v,
+            model_handlers.ModelFilesHandler,
+        ),
+        (r"/api/%s/model_files/?$" % api_v, model_handlers.ModelFileListingHandler),
         #
         (
             r"/(?:api/%s/)?models/([^/]+)/download/?$" % api_v,
@@ -299,6 +325,7 @@ def get_routes():
             db_interop_handlers.QueryByStrainHandler,
         ),
         (r"/interop-query/query-by-pair/?$", db_interop_handlers.QueryByPairHandler),
+        (r"/interop-query/sequences/?$", db_interop_handlers.SequenceHandler),
         (r"/interop-query/strains/?$", db_interop_handlers.StrainListHandler),
         (r"/interop-query/genes/?$", db_interop_handlers.GeneListHandler),
     ]
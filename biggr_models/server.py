@@ -1,13 +1,23 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from functools import partial
 from itertools import chain
-from biggr_models import routes
+from biggr_models import (
+    build_listings,
+    instrumentation,
+    monitoring,
+    routes,
+    slow_queries,
+)
+from biggr_models.handlers import utils as handler_utils
+from biggr_models.queries import escher_queries, listing_queries, model_file_queries
 
 import asyncio
 
 from tornado import autoreload
 from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop, PeriodicCallback
 from tornado.options import define, options, parse_command_line
 from tornado.web import Application
 
@@ -16,10 +26,55 @@ define("port", default=8888, help="run on given port", type=int)
 define("public", default=True, help="run on all addresses")
 define("debug", default=False, help="Start server in debug mode")
 define("process_i", default=0, help="The index of the process", type=int)
+define(
+    "metrics",
+    default=False,
+    help="Serve Prometheus metrics at /metrics. The endpoint has no access "
+    "control, only enable it behind a proxy that keeps it internal",
+    type=bool,
+)
+define(
+    "metrics_dir",
+    default=None,
+    help="Directory in which the server processes share their metrics, by "
+    "default a directory per port in the temp directory",
+)
+define(
+    "slow_query_ms",
+    default=0,
+    help="Log queries slower than this (ms) with their query plan, 0 to disable. "
+    "On PostgreSQL the plan is captured with EXPLAIN ANALYZE, which runs the slow "
+    "query again on a connection of the server's pool",
+    type=int,
+)
+define(
+    "slow_query_log",
+    default=slow_queries.SLOW_QUERY_LOG,
+    help="File of the slow query log",
+)
+define(
+    "escher_cache_dir",
+    default=escher_queries.ESCHER_MAP_CACHE_DIR,
+    help="Directory in which the built Escher maps are stored",
+)
+define(
+    "model_checksum_file",
+    default=model_file_queries.MODEL_FILE_CHECKSUM_FILE,
+    help="File in which the server processes share the model file checksums",
+)
+define(
+    "server_timing",
+    default=False,
+    help="Send Server-Timing headers and log query counts and timings per request",
+    type=bool,
+)
 
 
 def get_application(debug=False):
     app_routes = routes.get_routes()
+    if options.metrics:
+        app_routes.append((r"/metrics", monitoring.MetricsHandler))
+        return monitoring.InstrumentedApplication(app_routes, debug=debug)
     return Application(app_routes, debug=debug)
 
 
@@ -47,15 +102,58 @@ def start_production_server():
     asyncio.run(run_server())
 
 
+async def refresh_model_file_index():
+    index = model_file_queries.get_model_file_index(handler_utils.static_model_dir)
+    # only the first process reads the files, the others take its checksums
+    count = await IOLoop.current().run_in_executor(
+        None,
+        partial(
+            index.scan,
+            checksums=options.process_i == 0,
+            checksum_file=options.model_checksum_file,
+        ),
+    )
+    print("Indexed %d model files" % count)
+
+
+async def refresh_listings():
+    try:
+        await IOLoop.current().run_in_executor(None, build_listings.build_listings)
+    except Exception as e:
+        print(f"Could not build the listing tables: {e!r}")
+
+
 async def run_server():
     server = HTTPServer(get_application(debug=options.debug))
     server.listen(options.port, reuse_port=True)
+    if options.metrics:
+        monitoring.start(
+            process=options.process_i,
+            directory=options.metrics_dir,
+            port=options.port,
+        )
+    # the index is filled in the background, requests stat the files until then
+    IOLoop.current().spawn_callback(refresh_model_file_index)
+    PeriodicCallback(
+        refresh_model_file_index, model_file_queries.MODEL_FILE_SCAN_INTERVAL * 1000
+    ).start()
+    if options.process_i == 0:
+        # only the first process rebuilds listings after a database update
+        IOLoop.current().spawn_callback(refresh_listings)
+        PeriodicCallback(
+            refresh_listings, listing_queries.LISTING_REFRESH_INTERVAL * 1000
+        ).start()
     await asyncio.Event().wait()
 
 
 def run():
     """Run the server"""
     parse_command_line()
+    escher_queries.ESCHER_MAP_CACHE_DIR = options.escher_cache_dir
+    if options.server_timing:
+        instrumentation.install()
+    if options.slow_query_ms > 0:
+        slow_queries.install(options.slow_query_ms, options.slow_query_log)
 
     if options.debug:
         start_debug_server()
@@ -0,0 +1,149 @@
+"""Slow query log with captured query plans.
+
+When enabled (``--slow_query_ms``), every SELECT statement that takes longer
+than the threshold is recorded with its bind parameters. A background thread
+runs ``EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`` for it on PostgreSQL (a plain
+``EXPLAIN`` on other databases), and appends the record as one JSON line to
+``--slow_query_log``. See ``python -m biggr_models.slow_query_report`` for the
+analysis of the log.
+"""
+
+import json
+import queue
+import re
+import tempfile
+import threading
+import time
+from os.path import join
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_LOG = join(tempfile.gettempdir(), "biggr_slow_queries.jsonl")
+# Plans of the same statement shape are captured at most once per interval
+EXPLAIN_INTERVAL = 600.0
+# Slow queries waiting for EXPLAIN, further ones are dropped
+QUEUE_SIZE = 100
+
+_threshold: Optional[float] = None
+_log_path = SLOW_QUERY_LOG
+_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=QUEUE_SIZE)
+_last_explained: Dict[str, float] = {}
+# Set in the worker thread, its EXPLAIN statements are not recorded
+_local = threading.local()
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\?|:\w+|\$\d+")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """Reduce a statement to its shape, replacing literals and parameters by ?."""
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _PLACEHOLDER.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?, ...)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("slow_query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("slow_query_start_time")
+    if not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+    if (
+        duration < _threshold
+        or executemany
+        or getattr(_local, "explaining", False)
+        or statement.split(None, 1)[0].upper() not in ("SELECT", "WITH")
+    ):
+        return
+    try:
+        _queue.put_nowait(
+            {
+                "time": time.time(),
+                "duration_ms": round(duration * 1000, 1),
+                "statement": statement,
+                "parameters": parameters,
+                "engine": conn.engine,
+            }
+        )
+    except queue.Full:
+        pass
+
+
+def explain(engine, statement: str, parameters) -> Any:
+    """Return the query plan of statement, it is executed again on PostgreSQL."""
+    if engine.dialect.name == "postgresql":
+        prefix = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+    else:
+        prefix = "EXPLAIN "
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            rows = connection.exec_driver_sql(prefix + statement, parameters).all()
+        finally:
+            # EXPLAIN ANALYZE runs the statement, never keep any of its effects
+            transaction.rollback()
+    if engine.dialect.name == "postgresql":
+        plan = rows[0][0]
+        return json.loads(plan) if isinstance(plan, str) else plan
+    return [list(map(str, row)) for row in rows]
+
+
+def _record(entry: Dict[str, Any]):
+    engine = entry.pop("engine")
+    shape = normalize_statement(entry["statement"])
+    entry["shape"] = shape
+    now = time.monotonic()
+    if now - _last_explained.get(shape, -EXPLAIN_INTERVAL) >= EXPLAIN_INTERVAL:
+        _last_explained[shape] = now
+        _local.explaining = True
+        try:
+            entry["plan"] = explain(engine, entry["statement"], entry["parameters"])
+        except Exception as e:
+            entry["explain_error"] = repr(e)
+        finally:
+            _local.explaining = False
+    with open(_log_path, "a") as f:
+        f.write(json.dumps(entry, default=str) + "\n")
+
+
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute, drop their start time
+    if context.connection is None:
+        return
+    start_times = context.connection.info.get("slow_query_start_time")
+    if start_times:
+        start_times.pop()
+
+
+def _worker():
+    while True:
+        entry = _queue.get()
+        try:
+            _record(entry)
+        except Exception as e:
+            print(f"Could not record slow query: {e!r}")
+
+
+def install(threshold_ms: float, log_path: Optional[str] = None):
+    """Record SELECT statements that take longer than threshold_ms."""
+    global _threshold, _log_path
+    if _threshold is not None:
+        return
+    _threshold = threshold_ms / 1000.0
+    if log_path:
+        _log_path = log_path
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    threading.Thread(target=_worker, name="slow-query-explain", daemon=True).start()
+    print(f"Logging queries slower than {threshold_ms} ms to {_log_path}")
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Summarize the slow query log and suggest missing indexes.
+
+The log written by the server with ``--slow_query_ms`` is grouped by statement
+shape, e.g. ``python -m biggr_models.slow_query_report --top 10``. Index
+suggestions are derived from the captured PostgreSQL plans: sequential scans
+that remove many rows by a filter, and large sorts.
+"""
+
+import argparse
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from biggr_models.slow_queries import SLOW_QUERY_LOG
+
+# Scans that remove fewer rows than this by their filter are not worth an index
+MIN_ROWS_REMOVED = 1000
+# Sorts of fewer rows than this are not worth an index
+MIN_SORT_ROWS = 10000
+
+_CONTAINS_FILTER = re.compile(r"lower\(\(?(\w+)\)?(?:::[\w ]+)?\) ~~")
+_NULL_FILTER = re.compile(r"\(?(\w+) IS (NOT )?NULL")
+_EQUALS_FILTER = re.compile(r"\(?(\w+) = ")
+_SORT_KEY = re.compile(r"^(?:\w+\.)?(\w+)(?: DESC)?$")
+
+
+@dataclass
+class StatementStats:
+    shape: str
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    example: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+
+def read_log(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def aggregate(entries: Iterable[Dict[str, Any]]) -> List[StatementStats]:
+    """Group the slow queries by statement shape, slowest total first."""
+    stats: Dict[str, StatementStats] = {}
+    for entry in entries:
+        shape = entry.get("shape") or entry["statement"]
+        s = stats.setdefault(shape, StatementStats(shape))
+        s.count += 1
+        s.total_ms += entry["duration_ms"]
+        if entry["duration_ms"] >= s.max_ms:
+            s.max_ms = entry["duration_ms"]
+        # keep the slowest entry that has a plan as example
+        if "plan" in entry and (
+            "plan" not in s.example or entry["duration_ms"] >= s.example["duration_ms"]
+        ):
+            s.example = entry
+        elif not s.example:
+            s.example = entry
+    return sorted(stats.values(), key=lambda s: s.total_ms, reverse=True)
+
+
+def _plan_nodes(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def _scan_relation(node: Dict[str, Any]) -> str:
+    for n in _plan_nodes(node):
+        if "Relation Name" in n:
+            return n["Relation Name"]
+    return "?"
+
+
+def suggest_indexes(plan: Any) -> List[Tuple[str, str]]:
+    """Return (index statement, reason) suggestions for a PostgreSQL JSON plan."""
+    if not isinstance(plan, list) or not plan or "Plan" not in plan[0]:
+        return []
+    suggestions = []
+    for node in _plan_nodes(plan[0]["Plan"]):
+        node_type = node.get("Node Type")
+        if node_type == "Seq Scan" and "Filter" in node:
+            removed = node.get("Rows Removed by Filter", 0)
+            if removed < MIN_ROWS_REMOVED:
+                continue
+            table = node["Relation Name"]
+            condition = node["Filter"]
+            reason = f"Seq Scan on {table} removes {removed} rows by {condition}"
+            for col in _CONTAINS_FILTER.findall(condition):
+                statement = (
+                    f"CREATE INDEX ON {table} USING gin (lower({col}) gin_trgm_ops);"
+                )
+                suggestions.append(
+                    (statement, reason + " (requires CREATE EXTENSION pg_trgm)")
+                )
+            for col, negated in _NULL_FILTER.findall(condition):
+                predicate = f"{col} IS {negated}NULL"
+                suggestions.append(
+                    (f"CREATE INDEX ON {table} ({col}) WHERE {predicate};", reason)
+                )
+            for col in _EQUALS_FILTER.findall(condition):
+                suggestions.append((f"CREATE INDEX ON {table} ({col});", reason))
+        elif node_type == "Sort" and node.get("Actual Rows", 0) >= MIN_SORT_ROWS:
+            keys = [_SORT_KEY.match(key) for key in node.get("Sort Key", [])]
+            if not keys or not all(keys):
+                continue
+            table = _scan_relation(node)
+            columns = ", ".join(key.group(1) for key in keys)
+            suggestions.append(
+                (
+                    f"CREATE INDEX ON {table} ({columns});",
+                    f"Sort of {node['Actual Rows']} rows on {table} by {columns}",
+                )
+            )
+    return suggestions
+
+
+def report(path: str, top: int = 20):
+    entries = list(read_log(path))
+    if not entries:
+        print(f"No slow queries in {path}")
+        return
+    stats = aggregate(entries)
+    print(f"{len(entries)} slow queries, {len(stats)} statement shapes\n")
+
+    index_counts: Counter = Counter()
+    index_reasons: Dict[str, List[str]] = defaultdict(list)
+    for i, s in enumerate(stats[:top], start=1):
+        print(
+            f"#{i}: {s.count} times, total {s.total_ms:.0f} ms, "
+            f"mean {s.mean_ms:.0f} ms, max {s.max_ms:.0f} ms"
+        )
+        print(f"  {s.shape}")
+        if "parameters" in s.example:
+            print(f"  example parameters: {s.example['parameters']}")
+        if "explain_error" in s.example:
+            print(f"  EXPLAIN failed: {s.example['explain_error']}")
+        for statement, reason in suggest_indexes(s.example.get("plan")):
+            index_counts[statement] += s.count
+            if reason not in index_reasons[statement]:
+                index_reasons[statement].append(reason)
+        print()
+
+    if not index_counts:
+        print("No index suggestions")
+        return
+    print("Suggested indexes, by number of slow queries that would use them:")
+    for statement, count in index_counts.most_common():
+        print(f"{count:6d}  {statement}")
+        for reason in index_reasons[statement][:3]:
+            print(f"        {reason}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--log", default=SLOW_QUERY_LOG, help="Slow query log written by the server."
+    )
+    parser.add_argument(
+        "--top", type=int, default=20, help="Number of statement shapes to show."
+    )
+    args = parser.parse_args()
+    report(args.log, top=args.top)
+
+
+if __name__ == "__main__":
+    run()
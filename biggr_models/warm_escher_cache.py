@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Prebuild the Escher maps of all models into the on-disk map cache.
+
+Run this after loading a new database version, before or while starting the
+server, e.g. ``python -m biggr_models.warm_escher_cache --processes 8``.
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import os
+import shutil
+import time
+from typing import Optional, Tuple
+
+from cobradb.models import Session
+
+from biggr_models.queries import escher_queries, utils as query_utils
+
+
+def warm_escher_map(model_bigg_id: str, map_bigg_id: str) -> Tuple[str, str, float]:
+    start = time.perf_counter()
+    session = Session()
+    try:
+        escher_queries.load_or_build_escher_map(session, model_bigg_id, map_bigg_id)
+    finally:
+        session.close()
+    return model_bigg_id, map_bigg_id, time.perf_counter() - start
+
+
+def _set_escher_map_cache_dir(cache_dir: str):
+    escher_queries.ESCHER_MAP_CACHE_DIR = cache_dir
+
+
+def prune_escher_map_cache(db_version: str):
+    """Remove cached maps of other database versions."""
+    if not os.path.isdir(escher_queries.ESCHER_MAP_CACHE_DIR):
+        return
+    keep = escher_queries.get_escher_map_cache_version_dir(db_version)
+    for name in os.listdir(escher_queries.ESCHER_MAP_CACHE_DIR):
+        path = os.path.join(escher_queries.ESCHER_MAP_CACHE_DIR, name)
+        if path != keep and os.path.isdir(path):
+            print(f"Removing {path}")
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def warm_escher_map_cache(
+    processes: Optional[int] = None, model_bigg_id: Optional[str] = None
+) -> int:
+    """Build all missing maps in a pool of processes, returns the number of failures."""
+    session = Session()
+    try:
+        db_version = query_utils.get_database_version_key(session)
+        map_ids = escher_queries.get_all_escher_map_ids(session)
+    finally:
+        session.close()
+    if model_bigg_id is not None:
+        map_ids = [x for x in map_ids if x[0] == model_bigg_id]
+    map_ids = [
+        x
+        for x in map_ids
+        if not os.path.exists(escher_queries.get_escher_map_cache_path(db_version, *x))
+    ]
+    print(f"Building {len(map_ids)} Escher maps for database version {db_version}")
+
+    failures = 0
+    # Spawn fresh processes, forked ones would share the database connections
+    mp_context = multiprocessing.get_context("spawn")
+    # Spawned processes do not inherit a cache directory that was set at runtime
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=mp_context,
+        initializer=_set_escher_map_cache_dir,
+        initargs=(escher_queries.ESCHER_MAP_CACHE_DIR,),
+    ) as pool:
+        futures = {pool.submit(warm_escher_map, *x): x for x in map_ids}
+        for i, future in enumerate(as_completed(futures), start=1):
+            model_id, map_id = futures[future]
+            try:
+                _, _, duration = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"[{i}/{len(map_ids)}] {model_id}/{map_id} failed: {e!r}")
+            else:
+                print(f"[{i}/{len(map_ids)}] {model_id}/{map_id} ({duration:.1f}s)")
+    return failures
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="Number of worker processes, defaults to the number of CPUs.",
+    )
+    parser.add_argument("--model", default=None, help="Only build maps of this model.")
+    parser.add_argument(
+        "--cache-dir",
+        default=escher_queries.ESCHER_MAP_CACHE_DIR,
+        help="Directory of the Escher map cache, the same as --escher_cache_dir "
+        "of the server.",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Remove cached maps of other database versions.",
+    )
+    args = parser.parse_args()
+    escher_queries.ESCHER_MAP_CACHE_DIR = args.cache_dir
+
+    if args.prune:
+        session = Session()
+        try:
+            prune_escher_map_cache(query_utils.get_database_version_key(session))
+        finally:
+            session.close()
+    failures = warm_escher_map_cache(processes=args.processes, model_bigg_id=args.model)
+    if failures:
+        raise SystemExit(f"{failures} Escher maps could not be built.")
+
+
+if __name__ == "__main__":
+    run()
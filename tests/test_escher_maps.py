@@ -0,0 +1,55 @@
+"""Build every Escher module from the projections of a synthetic dataset.
+
+The builders only get ``EscherProjection`` objects instead of ORM objects, so
+every module is built once to check that the projection has all attributes
+they use.
+"""
+
+import json
+
+from cobradb.api.escher import ESCHER_MODULE_DEFINITIONS
+import pytest
+from sqlalchemy.orm import Session
+
+from biggr_models.benchmarks.dataset import DatasetSize, create_database
+from biggr_models.queries import escher_queries
+
+SIZE = DatasetSize(
+    models=1,
+    metabolites=40,
+    reactions=60,
+    genes=10,
+    model_reaction_fraction=1.0,
+    escher_modules=len(ESCHER_MODULE_DEFINITIONS),
+    map_reactions=60,
+)
+
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory):
+    url = f"sqlite:///{tmp_path_factory.mktemp('escher_maps') / 'test.db'}"
+    engine, dataset = create_database(url, SIZE)
+    yield engine, dataset
+    engine.dispose()
+
+
+@pytest.mark.parametrize("map_bigg_id", sorted(ESCHER_MODULE_DEFINITIONS))
+def test_build_escher_module(database, map_bigg_id, tmp_path, monkeypatch):
+    engine, dataset = database
+    monkeypatch.setattr(escher_queries, "ESCHER_MAP_CACHE_DIR", str(tmp_path))
+    model_bigg_id = dataset.model_bigg_ids[0]
+    assert (model_bigg_id, map_bigg_id) in dataset.escher_maps
+    with Session(engine) as session:
+        model_reactions = escher_queries.get_model_reactions_for_escher_map(
+            session, model_bigg_id, map_bigg_id
+        )
+        assert len(model_reactions) == SIZE.map_reactions
+        assert all(
+            isinstance(r, escher_queries.EscherProjection) for r in model_reactions
+        )
+        escher_map = escher_queries.load_or_build_escher_map(
+            session, model_bigg_id, map_bigg_id
+        )
+    # an Escher map is a [header, content] pair
+    _, content = json.loads(escher_map.body)
+    assert "reactions" in content
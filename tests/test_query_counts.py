@@ -0,0 +1,80 @@
+"""Number of SQL statements issued by the metabolite pages.
+
+The metabolite queries load references, components and their annotations in
+bulk, so the number of statements must not depend on how many references or
+components a metabolite has. The statements are counted on a small synthetic
+SQLite database, see ``biggr_models.benchmarks.dataset``.
+"""
+
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from biggr_models.benchmarks.dataset import DatasetSize, add_metabolite, create_database
+from biggr_models.queries import metabolite_queries
+
+SIZE = DatasetSize(models=1, metabolites=8, reactions=6, genes=4, escher_modules=0)
+
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory):
+    url = f"sqlite:///{tmp_path_factory.mktemp('query_counts') / 'test.db'}"
+    engine, dataset = create_database(url, SIZE)
+    with Session(engine) as session:
+        model_id = dataset.model_ids[0]
+        add_metabolite(session, model_id, "small", components=1, references=1)
+        add_metabolite(session, model_id, "large", components=3, references=4)
+        session.commit()
+    yield engine, dataset
+    engine.dispose()
+
+
+@contextmanager
+def count_statements(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _statements_per_metabolite(engine, query, bigg_ids):
+    counts = {}
+    with Session(engine) as session:
+        # the first call loads the per-version cache keys
+        query(session, bigg_ids[0])
+        for bigg_id in bigg_ids:
+            with count_statements(engine) as statements:
+                query(session, bigg_id)
+            counts[bigg_id] = len(statements)
+    return counts
+
+
+def test_get_metabolite_statements(database):
+    engine, _ = database
+    counts = _statements_per_metabolite(
+        engine,
+        lambda session, bigg_id: metabolite_queries.get_metabolite(bigg_id, session),
+        ["small", "large"],
+    )
+    assert counts["small"] == counts["large"], counts
+
+
+def test_get_model_comp_metabolite_statements(database):
+    engine, dataset = database
+    model_bigg_id = dataset.model_bigg_ids[0]
+    counts = _statements_per_metabolite(
+        engine,
+        lambda session, bigg_id: metabolite_queries.get_model_comp_metabolite(
+            f"{bigg_id}_0_c", model_bigg_id, session
+        ),
+        ["small", "large"],
+    )
+    assert counts["small"] == counts["large"], counts